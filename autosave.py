@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import queue
+from PySide6.QtCore import QCoreApplication, QObject, QThread, QTimer, QStandardPaths, Signal
+from PySide6.QtGui import QTextCursor
+from text_files import atomic_write
+
+AUTOSAVE_INTERVAL_MS = 5000
+# Records appended before the journal is rewritten as a single record
+MAX_JOURNAL_RECORDS = 200
+
+
+def journal_path(path):
+    directory = os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppLocalDataLocation), 'journal')
+    key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(directory, key + '.journal')
+
+
+def read_journal(path, sha1):
+    # Returns the records of the journal for path if it was written against
+    # the file contents hashing to sha1, otherwise None. A torn last line
+    # from a crash mid-write is ignored.
+    try:
+        with open(journal_path(path), encoding='utf-8') as file:
+            lines = file.read().split('\n')
+    except OSError:
+        return None
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return None
+    if header.get('sha1') != sha1:
+        return None
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records or None
+
+
+def replay(lines, records):
+    for record in records:
+        first = record['first']
+        lines[first:first + record['old_count']] = record['lines']
+    return lines
+
+
+class DirtyRange:
+    # Blocks changed since a checkpoint, kept as the first changed block and
+    # the number of unchanged blocks at the end of the document. Both stay
+    # valid while edits elsewhere shift block numbers.
+
+    def __init__(self, block_count):
+        self.base_count = block_count
+        self.first = None
+        self.tail = None
+
+    def mark(self, first, tail):
+        if self.first is None:
+            self.first, self.tail = first, tail
+        else:
+            self.first = min(self.first, first)
+            self.tail = min(self.tail, tail)
+
+    def copy(self):
+        other = DirtyRange(self.base_count)
+        other.first, other.tail = self.first, self.tail
+        return other
+
+
+class JournalWriter(QThread):
+    # Appends journal records in order and fsyncs them off the GUI thread
+    failed = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.tasks = queue.Queue()
+
+    def submit(self, action, path, text=''):
+        self.tasks.put((action, path, text))
+
+    def stop(self):
+        self.tasks.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            action, path, text = task
+            try:
+                if action == 'remove':
+                    if os.path.exists(path):
+                        os.unlink(path)
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if action == 'rewrite':
+                    atomic_write(path, text)
+                else:
+                    with open(path, 'a', encoding='utf-8') as file:
+                        file.write(text)
+                        file.flush()
+                        os.fsync(file.fileno())
+            except OSError as e:
+                self.failed.emit(str(e))
+
+
+class AutosaveJournal(QObject):
+    # Periodically appends the blocks changed since the last write to a
+    # journal next to the application data. Each record replaces a range of
+    # lines, so replaying the journal over the saved file restores the
+    # unsaved edits. Saving the file starts a new journal.
+
+    def __init__(self, editor, writer=None):
+        super().__init__(editor)
+        self.editor = editor
+        self.path = None
+        self.header = None
+        self.records = 0
+        self.since_write = None
+        self.since_base = None
+        self.since_snapshot = None
+
+        # Journals of several documents can share one writer, owned by the caller
+        self.owns_writer = writer is None
+        self.writer = JournalWriter() if writer is None else writer
+        self.failed = self.writer.failed
+        if self.owns_writer:
+            self.writer.start(QThread.LowPriority)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(AUTOSAVE_INTERVAL_MS)
+        self.timer.timeout.connect(self.flush)
+
+        editor.document().contentsChange.connect(self.handle_contents_change)
+        if self.owns_writer:
+            QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def attach(self, path, sha1, encoding):
+        # Starts a fresh journal for path, whose contents on disk hash to sha1
+        self.detach()
+        self.path = journal_path(path)
+        self.header = {'path': os.path.abspath(path), 'sha1': sha1, 'encoding': encoding}
+        self.records = 0
+        block_count = self.editor.document().blockCount()
+        self.since_write = DirtyRange(block_count)
+        self.since_base = DirtyRange(block_count)
+        self.since_snapshot = None
+        self.writer.submit('remove', self.path)
+        self.timer.start()
+
+    def rebase(self, path, sha1, encoding, line_count):
+        # The file changed on disk to line_count lines hashing to sha1 while
+        # the document kept its own edits; the first record of the new
+        # journal replaces the whole file with the document
+        self.attach(path, sha1, encoding)
+        self.since_base = DirtyRange(line_count)
+        self.since_base.mark(0, 0)
+        self.since_write = self.since_base.copy()
+
+    def detach(self):
+        # Stops journalling; the journal is kept for recovery
+        if self.path is not None:
+            self.flush()
+        self.path = None
+        self.since_write = self.since_base = None
+        self.timer.stop()
+
+    def shutdown(self):
+        self.detach()
+        if self.owns_writer:
+            self.writer.stop()
+
+    def suspend(self):
+        # Stops journalling and returns what resume() needs to carry on with
+        # another editor holding the same text
+        state = None
+        if self.path is not None:
+            self.flush()
+            state = (self.path, self.header, self.records, self.since_base)
+        self.path = None
+        self.since_write = self.since_base = self.since_snapshot = None
+        self.timer.stop()
+        return state
+
+    def resume(self, state):
+        if state is None:
+            return
+        self.path, self.header, self.records, self.since_base = state
+        self.since_write = DirtyRange(self.editor.document().blockCount())
+        self.since_snapshot = None
+        self.timer.start()
+
+    def begin_snapshot(self):
+        # Called when a save takes its snapshot of the document
+        self.since_snapshot = DirtyRange(self.editor.document().blockCount())
+
+    def checkpoint(self, path, sha1, encoding):
+        # The snapshot is now on disk as path. Edits made while it was being
+        # written become the first record of the new journal.
+        since_snapshot = self.since_snapshot
+        if self.path is not None:
+            self.writer.submit('remove', self.path)
+            self.path = None
+        self.attach(path, sha1, encoding)
+        if since_snapshot is not None and since_snapshot.first is not None:
+            self.since_base = since_snapshot
+            self.since_write = since_snapshot.copy()
+
+    def abandon_snapshot(self):
+        self.since_snapshot = None
+
+    def handle_contents_change(self, position, removed, added):
+        if self.editor.is_refreshing_formats():
+            return
+        document = self.editor.document()
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if last < 0:
+            last = document.blockCount() - 1
+        tail = document.blockCount() - 1 - last
+        for dirty in (self.since_write, self.since_base, self.since_snapshot):
+            if dirty is not None:
+                dirty.mark(first, tail)
+
+    def record_for(self, dirty):
+        document = self.editor.document()
+        end = document.blockCount() - dirty.tail
+        lines = []
+        block = document.findBlockByNumber(dirty.first)
+        while block.isValid() and block.blockNumber() < end:
+            lines.append(block.text())
+            block = block.next()
+        record = {'first': dirty.first, 'old_count': dirty.base_count - dirty.first - dirty.tail, 'lines': lines}
+        return json.dumps(record) + '\n'
+
+    def flush(self):
+        # Only the blocks changed since the last write are read here; the
+        # write and fsync happen on the writer thread.
+        if self.path is None or self.since_write.first is None:
+            return
+        header = json.dumps(self.header) + '\n'
+        if self.records >= MAX_JOURNAL_RECORDS:
+            self.writer.submit('rewrite', self.path, header + self.record_for(self.since_base))
+            self.records = 1
+        else:
+            if self.records == 0:
+                self.writer.submit('append', self.path, header)
+            self.writer.submit('append', self.path, self.record_for(self.since_write))
+            self.records += 1
+        self.since_write = DirtyRange(self.editor.document().blockCount())
+
+    def recover(self, records):
+        # Applies journal records as one undoable edit
+        document = self.editor.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for record in records:
+            first = record['first']
+            text = '\n'.join(record['lines'])
+            cursor.setPosition(document.findBlockByNumber(first).position())
+            if record['old_count']:
+                last = document.findBlockByNumber(first + record['old_count'] - 1)
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+                cursor.insertText(text)
+            elif record['lines']:
+                cursor.insertText(text + '\n')
+        cursor.endEditBlock()
@@ -0,0 +1,410 @@
+from collections import deque
+from PySide6.QtCore import QCoreApplication, QObject, QThread, QTimer, QElapsedTimer, QSemaphore, Signal
+from PySide6.QtGui import QTextCursor
+from tokenizer import Tokenizer, ROOT_STACK
+from highlighter import REUSE_SPANS
+
+# Documents above either limit are highlighted in the background
+LARGE_DOCUMENT_CHARS = 2 * 1024 * 1024
+LARGE_DOCUMENT_BLOCKS = 20000
+
+CHUNK_BLOCKS = 256
+# Chunks the worker may run ahead of the GUI thread. Unapplied token lists are
+# the bulk of the memory used, and piling them up slows the garbage collector.
+MAX_QUEUED_CHUNKS = 8
+APPLY_BUDGET_MS = 6
+MIN_SLICE_BLOCKS = 8
+RESTART_DELAY_MS = 400
+VIEWPORT_MARGIN_BLOCKS = 20
+
+
+class HighlightWorker(QThread):
+    # generation, number of the first block in the chunk, [(tokens, end_stack)]
+    chunk_ready = Signal(int, int, object)
+    # generation, TokenCache of exactly the document's text
+    cache_loaded = Signal(int, object)
+
+    def __init__(self, language, lines, first_block, stack, generation, caching=False, path=None):
+        super().__init__()
+        self.language = language
+        self.lines = lines
+        self.first_block = first_block
+        self.stack = stack
+        self.generation = generation
+        # A pass over the whole document reads the tokens of unchanged lines
+        # from the token cache, and writes the cache if it had to lex
+        self.caching = caching and first_block == 0
+        self.path = path
+        self.credits = QSemaphore(MAX_QUEUED_CHUNKS)
+
+    def run(self):
+        # The worker gets its own tokenizer; lexer instances are not shared
+        # with the GUI thread.
+        tokenizer = Tokenizer(self.language)
+        cache = mapping = writer = None
+        if self.caching:
+            from token_cache import TokenCacheWriter, open_cache
+            cache, mapping = open_cache(self.lines, self.language, self.path)
+            if cache is not None and mapping is None:
+                self.cache_loaded.emit(self.generation, cache)
+            else:
+                writer = TokenCacheWriter(self.language)
+        stack = self.stack
+        block_number = self.first_block
+        chunk = []
+        for number, line in enumerate(self.lines):
+            if self.isInterruptionRequested():
+                return
+            result = None
+            if cache is not None:
+                # Tokens only depend on the text and the state it starts in
+                cached = number if mapping is None else mapping[number]
+                if cached >= 0 and cache.start_stack(cached) == stack:
+                    result = cache.result(cached, line)
+            if result is None:
+                result = tokenizer.tokenize(line, stack)
+            stack = result[1]
+            if writer is not None:
+                writer.add(line, *result)
+            chunk.append(result)
+            if len(chunk) == CHUNK_BLOCKS:
+                if not self.emit_chunk(block_number, chunk):
+                    return
+                block_number += len(chunk)
+                chunk = []
+        if chunk and not self.emit_chunk(block_number, chunk):
+            return
+        if writer is not None:
+            try:
+                writer.finish(self.lines, self.path)
+            except OSError:
+                pass
+
+    def emit_chunk(self, block_number, chunk):
+        while not self.credits.tryAcquire(1, 50):
+            if self.isInterruptionRequested():
+                return False
+        self.chunk_ready.emit(self.generation, block_number, chunk)
+        return True
+
+
+class BackgroundHighlighter(QObject):
+    # Viewport-first highlighting for very large documents. Visible blocks are
+    # lexed synchronously; the rest of the document is lexed on a worker thread
+    # and the results are applied on the GUI thread in small time-boxed slices.
+    # Results computed against an older document revision are dropped.
+    #
+    # QTextDocument.revision() also moves when highlighting formats are
+    # applied, so edits are counted here instead.
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.worker = None
+        self.retired = set()
+        # File the document was read from; the token cache of its previous
+        # version supplies the lines that did not change
+        self.path = None
+        self.revision = 0
+        self.generation = -1
+        self.applying = False
+        self.lexed_until = 0
+        self.block_count = 0
+        self.queue = deque()
+        self.reapply_cursor = None
+        self.slice_blocks = MIN_SLICE_BLOCKS
+        # Deferred mode was turned on for one large edit and ends once the
+        # background pass has caught up
+        self.temporary = False
+
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setInterval(0)
+        self.apply_timer.timeout.connect(self.apply_pending)
+
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.timeout.connect(self.resume)
+
+        self.viewport_timer = QTimer(self)
+        self.viewport_timer.setSingleShot(True)
+        self.viewport_timer.timeout.connect(self.highlight_viewport)
+
+        editor.verticalScrollBar().valueChanged.connect(self.schedule_viewport)
+        editor.document().contentsChange.connect(self.handle_contents_change)
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    @staticmethod
+    def is_large(text):
+        return len(text) > LARGE_DOCUMENT_CHARS or text.count('\n') > LARGE_DOCUMENT_BLOCKS
+
+    @property
+    def highlighter(self):
+        return self.editor.highlighter
+
+    @property
+    def active(self):
+        return self.highlighter.deferred
+
+    def set_enabled(self, enabled):
+        self.temporary = False
+        self.reapply_cursor = None
+        self.stop()
+        self.highlighter.deferred = enabled
+        self.highlighter.cache = None
+        self.highlighter.results.clear()
+        self.highlighter.first_pending = None
+        self.highlighter.sync_range = None
+
+    def start(self):
+        if not self.active:
+            return
+        self.lexed_until = 0
+        self.block_count = self.editor.document().blockCount()
+        self.highlight_viewport()
+        self.resume()
+
+    def defer_from(self, block_number):
+        # Call before an edit that changes many blocks at once: blocks from
+        # block_number on are highlighted in the background instead of inside
+        # the edit. Already-deferred documents need nothing extra.
+        if self.active:
+            return
+        highlighter = self.highlighter
+        highlighter.deferred = True
+        highlighter.results.clear()
+        highlighter.first_pending = None
+        highlighter.sync_range = None
+        self.temporary = True
+        self.lexed_until = block_number
+        self.block_count = self.editor.document().blockCount()
+
+    def reapply_theme(self):
+        # Re-colour from cached spans: the viewport now, the rest in slices.
+        # Blocks still waiting for the background pass get the new theme when
+        # their results arrive.
+        if not self.active:
+            return
+        self.highlight_viewport(reuse=True)
+        self.reapply_cursor = QTextCursor(self.editor.document())
+        self.apply_timer.start()
+
+    def stop(self):
+        self.restart_timer.stop()
+        self.queue.clear()
+        if self.reapply_cursor is None:
+            self.apply_timer.stop()
+        if self.worker is not None:
+            # Keep interrupted workers referenced until their thread exits
+            worker = self.worker
+            worker.chunk_ready.disconnect(self.handle_chunk)
+            worker.cache_loaded.disconnect(self.handle_cache_loaded)
+            worker.requestInterruption()
+            self.retired.add(worker)
+            worker.finished.connect(lambda: self.retired.discard(worker))
+            self.worker = None
+
+    def shutdown(self):
+        self.stop()
+        for worker in list(self.retired):
+            worker.wait()
+
+    def resume(self):
+        self.stop()
+        if not self.active:
+            return
+        document = self.editor.document()
+        highlighter = self.highlighter
+        if highlighter.first_pending is not None:
+            self.lexed_until = min(self.lexed_until, highlighter.first_pending)
+            highlighter.first_pending = None
+
+        first = self.lexed_until
+        if first >= document.blockCount():
+            return
+
+        lines = document.toPlainText().split('\n')
+        if len(lines) != document.blockCount():
+            # toPlainText() also turns line separators inside a block into
+            # newlines; fall back to walking the blocks.
+            lines = []
+            block = document.firstBlock()
+            while block.isValid():
+                lines.append(block.text())
+                block = block.next()
+        del lines[:first]
+
+        if first:
+            state = document.findBlockByNumber(first - 1).userState()
+            stack = highlighter.states.stack_for(state) if state >= 0 else ROOT_STACK
+        else:
+            stack = ROOT_STACK
+
+        self.generation = self.revision
+        # Only large documents are cached, not ones deferred for a single edit
+        # nor files still streaming in or shown a page at a time
+        caching = not self.temporary and not self.editor.isReadOnly()
+        self.worker = HighlightWorker(highlighter.tokenizer.language, lines, first, stack, self.generation,
+                                      caching=caching, path=self.path)
+        self.worker.chunk_ready.connect(self.handle_chunk)
+        self.worker.cache_loaded.connect(self.handle_cache_loaded)
+        self.worker.start(QThread.LowPriority)
+
+    def handle_chunk(self, generation, first_block, chunk):
+        if generation != self.generation or generation != self.revision:
+            return
+        self.queue.append([first_block, chunk, 0])
+
+        first, last = self.visible_range()
+        if first_block <= last and first_block + len(chunk) > first:
+            self.highlight_viewport()
+        self.apply_timer.start()
+
+    def handle_cache_loaded(self, generation, cache):
+        # Every line's tokens are known at once; the viewport is redone from
+        # them wherever the background pass has not got to yet
+        if generation != self.generation or generation != self.revision:
+            return
+        self.highlighter.cache = cache
+        self.highlight_viewport(cached=True)
+
+    def queued_result(self, block_number):
+        for first_block, chunk, index in self.queue:
+            if first_block + index <= block_number < first_block + len(chunk):
+                return chunk[block_number - first_block]
+        return None
+
+    def apply_pending(self):
+        document = self.editor.document()
+        if self.revision != self.generation:
+            self.queue.clear()
+        if self.queue:
+            visible_first, visible_last = self.highlighter.sync_range or (-1, -1)
+            first_block, chunk, index = self.queue[0]
+            if visible_first <= first_block + len(chunk) and first_block + index <= visible_last:
+                # Let the viewport pass pick up visible results with repaints
+                self.highlight_viewport()
+
+        # Off-screen blocks need no repaint, so the layout's update signals
+        # are held back while applying and the document size is resent once.
+        layout = document.documentLayout()
+        elapsed = QElapsedTimer()
+        elapsed.start()
+        self.applying = True
+        layout.blockSignals(True)
+        try:
+            while self.queue and elapsed.elapsed() < APPLY_BUDGET_MS:
+                self.apply_slice(document, elapsed)
+            while self.reapply_cursor is not None and elapsed.elapsed() < APPLY_BUDGET_MS:
+                self.reapply_slice(elapsed)
+        finally:
+            layout.blockSignals(False)
+            self.applying = False
+        layout.documentSizeChanged.emit(layout.documentSize())
+
+        if not self.queue and self.reapply_cursor is None:
+            self.apply_timer.stop()
+            if self.lexed_until >= document.blockCount():
+                self.highlighter.cache = None
+            if self.temporary and self.lexed_until >= document.blockCount():
+                self.temporary = False
+                self.highlighter.deferred = False
+                self.highlighter.sync_range = None
+
+    def apply_slice(self, document, elapsed):
+        # Results are handed over one slice at a time. Re-highlighting the
+        # first block of a slice cascades through the rest of it in a single
+        # pass; the slice size adapts to keep each pass within budget.
+        results = self.highlighter.results
+        entry = self.queue[0]
+        first_block, chunk, index = entry
+        count = min(self.slice_blocks, len(chunk) - index)
+        number = first_block + index
+        for offset in range(count):
+            results[number + offset] = chunk[index + offset]
+
+        slice_start = elapsed.nsecsElapsed()
+        block = document.findBlockByNumber(number)
+        end = number + count
+        while number < end and block.isValid():
+            if number in results:
+                self.highlighter.rehighlightBlock(block)
+            block = block.next()
+            number += 1
+        results.clear()
+        per_block_ms = (elapsed.nsecsElapsed() - slice_start) / 1e6 / count
+        self.slice_blocks = max(MIN_SLICE_BLOCKS, min(CHUNK_BLOCKS, int(APPLY_BUDGET_MS / max(per_block_ms, 1e-3))))
+
+        entry[2] = index + count
+        if entry[2] >= len(chunk) or not block.isValid():
+            self.queue.popleft()
+            if self.worker is not None:
+                self.worker.credits.release()
+            self.lexed_until = max(self.lexed_until, first_block + len(chunk))
+
+    def reapply_slice(self, elapsed):
+        # Re-colours blocks from their cached spans after a theme change. The
+        # cursor keeps its place in the document across edits.
+        results = self.highlighter.results
+        block = self.reapply_cursor.block()
+        for _ in range(CHUNK_BLOCKS):
+            if not block.isValid():
+                self.reapply_cursor = None
+                return
+            if block.userData() is not None:
+                results[block.blockNumber()] = REUSE_SPANS
+                self.highlighter.rehighlightBlock(block)
+                results.clear()
+            block = block.next()
+            if elapsed.elapsed() >= APPLY_BUDGET_MS:
+                break
+        if block.isValid():
+            self.reapply_cursor.setPosition(block.position())
+        else:
+            self.reapply_cursor = None
+
+    def handle_contents_change(self, position, removed, added):
+        if not self.active or self.applying:
+            # Format-only change caused by applying highlighting results
+            return
+        document = self.editor.document()
+        self.revision += 1
+
+        block_number = document.findBlock(position).blockNumber()
+        block_count = document.blockCount()
+        if block_number < self.lexed_until:
+            self.lexed_until = max(block_number + 1, self.lexed_until + block_count - self.block_count)
+        self.block_count = block_count
+
+        self.stop()
+        self.restart_timer.start(RESTART_DELAY_MS)
+
+    def visible_range(self):
+        first, last = self.editor.visible_block_range()
+        return (max(0, first - VIEWPORT_MARGIN_BLOCKS), last + VIEWPORT_MARGIN_BLOCKS)
+
+    def schedule_viewport(self):
+        if self.active:
+            self.viewport_timer.start(15)
+
+    def highlight_viewport(self, reuse=False, cached=False):
+        if not self.active:
+            return
+        highlighter = self.highlighter
+        first, last = self.visible_range()
+        highlighter.sync_range = (first, last)
+
+        applying, self.applying = self.applying, True
+        block = self.editor.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            result = self.queued_result(block.blockNumber())
+            if result is None and reuse and block.userData() is not None:
+                result = REUSE_SPANS
+            if result is None and cached and block.blockNumber() >= self.lexed_until:
+                result = highlighter.cached_result(block.blockNumber(), block.text(), None)
+            if result is not None:
+                highlighter.results[block.blockNumber()] = result
+            if result is not None or block.userState() < 0:
+                highlighter.rehighlightBlock(block)
+            block = block.next()
+        highlighter.results.clear()
+        self.applying = applying
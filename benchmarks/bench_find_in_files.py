@@ -0,0 +1,73 @@
+# Find in Files throughput on a generated folder of templates.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_find_in_files [files]
+#
+# Writes the files to a temporary folder, then searches it a few times with
+# the cache warm. Reports the time to the first result and the throughput;
+# the first result should arrive well within 100 ms.
+import os
+import random
+import sys
+import tempfile
+import time
+from PySide6.QtCore import QCoreApplication
+from file_search import FindInFilesWorker, split_patterns, DEFAULT_IGNORE
+from search_engine import SearchQuery
+
+LINE = '<div class="card"><span>Lorem ipsum dolor sit amet</span></div>\n'
+LINES_PER_FILE = 500
+FILES_PER_FOLDER = 100
+
+
+def write_tree(root, files):
+    random.seed(1)
+    total = 0
+    for i in range(files):
+        folder = os.path.join(root, f'templates{i // FILES_PER_FOLDER}')
+        os.makedirs(folder, exist_ok=True)
+        lines = [LINE] * LINES_PER_FILE
+        if random.random() < 0.1:
+            lines[random.randrange(LINES_PER_FILE)] = '<p class="needle">needle</p>\n'
+        data = ''.join(lines).encode('utf-8')
+        with open(os.path.join(folder, f'page{i}.html'), 'wb') as file:
+            file.write(data)
+        total += len(data)
+    return total
+
+
+def search(app, root, query):
+    worker = FindInFilesWorker(root, query, [], split_patterns(DEFAULT_IGNORE))
+    started = time.perf_counter()
+    first = []
+    done = []
+
+    def handle_results(batch, files):
+        if batch and not first:
+            first.append(time.perf_counter())
+
+    worker.results_found.connect(handle_results)
+    worker.search_done.connect(lambda files, hits, truncated: (done.append((time.perf_counter(), hits)), app.quit()))
+    worker.start()
+    app.exec()
+    worker.wait()
+    finished, hits = done[0]
+    return (first[0] - started) * 1000 if first else None, (finished - started), hits
+
+
+def run(files=4000):
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as root:
+        size = write_tree(root, files)
+        print(f"{files} files, {size / 1e6:.0f} MB")
+        for label, query in (('literal', SearchQuery('needle')),
+                             ('case-sensitive', SearchQuery('needle', case_sensitive=True)),
+                             ('whole words', SearchQuery('needle', whole_words=True)),
+                             ('regex', SearchQuery(r'class="ne+dle"', regex=True))):
+            search(app, root, query)
+            first_ms, seconds, hits = search(app, root, query)
+            print(f"{label:>15}: {hits} matches, first after {first_ms:.0f} ms, "
+                  f"{seconds * 1000:.0f} ms total, {size / 1e6 / seconds:.0f} MB/s")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 4000)
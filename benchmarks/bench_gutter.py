@@ -0,0 +1,83 @@
+# Gutter painting while scrolling through a large document.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_gutter [--old]
+#
+# Scrolls a 100k-line document a page at a time and times repainting the
+# line number area for each frame, and painting the minimap once its
+# thumbnails are cached. --old also times the previous gutter painting,
+# which laid out every number with drawText.
+import sys
+import time
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QPainter
+from PySide6.QtCore import Qt
+from editor import CodeEditor
+
+LINE = '  <li class="item"><a href="#item">item</a> text</li>'
+LINES = 100000
+FRAMES = 200
+
+
+def old_line_number_paint_event(editor, event):
+    painter = QPainter(editor.line_number_area)
+    painter.fillRect(event.rect(), Qt.lightGray)
+    block = editor.firstVisibleBlock()
+    block_number = block.blockNumber()
+    top = int(editor.blockBoundingGeometry(block).translated(editor.contentOffset()).top())
+    bottom = top + int(editor.blockBoundingRect(block).height())
+    while block.isValid() and top <= event.rect().bottom():
+        if block.isVisible() and bottom >= event.rect().top():
+            number = str(block_number + editor.first_line_number)
+            painter.setPen(Qt.black)
+            painter.drawText(0, top, editor.line_number_area.width() - 5, editor.fontMetrics().height(),
+                             Qt.AlignRight, number)
+        block = block.next()
+        top = bottom
+        bottom = top + int(editor.blockBoundingRect(block).height())
+        block_number += 1
+
+
+def time_frames(app, editor, widget):
+    scroll_bar = editor.verticalScrollBar()
+    step = max(1, scroll_bar.maximum() // FRAMES)
+    elapsed = 0
+    for frame in range(FRAMES):
+        scroll_bar.setValue(frame * step)
+        app.processEvents()
+        t0 = time.perf_counter()
+        widget.repaint()
+        elapsed += time.perf_counter() - t0
+    return elapsed * 1000 / FRAMES
+
+
+def run(old=False):
+    app = QApplication.instance() or QApplication(sys.argv)
+    editor = CodeEditor()
+    editor.resize(1000, 1000)
+    editor.show()
+    editor.setPlainText('<ul>\n' + '\n'.join(LINE for _ in range(LINES)) + '\n</ul>\n')
+    # Highlighting runs in the background; let it finish first
+    background = editor.background_highlighter
+    while background.queue or background.lexed_until < editor.blockCount():
+        app.processEvents()
+
+    print(f"gutter: {time_frames(app, editor, editor.line_number_area):.2f} ms/frame")
+    editor.folding = False
+    print(f"gutter without fold markers: {time_frames(app, editor, editor.line_number_area):.2f} ms/frame")
+    if old:
+        editor.line_number_paint_event = lambda event: old_line_number_paint_event(editor, event)
+        print(f"old gutter: {time_frames(app, editor, editor.line_number_area):.2f} ms/frame")
+
+    # Paint every thumbnail once, then time painting from the cache
+    time_frames(app, editor, editor.minimap)
+    deadline = time.perf_counter() + 10
+    while (editor.minimap.requested or editor.minimap.worker) and time.perf_counter() < deadline:
+        app.processEvents()
+    print(f"minimap: {time_frames(app, editor, editor.minimap):.2f} ms/frame, "
+          f"{len(editor.minimap.tiles)} thumbnails cached")
+    editor.minimap.shutdown()
+    editor.background_highlighter.stop()
+
+
+if __name__ == '__main__':
+    run(old='--old' in sys.argv)
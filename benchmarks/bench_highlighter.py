@@ -0,0 +1,78 @@
+# Per-keystroke highlighting cost on a large document.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_highlighter [lines]
+#
+# Types a character near the start, middle and end of the document and reports
+# the time each keystroke spends in the highlighter and how many blocks it
+# re-highlighted. Both should stay flat as the document grows.
+import sys
+import time
+from PySide6.QtWidgets import QApplication, QPlainTextEdit
+from PySide6.QtGui import QTextCursor
+from highlighter import Highlighter
+
+ROW = '    <tr class="row"><td id="c{0}">{0}</td><td>&amp; text</td></tr>'
+
+
+def synthetic_html(lines):
+    body = []
+    for i in range(lines):
+        if i % 500 == 0:
+            body.append('    <!-- section {0}'.format(i))
+            body.append('         spans two lines -->')
+        elif i % 777 == 0:
+            body.append('    <script>var x{0} = "{0}";</script>'.format(i))
+        else:
+            body.append(ROW.format(i))
+    return '<html>\n<body>\n<table>\n' + '\n'.join(body) + '\n</table>\n</body>\n</html>\n'
+
+
+class CountingHighlighter(Highlighter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blocks_highlighted = 0
+
+    def highlightBlock(self, text):
+        self.blocks_highlighted += 1
+        super().highlightBlock(text)
+
+
+def run(lines=50000, keystrokes=50):
+    app = QApplication.instance() or QApplication(sys.argv)
+    editor = QPlainTextEdit()
+    document = editor.document()
+    highlighter = CountingHighlighter(document, 'html')
+
+    start = time.perf_counter()
+    document.setPlainText(synthetic_html(lines))
+    app.processEvents()
+    print(f"initial highlight of {document.blockCount()} blocks: "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for label, block_number in (('start', 10), ('middle', lines // 2), ('end', lines - 10)):
+        block = document.findBlockByNumber(block_number)
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock)
+        timings = []
+        highlighter.blocks_highlighted = 0
+        for _ in range(keystrokes):
+            t0 = time.perf_counter()
+            cursor.insertText('x')
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        print(f"{label:>6}: median {timings[len(timings) // 2]:.3f} ms, "
+              f"max {timings[-1]:.3f} ms, "
+              f"{highlighter.blocks_highlighted / keystrokes:.1f} blocks/keystroke")
+
+    # Opening a comment re-highlights until the state converges again.
+    cursor = QTextCursor(document.findBlockByNumber(lines // 2))
+    highlighter.blocks_highlighted = 0
+    t0 = time.perf_counter()
+    cursor.insertText('<!--')
+    cursor.insertText('-->')
+    print(f"open+close comment: {(time.perf_counter() - t0) * 1000:.1f} ms, "
+          f"{highlighter.blocks_highlighted} blocks")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,92 @@
+# Time-to-first-paint and peak memory when opening large files.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_open [size_mb ...]
+#
+# Each size is measured in a fresh process so peak RSS is not shared between
+# runs. Files above file_loader.HUGE_FILE_THRESHOLD open in the paged view.
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROW = '<tr class="row"><td id="c{0}">{0}</td><td>&amp; some cell text</td></tr>\n'
+
+
+def generate(size_mb):
+    path = os.path.join(tempfile.gettempdir(), f"bench_open_{size_mb}mb.html")
+    target = size_mb * 1024 * 1024
+    if os.path.exists(path) and os.path.getsize(path) >= target:
+        return path
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<html>\n<body>\n<table>\n')
+        written = 0
+        i = 0
+        block = ''.join(ROW.format(n) for n in range(1000))
+        while written < target:
+            file.write(block)
+            written += len(block)
+            i += 1
+        file.write('</table>\n</body>\n</html>\n')
+    return path
+
+
+def measure(path):
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QObject, QEvent
+    app = QApplication.instance() or QApplication(sys.argv)
+    from main import MainWindow
+
+    window = MainWindow()
+    window.resize(1200, 800)
+    window.show()
+    app.processEvents()
+
+    painted = []
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not painted and obj.parent().toPlainText():
+                painted.append(time.perf_counter())
+            return False
+
+    watcher = PaintWatcher()
+    start = time.perf_counter()
+    page = window.load_file(path)
+    view = page.paged_view.editor if page.paged_view is not None else page.editor
+    view.viewport().installEventFilter(watcher)
+    while not painted or page.loader is not None:
+        app.processEvents()
+    loaded = time.perf_counter() - start
+    first_paint = painted[0] - start
+
+    result = {
+        'size_mb': os.path.getsize(path) / (1024 * 1024),
+        'paged': page.paged_view is not None,
+        'first_paint_ms': first_paint * 1000,
+        'loaded_ms': loaded * 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    window.close()
+    return result
+
+
+def main(argv):
+    if argv and argv[0] == '--child':
+        print(json.dumps(measure(argv[1])))
+        return
+    sizes = [int(arg) for arg in argv] or [10, 100, 1024]
+    for size_mb in sizes:
+        path = generate(size_mb)
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_open', '--child', path],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        mode = 'paged' if result['paged'] else 'streamed'
+        print(f"{result['size_mb']:8.0f} MB  {mode:8}  first paint {result['first_paint_ms']:8.1f} ms  "
+              f"loaded {result['loaded_ms']:9.1f} ms  peak RSS {result['peak_rss_mb']:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+# Replace All on documents with a growing number of matches.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_replace_all [--old]
+#
+# Times a literal Replace All over 10k-200k matches and checks that one undo
+# restores the document. The time should grow linearly with the number of
+# matches. --old also times the previous find-and-insert loop on the smaller
+# documents for comparison.
+import sys
+import time
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QTextCursor, QTextDocument
+from editor import CodeEditor
+from search_engine import SearchQuery
+
+LINE = '  <li class="item"><a href="#item">item</a> text</li>'
+SIZES = (10000, 50000, 100000, 200000)
+OLD_LOOP_MAX = 20000
+
+
+def old_replace_all(editor, text, replacement):
+    cursor = editor.textCursor()
+    cursor.beginEditBlock()
+    editor.moveCursor(QTextCursor.Start)
+    while editor.find(text, QTextDocument.FindCaseSensitively):
+        editor.textCursor().insertText(replacement)
+    cursor.endEditBlock()
+
+
+def run(sizes=SIZES, old=False):
+    app = QApplication.instance() or QApplication(sys.argv)
+    editor = CodeEditor()
+    document = editor.document()
+    for size in sizes:
+        # Every line has one match of "class"
+        original = '<ul>\n' + '\n'.join(LINE for _ in range(size)) + '\n</ul>\n'
+        editor.setPlainText(original)
+        app.processEvents()
+
+        t0 = time.perf_counter()
+        count = editor.search.replace_all(SearchQuery('class', case_sensitive=True), 'className')
+        elapsed = (time.perf_counter() - t0) * 1000
+        document.undo()
+        restored = editor.toPlainText() == original
+        print(f"{size:>7} lines: {count} replaced in {elapsed:.0f} ms "
+              f"({elapsed * 1000 / max(count, 1):.1f} us/match), undo {'ok' if restored else 'FAILED'}")
+
+        if old and size <= OLD_LOOP_MAX:
+            t0 = time.perf_counter()
+            old_replace_all(editor, 'class', 'className')
+            print(f"{'':>7}        old loop: {(time.perf_counter() - t0) * 1000:.0f} ms")
+        app.processEvents()
+    editor.search.shutdown()
+    editor.background_highlighter.stop()
+
+
+if __name__ == '__main__':
+    run(old='--old' in sys.argv)
@@ -0,0 +1,76 @@
+# Memory and tab switching with many open documents.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.bench_tabs [--no-budget]
+#
+# Opens 120 generated HTML files in tabs and shows each in turn, then
+# reports how many stay loaded, the estimated and peak resident memory, and
+# how long showing an unloaded tab takes, with and without unsaved edits.
+# --no-budget keeps every tab loaded, for comparison.
+import os
+import resource
+import sys
+import tempfile
+import time
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QCoreApplication, QEvent
+from document_tabs import DocumentTabs
+
+FILES = 120
+LINES = 1000
+BUDGET_MB = 64
+
+
+def settle(app, page):
+    # Until the page's file is read and its visible lines highlighted
+    while page.loader is not None:
+        app.processEvents()
+    app.processEvents()
+    # Unloaded editors are deleted once control is back in the event loop
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def time_show(app, tabs, page):
+    t0 = time.perf_counter()
+    tabs.setCurrentWidget(page)
+    settle(app, page)
+    return (time.perf_counter() - t0) * 1000
+
+
+def run(budget=True):
+    app = QApplication.instance() or QApplication(sys.argv)
+    folder = tempfile.mkdtemp()
+    paths = []
+    for i in range(FILES):
+        path = os.path.join(folder, f'page{i}.html')
+        with open(path, 'w') as file:
+            file.write('<ul>\n' + '\n'.join(f'  <li class="item{i}"><a href="#{j}">item {j}</a></li>'
+                                            for j in range(LINES)) + '\n</ul>\n')
+        paths.append(path)
+
+    tabs = DocumentTabs()
+    tabs.resize(1000, 800)
+    tabs.show()
+    tabs.set_memory_budget(BUDGET_MB * 1024 * 1024 if budget else 1 << 60)
+    pages = [tabs.add_page(path) for path in paths]
+    pages[1].activate()
+    settle(app, pages[1])
+    pages[1].editor.insertPlainText('<p>unsaved</p>\n')
+
+    t0 = time.perf_counter()
+    for page in pages:
+        tabs.setCurrentWidget(page)
+        settle(app, page)
+    elapsed = time.perf_counter() - t0
+    print(f"showed {FILES} tabs in {elapsed:.1f} s; {len(tabs.editors())} loaded, "
+          f"estimated {tabs.memory_used() / 2**20:.0f} MB, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    print(f"show an earlier tab again: {time_show(app, tabs, pages[0]):.1f} ms, "
+          f"with unsaved edits: {time_show(app, tabs, pages[1]):.1f} ms")
+    tabs.shutdown()
+    for path in paths:
+        os.unlink(path)
+    os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    run(budget='--no-budget' not in sys.argv)
@@ -0,0 +1,386 @@
+# Headless benchmark suite for the editor's hot paths.
+#
+#   QT_QPA_PLATFORM=offscreen python -m benchmarks.suite [--quick] [--only NAME ...]
+#       [--output results.json] [--compare baseline.json] [--threshold 0.2]
+#
+# Runs each benchmark on synthetic HTML and XML from 1 KB to 100 MB, every
+# case in a fresh process so its peak RSS is its own: keystroke latency in
+# CodeEditor, highlight throughput of Highlighter, open and save time through
+# MainWindow, Replace All through FindReplaceDialog and repainting the editor
+# while scrolling. --quick stops at 1 MB. --output writes the results as JSON;
+# --compare reads an earlier run, such as a baseline kept from the main
+# branch, and flags every metric that got worse by more than the threshold,
+# exiting with status 1 if any did.
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+KB = 1024
+MB = 1024 * KB
+SIZES = (KB, 100 * KB, MB, 10 * MB, 100 * MB)
+QUICK_MAX_SIZE = MB
+KINDS = ('html', 'xml')
+KEYSTROKES = 50
+SCROLL_FRAMES = 100
+# A case still running after this many seconds is recorded as failed
+CASE_TIMEOUT = 900
+# Relative change counted as a regression, and the smallest absolute change
+# worth flagging, so sub-millisecond noise on small cases is not
+DEFAULT_THRESHOLD = 0.2
+MIN_CHANGE = 1.0
+# Only these metrics are compared; the rest of a result is information.
+# Metrics ending in _per_s are better when higher, the others when lower.
+METRIC_SUFFIXES = ('_ms', '_mb', '_per_s')
+
+HTML_ROW = '    <tr class="row"><td id="c{0}">{0}</td><td>&amp; some cell text</td></tr>'
+XML_ITEM = '  <item id="i{0}" type="part"><name>Part {0}</name><price currency="EUR">{0}.50</price></item>'
+
+
+def synthetic(kind, size):
+    # About size bytes of markup, with the constructs the highlighter carries
+    # from line to line: comments over two lines, scripts and CDATA
+    if kind == 'html':
+        lines = ['<html>', '<body>', '<table>']
+        tail = ['</table>', '</body>', '</html>', '']
+    else:
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<catalog>']
+        tail = ['</catalog>', '']
+    written = 0
+    i = 0
+    while written < size:
+        if i % 500 == 0:
+            line = f'    <!-- section {i}\n         spans two lines -->'
+        elif i % 777 == 0 and kind == 'html':
+            line = f'    <script>var x{i} = "{i}" && true;</script>'
+        elif i % 777 == 0:
+            line = f'  <note><![CDATA[{i} < {i + 1} & more]]></note>'
+        else:
+            line = (HTML_ROW if kind == 'html' else XML_ITEM).format(i)
+        lines.append(line)
+        written += len(line) + 1
+        i += 1
+    return '\n'.join(lines + tail)
+
+
+def synthetic_file(kind, size):
+    # Kept in the temporary folder between runs
+    path = os.path.join(tempfile.gettempdir(), f"bench_suite_{size_label(size)}.{kind}")
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8', newline='\n') as file:
+            file.write(synthetic(kind, size))
+    return path
+
+
+def size_label(size):
+    return f"{size // MB}mb" if size >= MB else f"{size // KB}kb"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def settle(app, editor):
+    # Until background highlighting has caught up with the whole document
+    background = editor.background_highlighter
+    while background.active and (background.queue or background.lexed_until < editor.blockCount()):
+        app.processEvents()
+    app.processEvents()
+
+
+def open_editor(app, kind, size):
+    from editor import CodeEditor
+    editor = CodeEditor()
+    editor.resize(1000, 800)
+    editor.show()
+    editor.setPlainText(synthetic(kind, size))
+    settle(app, editor)
+    return editor
+
+
+def close_editor(editor):
+    editor.shutdown()
+    editor.close()
+
+
+def bench_keystroke(app, kind, size):
+    # Time from a key press to the edit being highlighted and painted
+    from PySide6.QtGui import QTextCursor
+    from PySide6.QtTest import QTest
+    editor = open_editor(app, kind, size)
+    cursor = QTextCursor(editor.document().findBlockByNumber(editor.blockCount() // 2))
+    cursor.movePosition(QTextCursor.EndOfBlock)
+    editor.setTextCursor(cursor)
+    editor.setFocus()
+    timings = []
+    for _ in range(KEYSTROKES):
+        t0 = time.perf_counter()
+        QTest.keyClick(editor, 'x')
+        app.processEvents()
+        timings.append((time.perf_counter() - t0) * 1000)
+    close_editor(editor)
+    return {
+        'keystroke_median_ms': statistics.median(timings),
+        'keystroke_p95_ms': percentile(timings, 0.95),
+    }
+
+
+def bench_highlight(app, kind, size):
+    # Lexing and formatting every block, without an editor around it
+    from PySide6.QtGui import QTextDocument
+    from highlighter import Highlighter
+    document = QTextDocument()
+    document.setPlainText(synthetic(kind, size))
+    highlighter = Highlighter(document, kind)
+    # Pygments is loaded with the first line lexed; keep that out of the timing
+    highlighter.tokenizer.tokenize('<p>')
+    t0 = time.perf_counter()
+    highlighter.rehighlight()
+    elapsed = time.perf_counter() - t0
+    return {
+        'highlight_ms': elapsed * 1000,
+        'highlight_mb_per_s': size / MB / elapsed,
+        'blocks': document.blockCount(),
+    }
+
+
+def open_window(app):
+    from main import MainWindow
+    window = MainWindow()
+    window.resize(1200, 800)
+    window.show()
+    while not window.painted:
+        app.processEvents()
+    app.processEvents()
+    return window
+
+
+def load(app, window, path):
+    # Returns the page and the milliseconds to the first paint of its text
+    # and to the end of loading
+    from PySide6.QtCore import QObject, QEvent
+    painted = []
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not painted and obj.parent().document().characterCount() > 1:
+                painted.append(time.perf_counter())
+            return False
+
+    watcher = PaintWatcher()
+    start = time.perf_counter()
+    page = window.load_file(path)
+    view = page.paged_view.editor if page.paged_view is not None else page.editor
+    view.viewport().installEventFilter(watcher)
+    while not painted or page.loader is not None:
+        app.processEvents()
+    loaded = time.perf_counter()
+    view.viewport().removeEventFilter(watcher)
+    return page, (painted[0] - start) * 1000, (loaded - start) * 1000
+
+
+def bench_open(app, kind, size):
+    window = open_window(app)
+    page, first_paint, loaded = load(app, window, synthetic_file(kind, size))
+    result = {
+        'first_paint_ms': first_paint,
+        'loaded_ms': loaded,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'paged': page.paged_view is not None,
+    }
+    window.close()
+    return result
+
+
+def bench_save(app, kind, size):
+    # Saved to a copy, with one edit so there is something to save
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, os.path.basename(synthetic_file(kind, size)))
+    shutil.copyfile(synthetic_file(kind, size), path)
+    window = open_window(app)
+    page, _, _ = load(app, window, path)
+    page.editor.insertPlainText('x')
+    t0 = time.perf_counter()
+    window.save_file()
+    while page.saver is not None:
+        app.processEvents()
+    elapsed = (time.perf_counter() - t0) * 1000
+    window.close()
+    shutil.rmtree(folder)
+    return {'save_ms': elapsed}
+
+
+def bench_replace_all(app, kind, size):
+    from find_replace_dialog import FindReplaceDialog
+    editor = open_editor(app, kind, size)
+    dialog = FindReplaceDialog(editor, replace=True)
+    dialog.find_input.setText('id')
+    dialog.replace_input.setText('key')
+    t0 = time.perf_counter()
+    dialog.replace_all()
+    elapsed = (time.perf_counter() - t0) * 1000
+    replaced = editor.toPlainText().count('key=')
+    dialog.close()
+    close_editor(editor)
+    return {'replace_all_ms': elapsed, 'replaced': replaced}
+
+
+def bench_scroll(app, kind, size):
+    # Scrolls a page at a time and repaints the text and the gutter
+    editor = open_editor(app, kind, size)
+    scroll_bar = editor.verticalScrollBar()
+    step = max(1, scroll_bar.maximum() // SCROLL_FRAMES)
+    timings = []
+    for frame in range(SCROLL_FRAMES):
+        t0 = time.perf_counter()
+        scroll_bar.setValue(frame * step)
+        editor.viewport().repaint()
+        editor.line_number_area.repaint()
+        timings.append((time.perf_counter() - t0) * 1000)
+        app.processEvents()
+    close_editor(editor)
+    return {
+        'scroll_frame_median_ms': statistics.median(timings),
+        'scroll_frame_p95_ms': percentile(timings, 0.95),
+    }
+
+
+# name: (function, sizes, needs MainWindow). The largest sizes are left out
+# where a case would take minutes, or where the file opens read-only.
+BENCHMARKS = {
+    'keystroke': (bench_keystroke, SIZES[:4], False),
+    'highlight': (bench_highlight, SIZES[:4], False),
+    'open': (bench_open, SIZES, True),
+    'save': (bench_save, SIZES[:4], True),
+    'replace_all': (bench_replace_all, SIZES[1:4], False),
+    'scroll': (bench_scroll, SIZES[2:4], False),
+}
+
+
+def child(name, kind, size):
+    from PySide6.QtCore import QCoreApplication, Qt
+    from PySide6.QtWidgets import QApplication
+    function, _, needs_window = BENCHMARKS[name]
+    if needs_window:
+        # As in main.py, the preview scheme must exist before the application
+        from preview_scheme import register_preview_scheme
+        register_preview_scheme()
+        QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv[:1])
+    # Keeps autosave journals apart from the editor's own
+    app.setApplicationName("Professional Code Editor Benchmarks")
+    result = function(app, kind, size)
+    result.setdefault('peak_rss_mb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    print(json.dumps(result))
+
+
+def run_case(name, kind, size):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        process = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--child', name, kind, str(size)],
+            capture_output=True, text=True, env=env, timeout=CASE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return {'error': f"timed out after {CASE_TIMEOUT} s"}
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit status {process.returncode}"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def run(names, quick=False):
+    cases = {}
+    for name in names:
+        _, sizes, needs_window = BENCHMARKS[name]
+        for size in sizes:
+            if quick and size > QUICK_MAX_SIZE:
+                continue
+            for kind in KINDS:
+                key = f"{name}/{kind}/{size_label(size)}"
+                if needs_window:
+                    # Written here so generating it does not count towards peak RSS
+                    synthetic_file(kind, size)
+                result = cases[key] = run_case(name, kind, size)
+                print(f"{key:<24} " + format_result(result), flush=True)
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+
+
+def format_result(result):
+    if 'error' in result:
+        return f"FAILED: {result['error']}"
+    return '  '.join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                     for key, value in result.items())
+
+
+def is_metric(key):
+    return key.endswith(METRIC_SUFFIXES)
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    # Prints every metric next to its baseline; returns the regressions
+    regressions = []
+    for key, result in results['cases'].items():
+        base = baseline['cases'].get(key)
+        if base is None or 'error' in base or 'error' in result:
+            continue
+        for metric, value in result.items():
+            old = base.get(metric)
+            if not is_metric(metric) or old is None:
+                continue
+            higher_is_better = metric.endswith('_per_s')
+            worse = old - value if higher_is_better else value - old
+            change = (value - old) / old if old else 0.0
+            regressed = worse > MIN_CHANGE and worse > abs(old) * threshold
+            if regressed:
+                regressions.append((key, metric, old, value))
+            print(f"{key:<24} {metric:<24} {old:10.2f} -> {value:10.2f}  {change:+7.1%}"
+                  + ("  REGRESSION" if regressed else ""))
+    for key in sorted(baseline['cases'].keys() - results['cases'].keys()):
+        print(f"{key:<24} not run")
+    return regressions
+
+
+def main(argv):
+    if argv and argv[0] == '--child':
+        child(argv[1], argv[2], int(argv[3]))
+        return 0
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    parser.add_argument('--quick', action='store_true', help="only sizes up to 1 MB")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against an earlier run")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change counted as a regression (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.quick)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print()
+        regressions = compare(baseline, results, args.threshold)
+        print(f"\n{len(regressions)} regression{'s' if len(regressions) != 1 else ''} "
+              f"beyond {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,266 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from search_engine import SearchQuery, replace_all
+from snippets import SNIPPETS
+from text_files import atomic_write, atomic_write_chunks, decode_file
+from theme_files import DEFAULT_THEME, available_themes
+from validator import DocumentModel, is_xml
+
+# Batch commands, run by main.py without a window or Qt:
+#   python main.py replace FIND REPLACEMENT FILES... [--regex] [--snippet] [--dry-run]
+#   python main.py highlight-export FILES... --output-dir DIR [--theme NAME]
+#   python main.py check FILES...
+# FILES are glob patterns; ** matches any number of folders.
+# Files handed to a worker process at once, at most
+FILES_PER_TASK = 16
+
+# Set in each worker process by init_worker()
+_command = None
+_options = None
+_pattern = None
+
+
+def expand_paths(patterns):
+    # (files matching the patterns in order without duplicates, patterns
+    # that matched no file)
+    paths = []
+    seen = set()
+    unmatched = []
+    for pattern in patterns:
+        matched = False
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if not os.path.isfile(path):
+                continue
+            matched = True
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+        if not matched:
+            unmatched.append(pattern)
+    return paths, unmatched
+
+
+def normalize_newlines(text):
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def newline_style(text):
+    # The line break a file uses, judged by the first one
+    position = text.find('\r')
+    if position < 0:
+        return '\n'
+    return '\r\n' if text.startswith('\r\n', position) else '\r'
+
+
+def export_path(path, output_dir):
+    # The export of path keeps its place relative to the current folder
+    # under output_dir; files outside it go to the top
+    relative = os.path.relpath(os.path.abspath(path))
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(path)
+    return os.path.join(output_dir, relative + '.html')
+
+
+def init_worker(command, options):
+    global _command, _options, _pattern
+    _command = command
+    _options = options
+    if command == 'replace':
+        _pattern = replace_query(options).compile()
+
+
+def replace_query(options):
+    return SearchQuery(options.find, regex=options.regex, case_sensitive=options.case_sensitive,
+                       whole_words=options.whole_words)
+
+
+def replace_file(path):
+    # Matches against the text with \n line breaks, like the editor does,
+    # and writes it back with the file's own line breaks
+    text, encoding = decode_file(path, _options.encoding)
+    newline = newline_style(text)
+    text = normalize_newlines(text)
+    # Snippets are inserted as is
+    regex = _options.regex and not _options.snippet
+    start, end, new_text, count = replace_all(_pattern, text, _options.replacement, regex)
+    if (start != end or new_text) and not _options.dry_run:
+        chunks = (text[:start], new_text, text[end:])
+        if newline != '\n':
+            chunks = (chunk.replace('\n', newline) for chunk in chunks)
+        atomic_write_chunks(path, chunks, encoding)
+    return {'path': path, 'replacements': count}
+
+
+def export_file(path):
+    from html_export import export_html
+    text, _ = decode_file(path, _options.encoding, 'replace')
+    lines = normalize_newlines(text).split('\n')
+    language = _options.language or ('xml' if is_xml(lines[0]) else 'html')
+    output = export_path(path, _options.output_dir)
+    os.makedirs(os.path.dirname(output) or os.curdir, exist_ok=True)
+    atomic_write_chunks(output, export_html(lines, language, _options.theme, os.path.basename(path)))
+    return {'path': path, 'output': output}
+
+
+def check_file(path):
+    text, _ = decode_file(path, _options.encoding, 'replace')
+    model = DocumentModel()
+    model.reset(normalize_newlines(text))
+    diagnostics = [[line + 1, start + 1, severity, message]
+                   for line, start, end, severity, message in model.diagnostics()]
+    errors = sum(1 for diagnostic in diagnostics if diagnostic[2] == 'error')
+    return {'path': path, 'errors': errors, 'warnings': len(diagnostics) - errors, 'diagnostics': diagnostics}
+
+
+PROCESSORS = {
+    'replace': replace_file,
+    'highlight-export': export_file,
+    'check': check_file,
+}
+
+
+def process_file(path):
+    # One file's result; a file that fails does not stop the others
+    try:
+        return PROCESSORS[_command](path)
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+
+def process_files(command, options, paths):
+    # Yields the result of every file in the order of paths, each as soon as
+    # it and the ones before it are done. Files are spread over a pool of
+    # processes; each file is read, processed and written by one of them.
+    jobs = min(options.jobs, len(paths))
+    if jobs <= 1:
+        init_worker(command, options)
+        yield from map(process_file, paths)
+        return
+    if command == 'highlight-export':
+        # Compiled before the workers fork, so they start with it
+        from line_lexers import create_lexer
+        for language in [options.language] if options.language else ['html', 'xml']:
+            create_lexer(language)
+    chunksize = max(1, min(FILES_PER_TASK, len(paths) // (jobs * 4)))
+    with multiprocessing.Pool(jobs, init_worker, (command, options)) as pool:
+        yield from pool.imap(process_file, paths, chunksize)
+
+
+def print_result(command, options, result):
+    if 'error' in result:
+        print(f"{result['path']}: {result['error']}", file=sys.stderr)
+    elif command == 'replace':
+        count = result['replacements']
+        if count:
+            verb = "would replace" if options.dry_run else "replaced"
+            print(f"{result['path']}: {verb} {count} occurrence{'s' if count != 1 else ''}")
+    elif command == 'highlight-export':
+        print(f"{result['path']} -> {result['output']}")
+    else:
+        for line, column, severity, message in result['diagnostics']:
+            print(f"{result['path']}:{line}:{column}: {severity}: {message}")
+
+
+def summary_text(command, options, results, failed, unmatched, seconds):
+    done = [result for result in results if 'error' not in result]
+    if command == 'replace':
+        changed = [result for result in done if result['replacements']]
+        count = sum(result['replacements'] for result in changed)
+        verb = "Would replace" if options.dry_run else "Replaced"
+        text = f"{verb} {count} occurrence{'s' if count != 1 else ''} in {len(changed)} of {len(results)} files"
+    elif command == 'highlight-export':
+        text = f"Exported {len(done)} of {len(results)} files"
+    else:
+        errors = sum(result['errors'] for result in done)
+        warnings = sum(result['warnings'] for result in done)
+        flagged = sum(1 for result in done if result['diagnostics'])
+        text = f"{errors} errors and {warnings} warnings in {flagged} of {len(results)} files"
+    if failed:
+        text += f"; {failed} could not be processed"
+    if unmatched:
+        text += f"; {unmatched} pattern{'s' if unmatched != 1 else ''} matched no files"
+    return f"{text} in {seconds:.2f} s"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description="Batch commands over many files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(subparser):
+        subparser.add_argument('files', nargs='+', help="files or glob patterns; ** matches any number of folders")
+        subparser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                               help="worker processes (default: one per CPU)")
+        subparser.add_argument('--encoding', help="encoding of the files (default: detected per file)")
+        subparser.add_argument('--report', help="also write the results to this JSON file")
+
+    replace = subparsers.add_parser('replace', help="replace text in files")
+    replace.add_argument('find', help="text or regular expression to find")
+    replace.add_argument('replacement', help="replacement; with --regex it may use \\1 or \\g<name>")
+    add_common(replace)
+    replace.add_argument('--regex', action='store_true', help="FIND is a regular expression")
+    replace.add_argument('--case-sensitive', action='store_true')
+    replace.add_argument('--whole-words', action='store_true')
+    replace.add_argument('--snippet', action='store_true',
+                         help=f"REPLACEMENT names a snippet: {', '.join(SNIPPETS)}")
+    replace.add_argument('--dry-run', action='store_true', help="count the replacements without writing")
+
+    export = subparsers.add_parser('highlight-export', help="write syntax-highlighted HTML copies of files")
+    add_common(export)
+    export.add_argument('--output-dir', '-o', required=True,
+                        help="folder for the exports, which keep the files' paths relative to the current folder")
+    export.add_argument('--theme', default=DEFAULT_THEME, choices=available_themes())
+    export.add_argument('--language', choices=['html', 'xml'],
+                        help="default: xml for files starting with <?xml, otherwise html")
+
+    check = subparsers.add_parser('check', help="report HTML/XML errors; fails if there are any")
+    add_common(check)
+    return parser
+
+
+def main(argv):
+    parser = build_parser()
+    options = parser.parse_args(argv)
+    command = options.command
+    if command == 'replace':
+        if options.snippet:
+            if options.replacement not in SNIPPETS:
+                parser.error(f"unknown snippet {options.replacement!r}; snippets are {', '.join(SNIPPETS)}")
+            options.replacement = SNIPPETS[options.replacement]
+        if not options.find:
+            parser.error("nothing to find")
+        try:
+            replace_query(options).compile()
+        except re.error as e:
+            parser.error(f"invalid pattern: {e}")
+    if options.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    paths, unmatched = expand_paths(options.files)
+    for pattern in unmatched:
+        print(f"No files match {pattern}", file=sys.stderr)
+
+    started = time.perf_counter()
+    results = []
+    failed = 0
+    for result in process_files(command, options, paths):
+        results.append(result)
+        failed += 'error' in result
+        print_result(command, options, result)
+    seconds = time.perf_counter() - started
+    print(summary_text(command, options, results, failed, len(unmatched), seconds), file=sys.stderr)
+
+    if options.report:
+        report = {'command': command, 'files': len(results), 'failed': failed, 'unmatched': unmatched,
+                  'seconds': round(seconds, 3), 'results': results}
+        atomic_write(options.report, json.dumps(report, indent=1))
+    # A pattern matching nothing is most likely mistyped
+    if failed or unmatched or command == 'check' and any(result.get('errors') for result in results):
+        return 1
+    return 0
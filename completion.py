@@ -0,0 +1,266 @@
+import heapq
+import re
+import shiboken6
+from pygments.token import Token
+
+MAX_COMPLETIONS = 50
+# Tag and attribute names known before they appear in the document
+HTML_TAGS = [
+    'html', 'head', 'title', 'base', 'link', 'meta', 'style', 'script', 'noscript',
+    'body', 'section', 'nav', 'article', 'aside', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'header', 'footer', 'address', 'main', 'p', 'hr', 'pre', 'blockquote',
+    'ol', 'ul', 'li', 'dl', 'dt', 'dd', 'figure', 'figcaption', 'div', 'a', 'em',
+    'strong', 'small', 's', 'cite', 'q', 'dfn', 'abbr', 'data', 'time', 'code',
+    'var', 'samp', 'kbd', 'sub', 'sup', 'i', 'b', 'u', 'mark', 'ruby', 'rt', 'rp',
+    'bdi', 'bdo', 'span', 'br', 'wbr', 'ins', 'del', 'picture', 'source', 'img',
+    'iframe', 'embed', 'object', 'param', 'video', 'audio', 'track', 'map', 'area',
+    'table', 'caption', 'colgroup', 'col', 'tbody', 'thead', 'tfoot', 'tr', 'td',
+    'th', 'form', 'fieldset', 'legend', 'label', 'input', 'button', 'select',
+    'datalist', 'optgroup', 'option', 'textarea', 'keygen', 'output', 'progress',
+    'meter', 'details', 'summary', 'menuitem', 'menu'
+]
+HTML_ATTRIBUTES = [
+    'id', 'class', 'style', 'title', 'lang', 'dir', 'hidden', 'tabindex', 'role',
+    'href', 'target', 'rel', 'src', 'alt', 'width', 'height', 'type', 'name', 'value',
+    'placeholder', 'disabled', 'checked', 'selected', 'readonly', 'required', 'for',
+    'action', 'method', 'charset', 'content', 'colspan', 'rowspan'
+]
+
+_NAME = r'[\w:.-]'
+_ATTRIBUTES = r'(?:\s+%s+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)*' % _NAME
+_TAG_NAME_CONTEXT = re.compile(r'</?(%s*)$' % _NAME)
+_ATTRIBUTE_CONTEXT = re.compile(r'^(?:<(%s+))?%s\s+(%s*)$' % (_NAME, _ATTRIBUTES, _NAME))
+_VALUE_CONTEXT = re.compile(r'^(?:<(%s+))?%s\s+(%s+)\s*=\s*["\']([^"\']*)$' % (_NAME, _ATTRIBUTES, _NAME))
+
+_WORD_KINDS = {
+    Token.Name.Tag: 'tag',
+    Token.Name.Attribute: 'attribute',
+    Token.Literal.String: 'value',
+    Token.Name.Class: 'class',
+}
+
+
+def extract_words(tokens):
+    # (kind, word) pairs of one block's tokens: tag and attribute names, the
+    # classes and ids given in attribute values and classes in style sheets.
+    # 'pair' words record which attributes were used on which tag.
+    words = []
+    tag = attribute = None
+    for _, ttype, content in tokens:
+        kind = _WORD_KINDS.get(ttype)
+        if kind is None:
+            continue
+        if kind == 'tag':
+            name = content.strip('</>')
+            if name:
+                words.append(('tag', name))
+                tag = name
+            attribute = None
+        elif kind == 'attribute':
+            attribute = content.rstrip('=').strip()
+            words.append(('attribute', attribute))
+            if tag is not None:
+                words.append(('pair', f"{tag} {attribute}"))
+        elif kind == 'value':
+            if attribute == 'class':
+                words.extend(('class', name) for name in content.strip('"\'').split())
+            elif attribute == 'id':
+                value = content.strip('"\'').strip()
+                if value:
+                    words.append(('id', value))
+            attribute = None
+        else:
+            words.append(('class', content))
+    return tuple(words)
+
+
+def completion_context(text, in_tag=False):
+    # What is being typed at the end of text, the line up to the cursor:
+    # (kind, prefix, tag) or None outside tags. in_tag says the line starts
+    # inside a tag opened on an earlier line; its name is then unknown.
+    start = text.rfind('<')
+    if start >= 0:
+        text = text[start:]
+    elif in_tag:
+        text = ' ' + text
+    else:
+        return None
+    if '>' in text:
+        return None
+    m = _TAG_NAME_CONTEXT.match(text)
+    if m and m.end() == len(text):
+        return 'tag', m.group(1), None
+    m = _VALUE_CONTEXT.match(text)
+    if m:
+        tag, attribute, value = m.groups()
+        attribute = attribute.lower()
+        if attribute == 'class':
+            return 'class', value.split(' ')[-1], tag
+        if attribute in ('id', 'for'):
+            return 'id', value, tag
+        if attribute == 'href' and value.startswith('#'):
+            return 'id', value[1:], tag
+        return None
+    m = _ATTRIBUTE_CONTEXT.match(text)
+    if m:
+        return 'attribute', m.group(2), m.group(1)
+    return None
+
+
+class _Node:
+    __slots__ = ('children', 'words', 'best')
+
+    def __init__(self):
+        # Keyed by lower-cased character
+        self.children = {}
+        # Words ending here, differing only in case
+        self.words = set()
+        # Highest count of any word in this subtree
+        self.best = 0
+
+
+class PrefixTrie:
+    # Words with a count each. Every node knows the highest count below it,
+    # so the most used words for a prefix are found best-first without
+    # visiting the rest of the subtree. Pinned words stay when their count
+    # drops to zero.
+    def __init__(self, pinned=()):
+        self.root = _Node()
+        self.counts = {}
+        self.pinned = set(pinned)
+        for word in self.pinned:
+            self.add(word, 0)
+
+    def add(self, word, delta=1):
+        path = [self.root]
+        for char in word.lower():
+            node = path[-1].children.get(char)
+            if node is None:
+                node = path[-1].children[char] = _Node()
+            path.append(node)
+        count = self.counts.get(word, 0) + delta
+        if count > 0 or word in self.pinned:
+            self.counts[word] = max(count, 0)
+            path[-1].words.add(word)
+        else:
+            self.counts.pop(word, None)
+            path[-1].words.discard(word)
+        self.update_path(word.lower(), path)
+
+    def update_path(self, key, path):
+        # Drops nodes left empty and refreshes best from the bottom up
+        counts = self.counts
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and not node.words and not node.children:
+                del path[depth - 1].children[key[depth - 1]]
+                continue
+            best = max((counts[word] for word in node.words), default=0)
+            for child in node.children.values():
+                if child.best > best:
+                    best = child.best
+            node.best = best
+
+    def node_for(self, prefix):
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def words_with_prefix(self, prefix):
+        node = self.node_for(prefix)
+        words = []
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            words.extend(node.words)
+            stack.extend(node.children.values())
+        return words
+
+    def most_used(self, prefix, limit):
+        # Words starting with prefix by descending count, then alphabetically.
+        # A node sorts before everything below it: its best is at least their
+        # counts and its key is a prefix of theirs.
+        node = self.node_for(prefix)
+        if node is None:
+            return []
+        counts = self.counts
+        heap = [(-node.best, prefix.lower(), 0, node)]
+        order = 1
+        words = []
+        while heap and len(words) < limit:
+            _, key, _, item = heapq.heappop(heap)
+            if type(item) is str:
+                words.append(item)
+                continue
+            for word in item.words:
+                heapq.heappush(heap, (-counts[word], word.lower(), order, word))
+                order += 1
+            for char, child in item.children.items():
+                heapq.heappush(heap, (-child.best, key + char, order, child))
+                order += 1
+        return words
+
+
+class CompletionIndex:
+    # Completion words of a document, kept up to date from the highlighter:
+    # each highlighted block hands over the words of its tokens, replacing
+    # those it had before. Words of deleted blocks are dropped by sweep().
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.tries = {
+            'tag': PrefixTrie(HTML_TAGS),
+            'attribute': PrefixTrie(HTML_ATTRIBUTES),
+            'class': PrefixTrie(),
+            'id': PrefixTrie(),
+        }
+        # "tag attribute" -> count
+        self.pairs = {}
+        # Block data whose words are counted
+        self.live = set()
+
+    def replace_block(self, old, new):
+        if old is not None and old in self.live:
+            self.live.discard(old)
+            self.count(old.words, -1)
+        if new.words:
+            self.live.add(new)
+            self.count(new.words, 1)
+
+    def sweep(self):
+        for data in [data for data in self.live if not shiboken6.isValid(data)]:
+            self.live.discard(data)
+            self.count(data.words, -1)
+
+    def count(self, words, delta):
+        pairs = self.pairs
+        tries = self.tries
+        for kind, word in words:
+            if kind == 'pair':
+                count = pairs.get(word, 0) + delta
+                if count > 0:
+                    pairs[word] = count
+                else:
+                    pairs.pop(word, None)
+            else:
+                tries[kind].add(word, delta)
+
+    def complete(self, kind, prefix, tag=None, limit=MAX_COMPLETIONS):
+        # Words starting with prefix, most used first. Attributes used on the
+        # same tag elsewhere in the document come before all others.
+        trie = self.tries[kind]
+        if kind == 'attribute' and tag:
+            # Few enough to rank them all
+            counts = trie.counts
+            pairs = self.pairs
+
+            def rank(word):
+                return -pairs.get(f"{tag} {word}", 0), -counts[word], word.lower()
+            words = heapq.nsmallest(limit + 1, trie.words_with_prefix(prefix), key=rank)
+        else:
+            words = trie.most_used(prefix, limit + 1)
+        return [word for word in words if word != prefix][:limit]
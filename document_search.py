@@ -0,0 +1,316 @@
+import re
+from PySide6.QtCore import QCoreApplication, QObject, QThread, QTimer, Signal
+from PySide6.QtGui import QColor, QTextCursor
+from PySide6.QtWidgets import QTextEdit
+from search_engine import MatchIndex, Utf16Mapper, find_matches, qt_position, replace_all
+
+BATCH_MATCHES = 20000
+RESTART_DELAY_MS = 200
+# Matches highlighted at once; only the visible ones are ever highlighted
+MAX_VISIBLE_MATCHES = 2000
+
+# Replacements changing more blocks than this are re-highlighted in the
+# background rather than inside the edit
+BACKGROUND_REPLACE_BLOCKS = 2000
+
+MATCH_COLOR = QColor(255, 200, 0, 110)
+CURRENT_MATCH_COLOR = QColor(255, 140, 0, 200)
+
+
+def document_snapshot(document):
+    # toRawText() keeps positions aligned with the document (toPlainText()
+    # replaces non-breaking spaces); block separators become newlines so
+    # ^ and $ work per line.
+    return document.toRawText().replace('\u2029', '\n')
+
+
+class SearchWorker(QThread):
+    # generation, starts, ends (Qt positions)
+    matches_found = Signal(int, object, object)
+    search_done = Signal(int)
+
+    def __init__(self, query, text, generation, candidates=None):
+        super().__init__()
+        self.query = query
+        self.text = text
+        self.generation = generation
+        self.candidates = candidates
+
+    def run(self):
+        pattern, text = self.query.compile_for(self.text)
+        to_qt = Utf16Mapper(text)
+        candidates = self.candidates
+        if candidates is not None and to_qt.astral:
+            candidates = [to_qt.to_python(position) for position in candidates]
+        starts = []
+        ends = []
+        for start, end in find_matches(pattern, text, candidates=candidates):
+            if to_qt.astral:
+                start, end = to_qt(start), to_qt(end)
+            starts.append(start)
+            ends.append(end)
+            if len(starts) == BATCH_MATCHES:
+                if self.isInterruptionRequested():
+                    return
+                self.matches_found.emit(self.generation, starts, ends)
+                starts = []
+                ends = []
+        if starts:
+            self.matches_found.emit(self.generation, starts, ends)
+        self.search_done.emit(self.generation)
+
+
+class DocumentSearch(QObject):
+    # Finds every match of a query in a snapshot of the editor's document on
+    # a worker thread and keeps their offsets in a MatchIndex. Matches in the
+    # viewport are highlighted; next/previous are bisections of the index.
+    # Edits to the document drop the matches and restart the search shortly
+    # afterwards.
+    results_changed = Signal()
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.query = None
+        self.pattern = None
+        self.error = None
+        self.index = MatchIndex()
+        self.complete = False
+        self.current = None
+        self.generation = 0
+        self.worker = None
+        self.retired = set()
+        # Direction of a find_next() waiting for the search to get further
+        self.pending_step = None
+        # Reused while the document is unchanged, e.g. as a query is typed
+        self.snapshot = None
+
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.timeout.connect(self.restart)
+
+        self.highlight_timer = QTimer(self)
+        self.highlight_timer.setSingleShot(True)
+        self.highlight_timer.setInterval(0)
+        self.highlight_timer.timeout.connect(self.update_highlights)
+
+        editor.verticalScrollBar().valueChanged.connect(self.highlight_timer.start)
+        editor.document().contentsChange.connect(self.handle_contents_change)
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def set_query(self, query):
+        previous, previous_complete = self.query, self.complete
+        candidates = None
+        if query.text and previous_complete and self.pattern is not None and query.extends(previous):
+            candidates = self.index.starts
+        self.query = query
+        self.pattern = None
+        self.error = None
+        if query.text:
+            try:
+                self.pattern = query.compile()
+            except re.error as e:
+                self.error = str(e)
+        self.start_search(candidates)
+
+    def clear(self):
+        self.snapshot = None
+        self.query = None
+        self.pattern = None
+        self.error = None
+        self.start_search()
+
+    def start_search(self, candidates=None):
+        self.stop()
+        self.restart_timer.stop()
+        self.generation += 1
+        self.index = MatchIndex()
+        self.current = None
+        self.pending_step = None
+        self.complete = self.pattern is None
+        if self.pattern is not None:
+            if self.snapshot is None:
+                self.snapshot = document_snapshot(self.editor.document())
+            self.worker = SearchWorker(self.query, self.snapshot, self.generation, candidates)
+            self.worker.matches_found.connect(self.handle_matches)
+            self.worker.search_done.connect(self.handle_done)
+            self.worker.start(QThread.LowPriority)
+        self.results_changed.emit()
+        self.update_highlights()
+
+    def restart(self):
+        if self.pattern is not None:
+            # A find_next() made since the edit is carried out by the new search
+            pending_step = self.pending_step
+            self.start_search()
+            self.pending_step = pending_step
+
+    def stop(self):
+        if self.worker is not None:
+            worker = self.worker
+            worker.matches_found.disconnect(self.handle_matches)
+            worker.search_done.disconnect(self.handle_done)
+            worker.requestInterruption()
+            self.retired.add(worker)
+            worker.finished.connect(lambda: self.retired.discard(worker))
+            self.worker = None
+
+    def shutdown(self):
+        self.stop()
+        for worker in list(self.retired):
+            worker.wait()
+
+    def handle_matches(self, generation, starts, ends):
+        if generation != self.generation:
+            return
+        self.index.extend(starts, ends)
+        if self.pending_step is not None:
+            self.find_next(self.pending_step)
+        self.results_changed.emit()
+        self.highlight_timer.start()
+
+    def handle_done(self, generation):
+        if generation != self.generation:
+            return
+        self.complete = True
+        self.worker = None
+        if self.pending_step is not None:
+            self.find_next(self.pending_step)
+        else:
+            # Pick up the match the cursor is on, e.g. after a restart
+            cursor = self.editor.textCursor()
+            self.current = self.index.index_of(cursor.selectionStart(), cursor.selectionEnd())
+        self.results_changed.emit()
+        self.highlight_timer.start()
+
+    def handle_contents_change(self, position, removed, added):
+        if self.editor.is_refreshing_formats():
+            return
+        self.snapshot = None
+        if self.query is None:
+            return
+        self.stop()
+        # The offsets found so far are stale until the search restarts, so
+        # find_next() waits for it rather than selecting them
+        self.index = MatchIndex()
+        self.current = None
+        self.complete = self.pattern is None
+        self.results_changed.emit()
+        self.highlight_timer.start()
+        self.restart_timer.start(RESTART_DELAY_MS)
+
+    def find_next(self, backward=False):
+        # Selects the next match after the cursor, wrapping around. While the
+        # search is still running and has not got past the cursor, the step
+        # is carried out once it has. Returns False if there is no match.
+        self.pending_step = None
+        if self.pattern is None:
+            return False
+        cursor = self.editor.textCursor()
+        position = cursor.selectionStart() if backward else cursor.selectionEnd()
+        index = self.index.previous_before(position) if backward else self.index.next_after(position)
+        if not self.complete and (index is None or backward and self.index.starts[-1] < position):
+            self.pending_step = backward
+            return True
+        if not self.index:
+            return False
+        if index is None:
+            index = len(self.index) - 1 if backward else 0
+        self.select(index)
+        return True
+
+    def select(self, index):
+        self.current = index
+        start, end = self.index.span(index)
+        cursor = self.editor.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.results_changed.emit()
+        self.update_highlights()
+
+    def replace_current(self, replacement):
+        # Replaces the selection if it is a match of the query in the
+        # document as it is now; regex replacements may refer to groups
+        if self.pattern is None:
+            return False
+        cursor = self.editor.textCursor()
+        start, end = cursor.selectionStart(), cursor.selectionEnd()
+        if start == end:
+            return False
+        if self.snapshot is None:
+            self.snapshot = document_snapshot(self.editor.document())
+        to_python = Utf16Mapper(self.snapshot).to_python
+        match = self.pattern.match(self.snapshot, to_python(start))
+        if match is None or match.end() != to_python(end):
+            return False
+        if self.query.regex:
+            try:
+                replacement = match.expand(replacement)
+            except re.error as e:
+                self.error = str(e)
+                self.results_changed.emit()
+                return False
+        cursor.insertText(replacement)
+        return True
+
+    def replace_all(self, query, replacement):
+        # Replaces every match with a single edit to the smallest span that
+        # changes, so it is one undo step and the document is re-laid out and
+        # re-highlighted once. Returns the number of replacements, or None if
+        # the pattern or the replacement is invalid.
+        if not query.text:
+            return 0
+        if self.snapshot is None:
+            self.snapshot = document_snapshot(self.editor.document())
+        text = self.snapshot
+        try:
+            start, end, new_text, count = replace_all(query.compile(), text, replacement, query.regex)
+        except re.error as e:
+            self.error = str(e)
+            self.results_changed.emit()
+            return None
+        if start == end and not new_text:
+            return count
+
+        document = self.editor.document()
+        cursor = QTextCursor(document)
+        cursor.setPosition(qt_position(text, start))
+        if new_text.count('\n') > BACKGROUND_REPLACE_BLOCKS or text.count('\n', start, end) > BACKGROUND_REPLACE_BLOCKS:
+            self.editor.background_highlighter.defer_from(cursor.blockNumber())
+        cursor.setPosition(qt_position(text, end), QTextCursor.KeepAnchor)
+        cursor.beginEditBlock()
+        cursor.insertText(new_text)
+        cursor.endEditBlock()
+        self.editor.background_highlighter.highlight_viewport()
+        return count
+
+    def status_text(self):
+        if self.error is not None:
+            return f"Invalid pattern: {self.error}"
+        if self.pattern is None:
+            return ""
+        total = f"{len(self.index)}" if self.complete else f"{len(self.index)}+"
+        if not self.index:
+            return "No matches" if self.complete else "Searching..."
+        if self.current is None:
+            return f"{total} matches"
+        return f"{self.current + 1} of {total}"
+
+    def update_highlights(self):
+        selections = []
+        if self.pattern is not None and self.index:
+            document = self.editor.document()
+            first, last = self.editor.visible_block_range()
+            first_position = document.findBlockByNumber(first).position()
+            last_block = document.findBlockByNumber(last)
+            low, high = self.index.range_between(first_position, last_block.position() + last_block.length())
+            for index in range(low, min(high, low + MAX_VISIBLE_MATCHES)):
+                selection = QTextEdit.ExtraSelection()
+                selection.format.setBackground(CURRENT_MATCH_COLOR if index == self.current else MATCH_COLOR)
+                selection.cursor = QTextCursor(document)
+                start, end = self.index.span(index)
+                selection.cursor.setPosition(start)
+                selection.cursor.setPosition(end, QTextCursor.KeepAnchor)
+                selections.append(selection)
+        self.editor.set_extra_selections('search', selections)
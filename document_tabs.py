@@ -0,0 +1,473 @@
+import os
+import zlib
+from collections import OrderedDict
+from PySide6.QtWidgets import QTabWidget, QWidget, QVBoxLayout, QMessageBox
+from PySide6.QtCore import QCoreApplication, QThread, QTimer, Signal
+from PySide6.QtGui import QTextCursor
+from editor import CodeEditor
+from paged_view import PagedFileView
+from file_loader import FileLoader
+from file_saver import SaveWorker
+from autosave import AutosaveJournal, JournalWriter, read_journal
+from document_search import document_snapshot
+from file_watcher import DiskDiffWorker, FileWatcher, apply_line_edits
+
+# Estimated memory of a loaded document: the text, its highlight formats and
+# layouts, and the tag and completion indexes. Measured on typical HTML.
+BYTES_PER_CHAR = 40
+BYTES_PER_BLOCK = 512
+# Memory the loaded documents may take before background tabs are unloaded
+MEMORY_BUDGET_MB = 512
+# zlib level for the text of unloaded documents with unsaved edits
+SNAPSHOT_COMPRESSION = 1
+
+
+class DocumentPage(QWidget):
+    # One tab: an editable document, or a huge file in the read-only paged
+    # view. The editor, with its highlighting, completion, indexes and
+    # journal, is created when the tab is first shown, and is dropped again
+    # by unload() while the tab is in the background. An unloaded tab keeps
+    # its path, cursor and scroll position, and its text compressed only if
+    # it has unsaved edits; otherwise the file is read again when shown.
+    # When the file changes on disk, the document is diffed against it and
+    # only the lines that differ are replaced.
+    status_message = Signal(str, int)
+    load_progress = Signal(int)
+    loading_changed = Signal()
+    load_failed = Signal(str)
+    # The path or the modified state changed
+    title_changed = Signal()
+    editor_created = Signal(object)
+
+    def __init__(self, journal_writer, file_watcher, path=None, encoding='utf-8', parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.journal_writer = journal_writer
+        self.file_watcher = file_watcher
+        self.path = path
+        self.encoding = encoding
+        self.editor = None
+        self.journal = None
+        self.paged_view = None
+        self.loader = None
+        self.load_error = None
+        self.loaded_chunks = 0
+        # Set while reading the file again for a tab that was unloaded
+        self.restoring = False
+        # (line, column) to show once the file is loaded
+        self.pending_location = None
+        self.saver = None
+        self.pending_save = None
+        self.saved_modified = False
+        # Kept while unloaded: cursor (anchor, position), scroll bar values,
+        # and for unsaved edits the compressed text and the journal state
+        self.cursor = None
+        self.scroll = None
+        self.modified = False
+        self.snapshot = None
+        self.journal_state = None
+        # SHA-1 of the file as last loaded or saved
+        self.disk_sha1 = None
+        # Set when the file changed on disk while it could not be checked,
+        # e.g. during a save; it is checked once that is done
+        self.disk_changed = False
+        self.disk_diff = None
+        # Set while asking whether to reload over unsaved edits
+        self.asking_reload = False
+        # Edits to the document, to tell whether a diff is still current
+        self.edits = 0
+        self.diffed_edits = 0
+        if path is not None:
+            file_watcher.watch(path)
+
+    def title(self):
+        name = os.path.basename(self.path) if self.path else "Untitled"
+        return name + '*' if self.is_modified() else name
+
+    def is_modified(self):
+        if self.editor is not None:
+            return self.editor.document().isModified()
+        return self.modified
+
+    def is_pristine(self):
+        # An untitled tab nothing was typed into
+        return (self.path is None and not self.is_modified()
+                and (self.editor is None or self.editor.document().isEmpty()))
+
+    def open_paged(self):
+        # Shows the file read-only in the paged view; raises if it cannot be opened
+        paged_view = PagedFileView()
+        try:
+            paged_view.open(self.path, self.encoding)
+        except Exception:
+            paged_view.deleteLater()
+            raise
+        self.paged_view = paged_view
+        self.layout().addWidget(paged_view)
+
+    def activate(self):
+        # Called whenever the tab is shown
+        if self.editor is not None or self.paged_view is not None:
+            return
+        self.create_editor()
+        if self.snapshot is not None:
+            self.restore_snapshot()
+            if self.disk_changed:
+                self.check_disk()
+        elif self.path is not None:
+            self.start_loading(restoring=self.cursor is not None)
+
+    def create_editor(self):
+        self.editor = CodeEditor()
+        self.layout().addWidget(self.editor)
+        self.journal = AutosaveJournal(self.editor, self.journal_writer)
+        self.editor.background_highlighter.path = self.path
+        self.editor.document().modificationChanged.connect(self.title_changed)
+        self.editor.document().contentsChange.connect(self.count_edit)
+        self.editor_created.emit(self.editor)
+
+    def count_edit(self):
+        if not self.editor.is_refreshing_formats():
+            self.edits += 1
+
+    def estimated_memory(self):
+        if self.editor is None:
+            return len(self.snapshot or b'')
+        document = self.editor.document()
+        return document.characterCount() * BYTES_PER_CHAR + document.blockCount() * BYTES_PER_BLOCK
+
+    def can_unload(self):
+        return (self.editor is not None and self.loader is None and self.saver is None
+                and self.disk_diff is None)
+
+    def unload(self):
+        # Drops the editor with its document and highlighting; activate()
+        # brings it back. Undo history and folds are not kept.
+        editor = self.editor
+        cursor = editor.textCursor()
+        self.cursor = (cursor.anchor(), cursor.position())
+        self.scroll = (editor.horizontalScrollBar().value(), editor.verticalScrollBar().value())
+        self.modified = editor.document().isModified()
+        journal_state = self.journal.suspend()
+        if self.modified or self.path is None:
+            self.snapshot = zlib.compress(editor.toPlainText().encode('utf-8', 'surrogatepass'),
+                                          SNAPSHOT_COMPRESSION)
+            self.journal_state = journal_state
+        self.journal = None
+        self.editor = None
+        editor.shutdown()
+        editor.deleteLater()
+
+    def restore_snapshot(self):
+        text = zlib.decompress(self.snapshot).decode('utf-8', 'surrogatepass')
+        self.snapshot = None
+        self.editor.setPlainText(text, in_background=True)
+        self.editor.document().setModified(self.modified)
+        # The journal carries on where it stopped; the text is the same
+        self.journal.resume(self.journal_state)
+        self.journal_state = None
+        self.restore_view()
+
+    def restore_view(self):
+        if self.cursor is None:
+            return
+        end = self.editor.document().characterCount() - 1
+        anchor, position = self.cursor
+        cursor = self.editor.textCursor()
+        cursor.setPosition(min(anchor, end))
+        cursor.setPosition(min(position, end), QTextCursor.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.editor.horizontalScrollBar().setValue(self.scroll[0])
+        self.editor.verticalScrollBar().setValue(self.scroll[1])
+        self.cursor = self.scroll = None
+
+    def start_loading(self, restoring=False):
+        self.restoring = restoring
+        self.loader = FileLoader(self.path, self.encoding)
+        self.loader.chunk_loaded.connect(self.handle_chunk_loaded)
+        self.loader.progress.connect(self.load_progress)
+        self.loader.failed.connect(self.handle_load_failed)
+        self.loader.finished.connect(self.handle_load_finished)
+        self.loaded_chunks = 0
+        self.load_error = None
+        self.loading_changed.emit()
+        if not restoring:
+            self.status_message.emit(f"Loading {self.path}...", 0)
+        self.loader.start()
+
+    def handle_chunk_loaded(self, text):
+        if self.loader is None or self.sender() is not self.loader:
+            return
+        if self.loaded_chunks == 0:
+            self.editor.begin_stream(text, self.loader.size, in_background=self.restoring)
+        else:
+            self.editor.append_stream(text)
+        self.loaded_chunks += 1
+        self.loader.credits.release()
+
+    def handle_load_failed(self, message):
+        if self.sender() is self.loader:
+            self.load_error = message
+
+    def handle_load_finished(self):
+        loader = self.loader
+        if loader is None or self.sender() is not loader:
+            return
+        self.loader = None
+        self.loading_changed.emit()
+        if self.load_error is not None:
+            self.load_failed.emit(self.load_error)
+            return
+        self.editor.end_stream()
+        self.encoding = loader.encoding
+        self.disk_sha1 = loader.sha1
+        if self.restoring:
+            # The file was open before without unsaved edits
+            self.journal.attach(loader.path, loader.sha1, loader.encoding)
+            self.restore_view()
+        else:
+            self.status_message.emit(f"Opened {loader.path} ({loader.encoding})", 5000)
+            # Unsaved edits from a session that did not save are replayed from the journal
+            records = read_journal(loader.path, loader.sha1)
+            self.journal.attach(loader.path, loader.sha1, loader.encoding)
+            if records:
+                answer = QMessageBox.question(
+                    self, "Recover", "This file has unsaved changes from a previous session. Recover them?"
+                )
+                if answer == QMessageBox.Yes:
+                    self.journal.recover(records)
+
+        location, self.pending_location = self.pending_location, None
+        if location is not None:
+            self.editor.go_to(*location)
+        if self.disk_changed:
+            self.check_disk()
+
+    def cancel_loading(self):
+        loader = self.loader
+        if loader is None:
+            return
+        self.loader = None
+        loader.requestInterruption()
+        loader.wait()
+        self.loading_changed.emit()
+
+    def save(self, path):
+        # Writes a snapshot of the document on a worker thread; typing carries
+        # on meanwhile. A save requested while one is running follows it.
+        if self.loader is not None:
+            self.status_message.emit("Wait for the file to finish loading before saving", 5000)
+            return
+        if self.saver is not None:
+            self.pending_save = path
+            return
+        self.journal.begin_snapshot()
+        self.saver = SaveWorker(path, self.editor.toPlainText(), self.encoding)
+        self.saver.saved.connect(self.handle_saved)
+        self.saver.failed.connect(self.handle_save_failed)
+        self.saver.finished.connect(self.handle_save_finished)
+        # Edits made from here on mark the document modified again
+        self.saved_modified = self.editor.document().isModified()
+        self.editor.document().setModified(False)
+        self.status_message.emit(f"Saving {path}...", 0)
+        self.saver.start()
+
+    def handle_saved(self, path, sha1):
+        if path != self.path:
+            if self.path is not None:
+                self.file_watcher.unwatch(self.path)
+            self.file_watcher.watch(path)
+        self.path = path
+        self.editor.background_highlighter.path = path
+        self.disk_sha1 = sha1
+        self.journal.checkpoint(path, sha1, self.encoding)
+        self.title_changed.emit()
+        self.status_message.emit(f"Saved {path}", 5000)
+
+    def handle_save_failed(self, path, message):
+        self.journal.abandon_snapshot()
+        if self.saved_modified:
+            self.editor.document().setModified(True)
+        self.status_message.emit("", 0)
+        QMessageBox.warning(self, "Error", f"Could not save file: {message}")
+
+    def handle_save_finished(self):
+        self.saver = None
+        if self.pending_save is not None:
+            path, self.pending_save = self.pending_save, None
+            self.save(path)
+        elif self.disk_changed:
+            self.check_disk()
+
+    def check_disk(self):
+        # Called when the file changed on disk. The file is read and diffed
+        # against the document on a worker thread.
+        if self.path is None or self.paged_view is not None:
+            return
+        if self.editor is None:
+            # An unloaded tab without unsaved edits reads the file when shown
+            self.disk_changed = self.snapshot is not None
+            return
+        if (self.loader is not None or self.saver is not None or self.disk_diff is not None
+                or self.asking_reload):
+            self.disk_changed = True
+            return
+        self.disk_changed = False
+        self.diffed_edits = self.edits
+        self.disk_diff = DiskDiffWorker(self.path, self.encoding, document_snapshot(self.editor.document()),
+                                        self.disk_sha1)
+        self.disk_diff.diffed.connect(self.handle_disk_diffed)
+        self.disk_diff.finished.connect(self.handle_disk_diff_finished)
+        self.disk_diff.start(QThread.LowPriority)
+
+    def handle_disk_diffed(self, sha1, line_count, edits):
+        if self.sender() is not self.disk_diff or self.editor is None or edits is None:
+            return
+        if self.edits != self.diffed_edits:
+            # The document changed meanwhile; diff again
+            self.disk_changed = True
+            return
+        if self.editor.document().isModified() and edits:
+            self.asking_reload = True
+            answer = QMessageBox.question(
+                self, "File Changed",
+                f"{os.path.basename(self.path)} has changed on disk. Reload it and discard your unsaved changes?"
+            )
+            self.asking_reload = False
+            if self.disk_changed and self.disk_diff is None:
+                # It changed again while the question was open
+                QTimer.singleShot(0, self.check_disk)
+            if answer != QMessageBox.Yes or self.edits != self.diffed_edits:
+                # The document is now unsaved changes to the new file
+                self.disk_sha1 = sha1
+                self.journal.rebase(self.path, sha1, self.encoding, line_count)
+                return
+        self.disk_sha1 = sha1
+        if edits:
+            apply_line_edits(self.editor, edits)
+            self.status_message.emit(f"Reloaded {self.path}, which changed on disk", 5000)
+        self.editor.document().setModified(False)
+        self.journal.attach(self.path, sha1, self.encoding)
+
+    def handle_disk_diff_finished(self):
+        if self.sender() is not self.disk_diff:
+            return
+        self.disk_diff = None
+        if self.disk_changed and not self.asking_reload:
+            self.check_disk()
+
+    def shutdown(self):
+        # The tab is closing or the application quits; unsaved edits stay
+        # in the journal for recovery
+        self.cancel_loading()
+        if self.saver is not None:
+            self.saver.wait()
+        if self.disk_diff is not None:
+            self.disk_diff.wait()
+        if self.path is not None:
+            self.file_watcher.unwatch(self.path)
+        if self.journal is not None:
+            self.journal.detach()
+        if self.editor is not None:
+            self.editor.shutdown()
+        if self.paged_view is not None:
+            self.paged_view.close_file()
+
+
+class DocumentTabs(QTabWidget):
+    # Open documents, one per tab. Once the loaded documents are estimated
+    # to take more than memory_budget bytes, the tabs shown least recently
+    # are unloaded until the rest fit, so memory follows the documents in
+    # use rather than the number of tabs. The journals share one writer.
+    # Emitted before the page is added, so its signals can be connected first
+    page_added = Signal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setTabsClosable(True)
+        self.setMovable(True)
+        self.setDocumentMode(True)
+        self.memory_budget = MEMORY_BUDGET_MB * 1024 * 1024
+        # Pages that have been shown, least recently first
+        self.recent = OrderedDict()
+        self.journal_writer = JournalWriter()
+        self.journal_writer.start(QThread.LowPriority)
+        self.file_watcher = FileWatcher(self)
+        self.file_watcher.file_changed.connect(self.handle_file_changed)
+        self.currentChanged.connect(self.handle_current_changed)
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def pages(self):
+        return [self.widget(index) for index in range(self.count())]
+
+    def editors(self):
+        return [page.editor for page in self.pages() if page.editor is not None]
+
+    def find_page(self, path):
+        path = os.path.abspath(path)
+        for page in self.pages():
+            if page.path is not None and os.path.abspath(page.path) == path:
+                return page
+        return None
+
+    def add_page(self, path=None, encoding='utf-8'):
+        # The page is not loaded until it is first shown
+        page = DocumentPage(self.journal_writer, self.file_watcher, path, encoding)
+        page.title_changed.connect(self.update_tab)
+        page.loading_changed.connect(self.unload_idle)
+        self.page_added.emit(page)
+        index = self.addTab(page, page.title())
+        self.setTabToolTip(index, path or "")
+        return page
+
+    def close_page(self, page):
+        page.shutdown()
+        self.recent.pop(page, None)
+        self.removeTab(self.indexOf(page))
+        page.deleteLater()
+
+    def update_tab(self):
+        page = self.sender()
+        index = self.indexOf(page)
+        if index >= 0:
+            self.setTabText(index, page.title())
+            self.setTabToolTip(index, page.path or "")
+
+    def handle_file_changed(self, path):
+        for page in self.pages():
+            if page.path is not None and os.path.abspath(page.path) == path:
+                page.check_disk()
+
+    def handle_current_changed(self, index):
+        page = self.widget(index)
+        if page is None:
+            return
+        self.recent.pop(page, None)
+        self.recent[page] = None
+        page.activate()
+        self.unload_idle()
+
+    def memory_used(self):
+        return sum(page.estimated_memory() for page in self.recent)
+
+    def unload_idle(self):
+        used = self.memory_used()
+        current = self.currentWidget()
+        for page in list(self.recent):
+            if used <= self.memory_budget:
+                break
+            if page is not current and page.can_unload():
+                used -= page.estimated_memory()
+                page.unload()
+                used += page.estimated_memory()
+
+    def set_memory_budget(self, budget):
+        self.memory_budget = budget
+        self.unload_idle()
+
+    def shutdown(self):
+        for page in self.pages():
+            page.shutdown()
+        self.journal_writer.stop()
@@ -0,0 +1,190 @@
+import bisect
+import re
+from html import unescape
+from text_utils import common_affixes
+
+# One match per markup token. Raw-text elements are matched whole, and tags
+# never run past the next '<', so a token that ends before an edit is the
+# same in the old and the new text.
+TOKEN_RE = re.compile(r'''
+    <!--.*?(?:-->|\Z)
+  | <!\[CDATA\[.*?(?:\]\]>|\Z)
+  | <[!?][^<>]*>?
+  | <(script|style|textarea|title)\b[^<>]*>.*?(?:</\1\s*>|\Z)
+  | </([a-zA-Z][^\s/<>]*)[^<>]*>
+  | <([a-zA-Z][^\s/<>]*)[^<>]*?(/?)>
+''', re.S | re.I | re.X)
+
+_MARKUP_RE = re.compile(r'<!--.*?(?:-->|\Z)|<[^<>]*>', re.S)
+
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+))
+# Changes inside these need a full reload to take effect
+RELOAD_ELEMENTS = frozenset(('html', 'head'))
+
+CHECKPOINT_TOKENS = 128
+
+
+def text_content(html):
+    # Whitespace-free text of an HTML fragment, as compared with the DOM's
+    # textContent to check a patch is applied to the right element
+    return ''.join(unescape(_MARKUP_RE.sub('', html)).split())
+
+
+class Patch:
+    # Replace the contents of the nth element called name (in document
+    # order). chain holds the names of its ancestors, outermost first.
+    def __init__(self, name, nth, chain, inner_html, old_text):
+        self.name = name
+        self.nth = nth
+        self.chain = chain
+        self.inner_html = inner_html
+        self.old_text = old_text
+
+
+class _ScanState:
+    def __init__(self, stack=(), counts=None):
+        # Open elements as (name, start, content_start, nth)
+        self.stack = list(stack)
+        self.counts = dict(counts or {})
+
+    def copy(self):
+        return _ScanState(self.stack, self.counts)
+
+    def apply(self, m):
+        raw, end_name, start_name, self_closing = m.groups()
+        if raw:
+            name = raw.lower()
+            self.counts[name] = self.counts.get(name, 0) + 1
+        elif end_name:
+            name = end_name.lower()
+            for depth in range(len(self.stack) - 1, -1, -1):
+                if self.stack[depth][0] == name:
+                    del self.stack[depth:]
+                    return depth
+        elif start_name:
+            name = start_name.lower()
+            nth = self.counts.get(name, 0)
+            self.counts[name] = nth + 1
+            if not self_closing and name not in VOID_ELEMENTS:
+                self.stack.append((name, m.start(), m.end(), nth))
+        return None
+
+
+class DomPatcher:
+    # Works out which element of the previously rendered page an edit falls
+    # in, so only that element's contents need to be replaced. The tag scan
+    # is resumed from checkpoints left by earlier scans, so the work done per
+    # update is proportional to the size of the edited element rather than
+    # the document.
+
+    def __init__(self, html=None):
+        self.reset(html)
+
+    def reset(self, html):
+        self.html = html
+        # Parallel lists: resume position and scan state at that position
+        self.checkpoint_pos = [0]
+        self.checkpoint_state = [_ScanState()]
+
+    def truncate(self, position):
+        keep = bisect.bisect_right(self.checkpoint_pos, position)
+        del self.checkpoint_pos[keep:]
+        del self.checkpoint_state[keep:]
+
+    def scan(self, text, state, matches, tokens, stop):
+        # Applies tokens until stop(match) is true; returns that match or None
+        for m in matches:
+            if stop(m):
+                return m
+            state.apply(m)
+            tokens[0] += 1
+            if tokens[0] % CHECKPOINT_TOKENS == 0 and m.end() > self.checkpoint_pos[-1]:
+                self.checkpoint_pos.append(m.end())
+                self.checkpoint_state.append(state.copy())
+        return None
+
+    def patch_for(self, new):
+        # Returns a Patch turning the previous text into new, or None when
+        # the page has to be reloaded. Either way new becomes the previous text.
+        old = self.html
+        self.html = new
+        if old is None:
+            self.reset(new)
+            return None
+
+        prefix, suffix = common_affixes(old, new)
+        old_end = len(old) - suffix
+        new_end = len(new) - suffix
+        self.truncate(prefix)
+
+        index = len(self.checkpoint_pos) - 1
+        state = self.checkpoint_state[index].copy()
+        matches = TOKEN_RE.finditer(new, self.checkpoint_pos[index])
+        tokens = [0]
+        first_changed = self.scan(new, state, matches, tokens, lambda m: m.end() > prefix)
+        start = min(prefix, first_changed.start()) if first_changed else prefix
+        self.truncate(start)
+        before = state.copy()
+
+        # Scan the edited region in both texts; past it they must tokenize
+        # the same way again.
+        if first_changed is not None and first_changed.start() < new_end:
+            state.apply(first_changed)
+            after_new = self.scan(new, state, matches, tokens, lambda m: m.start() >= new_end)
+        else:
+            after_new = first_changed
+        old_state = before.copy()
+        old_matches = TOKEN_RE.finditer(old, start)
+        after_old = None
+        for m in old_matches:
+            if m.start() >= old_end:
+                after_old = m
+                break
+            old_state.apply(m)
+        resume_new = after_new.start() if after_new else len(new)
+        resume_old = after_old.start() if after_old else len(old)
+        if len(new) - resume_new != len(old) - resume_old:
+            return None
+
+        common = 0
+        for new_item, old_item in zip(state.stack, old_state.stack):
+            if new_item != old_item or new_item[1] >= start:
+                break
+            common += 1
+        if common == 0:
+            return None
+        if [item[0] for item in state.stack[common:]] != [item[0] for item in old_state.stack[common:]]:
+            return None
+        name, _, content_start, nth = state.stack[common - 1]
+        if name in RELOAD_ELEMENTS:
+            return None
+
+        # Find where the enclosing element closes
+        close = after_new
+        if close is not None and not self.closes(state, close, common):
+            state.apply(close)
+            close = self.scan(new, state, matches, tokens, lambda m: self.closes(state, m, common))
+        if close is None:
+            return None
+
+        inner_html = new[content_start:close.start()]
+        if re.search(r'<script\b', inner_html, re.I):
+            # Scripts inserted through innerHTML do not run
+            return None
+        old_close = close.start() - len(new) + len(old)
+        chain = [item[0] for item in state.stack[:common - 1]]
+        return Patch(name, nth, chain, inner_html, text_content(old[content_start:old_close]))
+
+    @staticmethod
+    def closes(state, m, depth):
+        # True if m is an end tag that closes the open element at depth - 1
+        if m.group(2) is None:
+            return False
+        name = m.group(2).lower()
+        for index in range(len(state.stack) - 1, -1, -1):
+            if state.stack[index][0] == name:
+                return index < depth
+        return False
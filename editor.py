@@ -1,8 +1,31 @@
-from PySide6.QtWidgets import QPlainTextEdit, QTextEdit, QCompleter, QMenu
-from PySide6.QtCore import Qt, QRect, QSize, QStringListModel, QTimer, Signal
-from PySide6.QtGui import QColor, QTextFormat, QPainter, QTextCursor, QAction
+from PySide6.QtWidgets import QPlainTextEdit, QTextEdit, QCompleter, QMenu, QToolTip
+from PySide6.QtCore import Qt, QRect, QSize, QStringListModel, QTimer, Signal, QPoint, QEvent
+from PySide6.QtGui import QColor, QTextFormat, QPainter, QTextCursor, QAction, QPolygon
 from highlighter import Highlighter
+from background_highlighter import BackgroundHighlighter, LARGE_DOCUMENT_CHARS
 from line_number_area import LineNumberArea
+from document_search import DocumentSearch
+from search_engine import qt_position
+from snippets import SNIPPETS
+from completion import CompletionIndex, completion_context
+from tag_index import TagIndex
+from multi_cursor import MultiCursor
+from validation import DocumentValidation, severity_color
+from minimap import Minimap, MINIMAP_WIDTH
+from tracing import traced
+
+# Idle time after a keystroke before the completion popup opens
+COMPLETION_DELAY_MS = 150
+# Idle time after a deletion before words of deleted blocks are dropped
+COMPLETION_SWEEP_MS = 1000
+# Typed characters that may start or continue a completion
+COMPLETION_CHARS = set('<-_:#"\' ')
+# Width of the fold markers right of the line numbers
+FOLD_MARKER_WIDTH = 12
+# Width of the error markers at the left edge of the gutter
+DIAGNOSTIC_MARKER_WIDTH = 3
+TAG_MATCH_COLOR = QColor(Qt.cyan).lighter(150)
+TAG_MISMATCH_COLOR = QColor(Qt.red).lighter(160)
 
 class CodeEditor(QPlainTextEdit):
     # Define a custom signal to emit when text changes for preview
@@ -11,74 +34,127 @@ class CodeEditor(QPlainTextEdit):
     def __init__(self, parent=None):  
         super().__init__(parent) 
         self.line_number_area = LineNumberArea(self)
+        # Extra selections are kept in named layers (current line, search
+        # matches, ...) so each feature can replace its own
+        self.extra_selection_layers = {'current_line': []}
+        # Number shown for the first block; the paged view shows a window of a file
+        self.first_line_number = 1
+        # Fold markers in the gutter; the paged view, which only holds a
+        # window of a file, turns them off
+        self.folding = True
+        # Left and right viewport margins: the gutter and the minimap
+        self.side_margins = None
 
         # Connect signals
         self.blockCountChanged.connect(self.update_line_number_area_width)
         self.updateRequest.connect(self.update_line_number_area)
         self.cursorPositionChanged.connect(self.highlight_current_line)
+        self.cursorPositionChanged.connect(self.handle_cursor_moved)
         self.textChanged.connect(self.handle_text_changed)
 
-        # Initialize line number area
-        self.update_line_number_area_width(0)
         self.highlight_current_line()
 
         # Initialize Syntax Highlighter with default theme
         self.current_theme = 'dark'
+        # Element structure behind folding, tag matching and the outline. It
+        # is created first so it sees each edit before the highlighter does.
+        self.tag_index = TagIndex(self)
         self.highlighter = Highlighter(self.document(), 'html', theme=self.current_theme)
+        self.highlighter.tag_index = self.tag_index
+        # Created after the highlighter, so edits reach it once re-highlighted
+        self.minimap = Minimap(self)
+        self.update_line_number_area_width(0)
+        self.background_highlighter = BackgroundHighlighter(self)
+        self.search = DocumentSearch(self)
+        # Errors found by the validator process, underlined and marked in the gutter
+        self.validation = DocumentValidation(self)
+        self.validation.changed.connect(self.line_number_area.update)
+        self.multi_cursor = MultiCursor(self)
 
-        # Initialize Auto-Completion
-        self.completer = QCompleter(self)
+        # Initialize Auto-Completion. Words come from the document as the
+        # highlighter lexes it; the popup opens only after typing pauses.
+        self.completion_index = CompletionIndex()
+        self.highlighter.completion_index = self.completion_index
+        self.completion_model = QStringListModel(self)
+        self.completer = QCompleter(self.completion_model, self)
         self.completer.setWidget(self)
         self.completer.setCompletionMode(QCompleter.PopupCompletion)
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.completer.activated.connect(self.insert_completion)
+        # Set while a key press edits the text, so other edits (paste,
+        # snippets, Replace All) never open the popup
+        self.typing = False
 
-        # List of HTML tags and attributes
-        html_keywords = [
-            'html', 'head', 'title', 'base', 'link', 'meta', 'style', 'script', 'noscript',
-            'body', 'section', 'nav', 'article', 'aside', 'h1', 'h2', 'h3', 'h4', 'h5',
-            'h6', 'header', 'footer', 'address', 'main', 'p', 'hr', 'pre', 'blockquote',
-            'ol', 'ul', 'li', 'dl', 'dt', 'dd', 'figure', 'figcaption', 'div', 'a', 'em',
-            'strong', 'small', 's', 'cite', 'q', 'dfn', 'abbr', 'data', 'time', 'code',
-            'var', 'samp', 'kbd', 'sub', 'sup', 'i', 'b', 'u', 'mark', 'ruby', 'rt', 'rp',
-            'bdi', 'bdo', 'span', 'br', 'wbr', 'ins', 'del', 'picture', 'source', 'img',
-            'iframe', 'embed', 'object', 'param', 'video', 'audio', 'track', 'map', 'area',
-            'table', 'caption', 'colgroup', 'col', 'tbody', 'thead', 'tfoot', 'tr', 'td',
-            'th', 'form', 'fieldset', 'legend', 'label', 'input', 'button', 'select',
-            'datalist', 'optgroup', 'option', 'textarea', 'keygen', 'output', 'progress',
-            'meter', 'details', 'summary', 'menuitem', 'menu'
-        ]
-        self.model = QStringListModel()
-        self.model.setStringList(html_keywords)
-        self.completer.setModel(self.model)
-
-        # Define Snippets
-        self.snippets = {
-            'html': "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n    <meta charset=\"UTF-8\">\n    <meta http-equiv=\"X-UA-Compatible\" content=\"IE=edge\">\n    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">\n    <title>Document</title>\n</head>\n<body>\n    \n</body>\n</html>",
-            'table': "<table>\n    <tr>\n        <th>Header 1</th>\n        <th>Header 2</th>\n    </tr>\n    <tr>\n        <td>Data 1</td>\n        <td>Data 2</td>\n    </tr>\n</table>",
-            'div': "<div>\n    \n</div>",
-            # Add more snippets as needed
-        }
-
-        # Initialize Timer for Debouncing Preview Updates
-        self.preview_timer = QTimer()
-        self.preview_timer.setSingleShot(True)
-        self.preview_timer.timeout.connect(self.emit_preview)
+        self.completion_timer = QTimer(self)
+        self.completion_timer.setSingleShot(True)
+        self.completion_timer.setInterval(COMPLETION_DELAY_MS)
+        self.completion_timer.timeout.connect(self.update_completion)
 
-    def handle_text_changed(self):
-        cursor = self.textCursor()
-        cursor.select(QTextCursor.WordUnderCursor) 
-        current_word = cursor.selectedText()
-        if current_word:
-            self.completer.complete()
+        self.completion_sweep_timer = QTimer(self)
+        self.completion_sweep_timer.setSingleShot(True)
+        self.completion_sweep_timer.setInterval(COMPLETION_SWEEP_MS)
+        self.completion_sweep_timer.timeout.connect(self.completion_index.sweep)
+        self.document().contentsChange.connect(self.handle_contents_change)
+
+        self.snippets = dict(SNIPPETS)
+
+    def setPlainText(self, text, in_background=False):
+        # Very large documents are highlighted viewport-first in the
+        # background. in_background does so whatever the size, for text that
+        # should show at once, like a tab being shown again.
+        self.prepare_highlighting(BackgroundHighlighter.is_large(text), in_background)
+        self.multi_cursor.clear()
+        super().setPlainText(text)
+        self.background_highlighter.start()
 
-        # Start/restart the timer for preview update
-        self.preview_timer.start(300)  # 300 ms delay
+    def begin_stream(self, text, total_size, in_background=False):
+        # Shows the first chunk of a file that is still loading; the rest is
+        # added with append_stream() and end_stream() re-enables editing.
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.prepare_highlighting(
+            total_size > LARGE_DOCUMENT_CHARS or BackgroundHighlighter.is_large(text), in_background)
+        self.multi_cursor.clear()
+        super().setPlainText(text)
+        self.background_highlighter.start()
 
-    def emit_preview(self):
-        # Emit the custom signal
+    def prepare_highlighting(self, large, in_background):
+        self.background_highlighter.set_enabled(large)
+        if in_background:
+            # Until the background pass has caught up
+            self.background_highlighter.defer_from(0)
+        self.completion_index.clear()
+
+    def append_stream(self, text):
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+
+    def end_stream(self):
+        self.setUndoRedoEnabled(True)
+        self.document().setModified(False)
+        self.setReadOnly(False)
+        self.background_highlighter.start()
+        self.highlight_current_line()
+
+    def handle_text_changed(self):
+        if not self.typing:
+            self.completion_timer.stop()
+            self.completer.popup().hide()
+
+        # The preview scheduler decides when to render
         self.text_changed_for_preview.emit()
 
+    def handle_contents_change(self, position, removed, added):
+        if removed and not self.is_refreshing_formats():
+            self.completion_sweep_timer.start()
+
+    @traced('key press')
     def keyPressEvent(self, event):
+        # With several carets, edits and moves apply to all of them
+        if self.multi_cursor.handle_key(event):
+            return
+
         if self.completer.popup().isVisible():
             if event.key() in (Qt.Key_Enter, Qt.Key_Return, Qt.Key_Escape,
                                Qt.Key_Tab, Qt.Key_Backtab):
@@ -88,7 +164,7 @@ class CodeEditor(QPlainTextEdit):
         # Handle completion
         is_shortcut = (event.modifiers() & Qt.ControlModifier) and event.key() == Qt.Key_Space
         if is_shortcut:
-            self.completer.complete()
+            self.update_completion()
             return
 
         # Check for snippet trigger (e.g., typing "html" and pressing Tab)
@@ -100,7 +176,79 @@ class CodeEditor(QPlainTextEdit):
                 cursor.insertText(self.snippets[word])
                 return
 
-        super().keyPressEvent(event)
+        self.typing = True
+        try:
+            super().keyPressEvent(event)
+        finally:
+            self.typing = False
+        self.handle_typed(event)
+
+    def handle_typed(self, event):
+        text = event.text()
+        typed = text and (text.isalnum() or text in COMPLETION_CHARS) or event.key() == Qt.Key_Backspace
+        if typed and not event.modifiers() & Qt.ControlModifier:
+            if self.completer.popup().isVisible():
+                # Narrowing an open popup is cheap; only opening it waits
+                self.update_completion()
+            else:
+                self.completion_timer.start()
+        else:
+            self.completion_timer.stop()
+
+    @traced('completion')
+    def update_completion(self):
+        popup = self.completer.popup()
+        cursor = self.textCursor()
+        context = None
+        if not cursor.hasSelection():
+            block = cursor.block()
+            before = block.text()[:cursor.positionInBlock()]
+            context = completion_context(before, self.highlighter.ends_in_tag(block.previous()))
+        words = self.completion_index.complete(*context) if context else None
+        if not words:
+            popup.hide()
+            return
+        self.completion_model.setStringList(words)
+        self.completer.setCompletionPrefix(context[1])
+        rect = self.cursorRect()
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
+        popup.setCurrentIndex(self.completer.completionModel().index(0, 0))
+
+    def insert_completion(self, word):
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, len(self.completer.completionPrefix()))
+        cursor.insertText(word)
+        self.setTextCursor(cursor)
+
+    def mousePressEvent(self, event):
+        if not self.multi_cursor.mouse_press(event):
+            super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if not self.multi_cursor.mouse_move(event):
+            super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if not self.multi_cursor.mouse_release(event):
+            super().mouseReleaseEvent(event)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        self.multi_cursor.paint()
+
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip:
+            cursor = self.cursorForPosition(event.pos())
+            block = cursor.block()
+            message = self.validation.message_at(block, cursor.position() - block.position())
+            if message:
+                QToolTip.showText(event.globalPos(), message, self.viewport())
+            else:
+                QToolTip.hideText()
+                event.ignore()
+            return True
+        return super().viewportEvent(event)
 
     def contextMenuEvent(self, event):
         menu = self.createStandardContextMenu()
@@ -118,12 +266,35 @@ class CodeEditor(QPlainTextEdit):
             cursor.insertText(self.snippets[key])
 
     def line_number_area_width(self):
-        digits = len(str(max(1, self.blockCount())))
-        space = 3 + self.fontMetrics().horizontalAdvance('9') * digits
+        digits = len(str(max(1, self.first_line_number + self.blockCount() - 1)))
+        space = 3 + self.line_number_area.digit_metrics()[0] * digits
+        if self.folding:
+            space += FOLD_MARKER_WIDTH
         return space
 
     def update_line_number_area_width(self, _):
-        self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
+        # The margins only change when the number of digits does
+        margins = (self.line_number_area_width(), MINIMAP_WIDTH if self.minimap.isVisibleTo(self) else 0)
+        if margins != self.side_margins:
+            self.side_margins = margins
+            self.setViewportMargins(margins[0], 0, margins[1], 0)
+            self.layout_side_widgets()
+
+    def layout_side_widgets(self):
+        cr = self.contentsRect()
+        left, right = self.side_margins
+        self.line_number_area.setGeometry(QRect(cr.left(), cr.top(), left, cr.height()))
+        self.minimap.setGeometry(QRect(cr.right() + 1 - right, cr.top(), right, cr.height()))
+
+    def set_minimap_visible(self, visible):
+        self.minimap.setVisible(visible)
+        self.update_line_number_area_width(0)
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self.update_line_number_area_width(0)
+            self.line_number_area.update()
 
     def update_line_number_area(self, rect, dy):
         if dy:
@@ -136,29 +307,145 @@ class CodeEditor(QPlainTextEdit):
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        cr = self.contentsRect()
-        self.line_number_area.setGeometry(QRect(cr.left(), cr.top(), self.line_number_area_width(), cr.height()))
+        self.layout_side_widgets()
 
+    @traced('gutter')
     def line_number_paint_event(self, event):
         painter = QPainter(self.line_number_area)
         painter.fillRect(event.rect(), Qt.lightGray)
 
+        fold_width = FOLD_MARKER_WIDTH if self.folding else 0
+        line_number_area = self.line_number_area
+        line_number_area.digit_metrics()
+        right = line_number_area.width() - 5 - fold_width
         block = self.firstVisibleBlock()
         block_number = block.blockNumber()
         top = int(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
         bottom = top + int(self.blockBoundingRect(block).height())
 
+        validation = self.validation
         while block.isValid() and top <= event.rect().bottom():
             if block.isVisible() and bottom >= event.rect().top():
-                number = str(block_number + 1)
-                painter.setPen(Qt.black)
-                painter.drawText(0, top, self.line_number_area.width()-5, self.fontMetrics().height(),
-                                 Qt.AlignRight, number)
+                line_number_area.draw_number(painter, block_number + self.first_line_number, right, top)
+                severity = validation.severity(block_number)
+                if severity is not None:
+                    painter.fillRect(0, top, DIAGNOSTIC_MARKER_WIDTH, bottom - top, severity_color(severity))
+                if self.folding:
+                    folded = block.next().isValid() and not block.next().isVisible()
+                    if folded or self.tag_index.fold_end(block_number) is not None:
+                        self.paint_fold_marker(painter, top, folded)
             block = block.next()
             top = bottom
             bottom = top + int(self.blockBoundingRect(block).height())
             block_number += 1
 
+    def paint_fold_marker(self, painter, top, folded):
+        # A triangle pointing right when folded, down when not
+        size = 8
+        left = self.line_number_area.width() - FOLD_MARKER_WIDTH + 1
+        top += (self.line_number_area.digit_metrics()[1] - size) // 2
+        if folded:
+            points = [QPoint(left + 2, top), QPoint(left + size - 2, top + size // 2), QPoint(left + 2, top + size)]
+        else:
+            points = [QPoint(left, top + 2), QPoint(left + size, top + 2), QPoint(left + size // 2, top + size - 2)]
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(Qt.darkGray)
+        painter.drawPolygon(QPolygon(points))
+
+    def line_number_area_clicked(self, pos):
+        if self.folding and pos.x() >= self.line_number_area.width() - FOLD_MARKER_WIDTH:
+            self.toggle_fold(self.cursorForPosition(QPoint(0, pos.y())).blockNumber())
+
+    def toggle_fold(self, block_number):
+        # Hides the lines inside the element opening on block_number, keeping
+        # its first and last line, or shows them again
+        block = self.document().findBlockByNumber(block_number)
+        following = block.next()
+        if not following.isValid():
+            return
+        if not following.isVisible():
+            self.unfold(following)
+            return
+        end = self.tag_index.fold_end(block_number)
+        if end is None:
+            return
+        inner = following
+        while inner.isValid() and inner.blockNumber() < end:
+            inner.setVisible(False)
+            inner = inner.next()
+        self.relayout(block, inner)
+        if not self.textCursor().block().isVisible():
+            cursor = QTextCursor(block)
+            cursor.movePosition(QTextCursor.EndOfBlock)
+            self.setTextCursor(cursor)
+
+    def unfold(self, block):
+        # Shows the run of hidden blocks around block
+        first = block
+        while first.previous().isValid() and not first.previous().isVisible():
+            first = first.previous()
+        last = block
+        while last.isValid() and not last.isVisible():
+            last.setVisible(True)
+            last = last.next()
+        while first != block:
+            first.setVisible(True)
+            first = first.next()
+        self.relayout(block.previous(), last)
+
+    def relayout(self, first, last):
+        # Lays out blocks whose visibility changed. The layout is told
+        # directly: no text changed, so contentsChange is not emitted.
+        start = first.position() if first.isValid() else 0
+        end = last.position() if last.isValid() else self.document().characterCount()
+        self.document().documentLayout().documentChanged(start, end - start, end - start)
+        self.viewport().update()
+        self.line_number_area.update()
+
+    def handle_cursor_moved(self):
+        block = self.textCursor().block()
+        if not block.isVisible():
+            self.unfold(block)
+        self.update_tag_match()
+
+    def update_tag_match(self):
+        # Highlights the tag at the cursor and its partner, in a warning
+        # colour if the names differ or there is none
+        selections = []
+        cursor = self.textCursor()
+        index = None
+        if not cursor.hasSelection():
+            block = cursor.block()
+            index = self.tag_index.event_at(block.blockNumber(), cursor.positionInBlock())
+        if index is not None:
+            tags = [(block.blockNumber(), index)]
+            partner = self.tag_index.match(*tags[0])
+            if partner is not None:
+                tags.append(partner)
+            events = [self.tag_index.events(number)[i] for number, i in tags]
+            matched = len(events) == 2 and self.tag_index.names_match(*events)
+            for (number, _), event in zip(tags, events):
+                start = self.document().findBlockByNumber(number).position()
+                selection = QTextEdit.ExtraSelection()
+                selection.format.setBackground(TAG_MATCH_COLOR if matched else TAG_MISMATCH_COLOR)
+                selection.cursor = QTextCursor(self.document())
+                selection.cursor.setPosition(start + event[2])
+                selection.cursor.setPosition(start + event[3], QTextCursor.KeepAnchor)
+                selections.append(selection)
+        self.set_extra_selections('tag_match', selections)
+
+    def visible_block_range(self):
+        block = self.firstVisibleBlock()
+        first = last = block.blockNumber()
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        height = self.viewport().height()
+        while block.isValid() and top <= height:
+            last = block.blockNumber()
+            top += self.blockBoundingRect(block).height()
+            block = block.next()
+        return first, last
+
+    @traced('current line')
     def highlight_current_line(self):
         extra_selections = []
         if not self.isReadOnly():
@@ -170,8 +457,40 @@ class CodeEditor(QPlainTextEdit):
             selection.cursor.clearSelection()
             extra_selections.append(selection)
 
-        self.setExtraSelections(extra_selections)
+        self.set_extra_selections('current_line', extra_selections)
+
+    def set_extra_selections(self, layer, selections):
+        self.extra_selection_layers[layer] = selections
+        combined = []
+        for layer_selections in self.extra_selection_layers.values():
+            combined.extend(layer_selections)
+        self.setExtraSelections(combined)
+
+    def go_to(self, line, column=0):
+        # 0-based line and character column
+        block = self.document().findBlockByNumber(line)
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        cursor.setPosition(block.position() + min(qt_position(block.text(), column), block.length() - 1))
+        self.setTextCursor(cursor)
+        self.centerCursor()
+        self.setFocus()
+
+    def is_refreshing_formats(self):
+        # contentsChange is also emitted when highlighting is re-applied to
+        # unchanged text; listeners that track edits use this to ignore it
+        return self.highlighter.reapplying or self.background_highlighter.applying
 
     def set_theme(self, theme):
         self.current_theme = theme
         self.highlighter.set_theme(theme)
+        self.background_highlighter.reapply_theme()
+
+    def shutdown(self):
+        # Stops and waits for the background workers, e.g. before the editor
+        # is deleted
+        self.background_highlighter.shutdown()
+        self.minimap.shutdown()
+        self.search.shutdown()
+        self.validation.shutdown()
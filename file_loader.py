@@ -0,0 +1,141 @@
+import bisect
+import codecs
+import hashlib
+import mmap
+import os
+from PySide6.QtCore import QThread, QSemaphore, Signal
+from text_files import SNIFF_SIZE, detect_encoding
+
+CHUNK_SIZE = 1024 * 1024
+# Files above this size open in the read-only paged view
+HUGE_FILE_THRESHOLD = 64 * 1024 * 1024
+# Chunks the loader may read ahead of the GUI thread
+MAX_QUEUED_CHUNKS = 4
+
+
+class FileLoader(QThread):
+    # Reads and decodes a file in chunks off the GUI thread. Newlines are
+    # normalised like text-mode open() would, including \r\n pairs split
+    # across chunk boundaries.
+    chunk_loaded = Signal(str)
+    progress = Signal(int)
+    failed = Signal(str)
+
+    def __init__(self, path, encoding=None):
+        super().__init__()
+        self.path = path
+        self.encoding = encoding
+        self.size = 0
+        # SHA-1 of the bytes read, set once the whole file has been read
+        self.sha1 = None
+        self.credits = QSemaphore(MAX_QUEUED_CHUNKS)
+
+    def run(self):
+        try:
+            self.size = os.path.getsize(self.path)
+            with open(self.path, 'rb') as file:
+                if self.encoding is None:
+                    self.encoding = detect_encoding(file.read(SNIFF_SIZE))
+                    file.seek(0)
+                decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+                digest = hashlib.sha1()
+                pending_cr = False
+                read = 0
+                while True:
+                    if self.isInterruptionRequested():
+                        return
+                    data = file.read(CHUNK_SIZE)
+                    read += len(data)
+                    digest.update(data)
+                    text = decoder.decode(data, final=not data)
+                    if pending_cr:
+                        text = '\r' + text
+                    pending_cr = bool(data) and text.endswith('\r')
+                    if pending_cr:
+                        text = text[:-1]
+                    text = text.replace('\r\n', '\n').replace('\r', '\n')
+                    if text or not data:
+                        if not self.emit_chunk(text):
+                            return
+                    if self.size:
+                        self.progress.emit(min(100, read * 100 // self.size))
+                    if not data:
+                        self.sha1 = digest.hexdigest()
+                        break
+        except Exception as e:
+            self.failed.emit(str(e))
+
+    def emit_chunk(self, text):
+        while not self.credits.tryAcquire(1, 50):
+            if self.isInterruptionRequested():
+                return False
+        self.chunk_loaded.emit(text)
+        return True
+
+
+class PagedFile:
+    # Read-only, memory-mapped access to a file by line number. Only a sparse
+    # index is kept: the number of newlines before every INDEX_STRIDE bytes.
+    # A line is located by bisecting that index and scanning one stride.
+    INDEX_STRIDE = 64 * 1024
+
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.lines_before = [0]
+        self.indexed = 0
+        self.line_count = 1
+
+    def close(self):
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+    def index_step(self, strides=256):
+        # Index a few strides; returns False once the whole file is indexed
+        mm = self.map
+        stride = self.INDEX_STRIDE
+        for _ in range(strides):
+            if self.indexed >= self.size:
+                return False
+            end = min(self.indexed + stride, self.size)
+            count = mm[self.indexed:end].count(b'\n')
+            self.indexed = end
+            if end % stride == 0:
+                self.lines_before.append(self.lines_before[-1] + count)
+            self.line_count += count
+        return self.indexed < self.size
+
+    def line_offset(self, line):
+        # Byte offset of the start of line (0-based), or None if not indexed yet
+        if line <= 0:
+            return 0
+        chunk = bisect.bisect_left(self.lines_before, line) - 1
+        pos = chunk * self.INDEX_STRIDE
+        remaining = line - self.lines_before[chunk]
+        mm = self.map
+        while remaining:
+            found = mm.find(b'\n', pos)
+            if found < 0:
+                return None
+            pos = found + 1
+            remaining -= 1
+        return pos
+
+    def read_lines(self, first, count):
+        start = self.line_offset(first)
+        if start is None:
+            return []
+        mm = self.map
+        end = start
+        for _ in range(count):
+            found = mm.find(b'\n', end)
+            if found < 0:
+                end = self.size
+                break
+            end = found + 1
+        text = mm[start:end].decode(self.encoding, errors='replace')
+        return text.replace('\r\n', '\n').replace('\r', '\n').split('\n')[:count]
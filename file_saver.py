@@ -0,0 +1,21 @@
+from PySide6.QtCore import QThread, Signal
+from text_files import atomic_write
+
+
+class SaveWorker(QThread):
+    saved = Signal(str, str)    # path, sha1 of the written bytes
+    failed = Signal(str, str)   # path, error message
+
+    def __init__(self, path, text, encoding):
+        super().__init__()
+        self.path = path
+        self.text = text
+        self.encoding = encoding
+
+    def run(self):
+        try:
+            digest = atomic_write(self.path, self.text, self.encoding)
+        except Exception as e:
+            self.failed.emit(self.path, str(e))
+        else:
+            self.saved.emit(self.path, digest)
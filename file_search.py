@@ -0,0 +1,182 @@
+import fnmatch
+import mmap
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QThread, Signal
+from text_files import detect_encoding, is_ascii_compatible
+
+DEFAULT_IGNORE = '.git, .hg, .svn, node_modules, __pycache__, .venv, venv'
+SEARCH_THREADS = min(8, (os.cpu_count() or 2) * 2)
+# Files are handed to the pool in groups growing up to this size, so the
+# first results come quickly and later ones with little per-file overhead
+FILES_PER_TASK = 32
+# Groups queued ahead of the one whose results are collected next
+QUEUED_TASKS = SEARCH_THREADS * 2
+# Larger files are skipped
+MAX_FILE_BYTES = 256 * 1024 * 1024
+# Bytes looked at to tell the encoding and skip binary files; a charset
+# declaration is near the top
+SNIFF_SIZE = 4096
+MAX_HITS_PER_FILE = 1000
+MAX_HITS = 20000
+# Characters of context kept on either side of a match in the result line
+PREVIEW_CONTEXT = 80
+# Results are handed to the GUI at most this often, except the first match
+EMIT_INTERVAL = 0.05
+
+
+def split_patterns(text):
+    return [pattern.strip() for pattern in text.split(',') if pattern.strip()]
+
+
+def walk_files(root, include=(), ignore=()):
+    # Yields files under root in a stable order. ignore patterns match file
+    # and directory names; ignored directories are not entered.
+    def ignored(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(name for name in dirs if not ignored(name))
+        for name in sorted(files):
+            if ignored(name):
+                continue
+            if include and not any(fnmatch.fnmatch(name, pattern) for pattern in include):
+                continue
+            yield os.path.join(directory, name)
+
+
+def search_file(path, query, max_hits=MAX_HITS_PER_FILE):
+    # Returns [(line, column, preview), ...] with 0-based line and character
+    # column; preview is the matched line, cut to some context around the
+    # match. Unreadable and binary files have no hits.
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if not size or size > MAX_FILE_BYTES:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                head = data[:SNIFF_SIZE]
+                encoding = detect_encoding(head)
+                if is_ascii_compatible(encoding):
+                    if b'\0' in head:
+                        return []
+                    # Literal text is looked for in the raw bytes first, so
+                    # files without it are never decoded. Plain ASCII text is
+                    # also matched there; whole words are matched on decoded
+                    # text as \b only knows ASCII letters in byte patterns.
+                    if not query.regex and (query.case_sensitive or query.text.isascii()):
+                        try:
+                            needle = query.text.encode(encoding)
+                        except UnicodeEncodeError:
+                            return []
+                        # Searched in the mapped file itself; copying it to
+                        # lower-case it would read it all into memory
+                        pattern = re.compile(re.escape(needle), 0 if query.case_sensitive else re.IGNORECASE)
+                        first = pattern.search(data)
+                        if first is None:
+                            return []
+                        if not query.whole_words and query.text.isascii():
+                            return _scan(pattern, data, data, b'\n',
+                                         lambda raw: raw.decode(encoding, errors='replace'), max_hits,
+                                         first.start())
+                text = data[:].decode(encoding, errors='replace').replace('\r\n', '\n')
+                pattern, haystack = query.compile_for(text)
+                return _scan(pattern, haystack, text, '\n', str, max_hits)
+    except (OSError, ValueError, LookupError):
+        return []
+
+
+def search_files(paths, query):
+    return [search_file(path, query) for path in paths]
+
+
+def _scan(pattern, haystack, data, newline, decode, max_hits, start=0):
+    # Matches in haystack from start on; lines and previews come from data,
+    # which has the same offsets
+    hits = []
+    line = 0
+    counted = 0
+    for m in pattern.finditer(haystack, start):
+        start, end = m.span()
+        if start == end:
+            continue
+        line += data[counted:start].count(newline)
+        counted = start
+        line_start = data.rfind(newline, 0, start) + 1
+        line_end = data.find(newline, start)
+        if line_end < 0:
+            line_end = len(data)
+        preview_start = max(line_start, start - PREVIEW_CONTEXT)
+        before = decode(data[preview_start:start])
+        preview = before + decode(data[start:min(line_end, end + PREVIEW_CONTEXT)])
+        column = len(before) if preview_start == line_start else len(decode(data[line_start:start]))
+        hits.append((line, column, preview.rstrip('\r')))
+        if len(hits) == max_hits:
+            break
+    return hits
+
+
+class FindInFilesWorker(QThread):
+    # Walks a folder and searches its files on a thread pool. Files are
+    # memory-mapped, so the pages are read straight from the OS cache.
+    # Results are reported in walk order, in batches of [(path, hits), ...],
+    # with the number of files searched so far.
+    results_found = Signal(object, int)
+    # files searched, matches, whether the search stopped at MAX_HITS
+    search_done = Signal(int, int, bool)
+
+    def __init__(self, root, query, include=(), ignore=()):
+        super().__init__()
+        self.root = root
+        self.query = query
+        self.include = include
+        self.ignore = ignore
+
+    def run(self):
+        self.files = 0
+        self.hits = 0
+        self.batch = []
+        self.last_emit = time.monotonic()
+        pending = deque()
+        group = []
+        group_size = 1
+        with ThreadPoolExecutor(SEARCH_THREADS) as pool:
+            for path in walk_files(self.root, self.include, self.ignore):
+                if self.isInterruptionRequested() or self.hits >= MAX_HITS:
+                    break
+                group.append(path)
+                if len(group) < group_size:
+                    continue
+                pending.append((group, pool.submit(search_files, group, self.query)))
+                group = []
+                group_size = min(group_size * 2, FILES_PER_TASK)
+                if len(pending) >= QUEUED_TASKS:
+                    self.collect(*pending.popleft())
+            if group:
+                pending.append((group, pool.submit(search_files, group, self.query)))
+            while pending and not self.isInterruptionRequested() and self.hits < MAX_HITS:
+                self.collect(*pending.popleft())
+            pool.shutdown(cancel_futures=True)
+        if self.isInterruptionRequested():
+            return
+        self.flush()
+        self.search_done.emit(self.files, self.hits, self.hits >= MAX_HITS)
+
+    def collect(self, paths, future):
+        first = not self.hits
+        for path, hits in zip(paths, future.result()):
+            hits = hits[:MAX_HITS - self.hits]
+            self.files += 1
+            if hits:
+                self.hits += len(hits)
+                self.batch.append((path, hits))
+        if first and self.hits or time.monotonic() - self.last_emit >= EMIT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.results_found.emit(self.batch, self.files)
+        self.batch = []
+        self.last_emit = time.monotonic()
@@ -0,0 +1,160 @@
+import codecs
+import difflib
+import hashlib
+import os
+from PySide6.QtCore import QFileSystemWatcher, QObject, QThread, QTimer, Signal
+from PySide6.QtGui import QTextCursor
+from document_search import BACKGROUND_REPLACE_BLOCKS
+
+# Notifications for a file arriving within this time of each other are
+# handled once, after the last
+COALESCE_MS = 300
+# Changed regions with more lines than this are replaced as a whole rather
+# than diffed line by line
+MAX_DIFF_LINES = 50000
+
+
+def read_text(path, encoding):
+    # The file's text with newlines normalised like FileLoader does, and the
+    # SHA-1 of its bytes
+    with open(path, 'rb') as file:
+        data = file.read()
+    text = codecs.decode(data, encoding, 'replace')
+    return text.replace('\r\n', '\n').replace('\r', '\n'), hashlib.sha1(data).hexdigest()
+
+
+def line_edits(old, new):
+    # [(first, old_count, lines)] replacing runs of the lines old so they
+    # become new, in document order; first counts lines of old
+    start = 0
+    end = min(len(old), len(new))
+    while start < end and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    if old_end == start and new_end == start:
+        return []
+    if old_end - start + new_end - start > MAX_DIFF_LINES:
+        return [(start, old_end - start, new[start:new_end])]
+    matcher = difflib.SequenceMatcher(None, old[start:old_end], new[start:new_end], autojunk=False)
+    return [(start + i1, i2 - i1, new[start + j1:start + j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_line_edits(editor, edits):
+    # Applies line_edits() as one undoable edit. Blocks outside the edits
+    # keep their highlighting, folds and the cursors in them.
+    document = editor.document()
+    changed = sum(max(old_count, len(lines)) for _, old_count, lines in edits)
+    if changed > BACKGROUND_REPLACE_BLOCKS:
+        editor.background_highlighter.defer_from(edits[0][0])
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    # From the last edit back, so the line numbers of the others stay valid
+    for first, old_count, lines in reversed(edits):
+        block = document.findBlockByNumber(first)
+        if old_count:
+            last = document.findBlockByNumber(first + old_count - 1)
+            if lines:
+                cursor.setPosition(block.position())
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+                cursor.insertText('\n'.join(lines))
+            elif last.next().isValid():
+                cursor.setPosition(block.position())
+                cursor.setPosition(last.next().position(), QTextCursor.KeepAnchor)
+                cursor.removeSelectedText()
+            else:
+                # The last lines go with the line break before them
+                cursor.setPosition(max(block.position() - 1, 0))
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+                cursor.removeSelectedText()
+        elif block.isValid():
+            cursor.setPosition(block.position())
+            cursor.insertText('\n'.join(lines) + '\n')
+        else:
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText('\n' + '\n'.join(lines))
+    cursor.endEditBlock()
+    editor.background_highlighter.highlight_viewport()
+
+
+class DiskDiffWorker(QThread):
+    # Reads a file that changed on disk and diffs it by line against a
+    # snapshot of the document. known_sha1 is the hash of the file as last
+    # loaded or saved; a file still matching it, such as one we just saved
+    # ourselves, is not diffed.
+    # SHA-1 of the file, its number of lines, line_edits() or None if unchanged
+    diffed = Signal(str, int, object)
+    failed = Signal(str)
+
+    def __init__(self, path, encoding, text, known_sha1):
+        super().__init__()
+        self.path = path
+        self.encoding = encoding
+        self.text = text
+        self.known_sha1 = known_sha1
+
+    def run(self):
+        try:
+            text, sha1 = read_text(self.path, self.encoding)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        lines = text.split('\n')
+        if sha1 == self.known_sha1:
+            self.diffed.emit(sha1, len(lines), None)
+            return
+        self.diffed.emit(sha1, len(lines), line_edits(self.text.split('\n'), lines))
+
+
+class FileWatcher(QObject):
+    # Watches the files of every open document with one QFileSystemWatcher,
+    # without polling. The notifications a tool writing a file causes are
+    # coalesced into one file_changed per file. Files replaced by renaming
+    # another file over them, as safe saves do, are watched again.
+    file_changed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.handle_file_changed)
+        # {absolute path: number of documents watching it}
+        self.watching = {}
+        self.pending = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(COALESCE_MS)
+        self.timer.timeout.connect(self.flush)
+
+    def watch(self, path):
+        path = os.path.abspath(path)
+        self.watching[path] = self.watching.get(path, 0) + 1
+        if self.watching[path] == 1 and os.path.exists(path):
+            self.watcher.addPath(path)
+
+    def unwatch(self, path):
+        path = os.path.abspath(path)
+        count = self.watching.get(path, 0) - 1
+        if count > 0:
+            self.watching[path] = count
+            return
+        self.watching.pop(path, None)
+        self.pending.discard(path)
+        if path in self.watcher.files():
+            self.watcher.removePath(path)
+
+    def handle_file_changed(self, path):
+        self.pending.add(os.path.abspath(path))
+        self.timer.start()
+
+    def flush(self):
+        pending, self.pending = self.pending, set()
+        watched = set(self.watcher.files())
+        for path in pending:
+            if path not in self.watching or not os.path.exists(path):
+                continue
+            if path not in watched:
+                self.watcher.addPath(path)
+            self.file_changed.emit(path)
@@ -0,0 +1,169 @@
+import os
+import re
+from PySide6.QtWidgets import (
+    QDockWidget, QWidget, QLabel, QLineEdit, QPushButton, QHBoxLayout, QVBoxLayout,
+    QCheckBox, QTreeWidget, QTreeWidgetItem, QFileDialog, QFormLayout
+)
+from PySide6.QtCore import Qt, Signal
+from file_search import DEFAULT_IGNORE, FindInFilesWorker, split_patterns
+from search_engine import SearchQuery
+
+# Longest result line shown in the tree
+MAX_PREVIEW_CHARS = 200
+
+
+class FindInFilesPanel(QDockWidget):
+    # Searches every file under a folder. Results stream into the tree while
+    # the search runs; activating a result asks to open the file there.
+    # path, 0-based line, 0-based column
+    open_requested = Signal(str, int, int)
+
+    def __init__(self, parent=None):
+        super().__init__("Find in Files", parent)
+        self.setObjectName("find_in_files")
+        self.worker = None
+        self.retired = set()
+        self.root = None
+        self.init_ui()
+
+    def init_ui(self):
+        widget = QWidget()
+        layout = QVBoxLayout()
+
+        form = QFormLayout()
+        self.find_input = QLineEdit()
+        self.find_input.returnPressed.connect(self.start_search)
+        form.addRow("Find:", self.find_input)
+
+        folder_layout = QHBoxLayout()
+        self.folder_input = QLineEdit()
+        self.folder_input.returnPressed.connect(self.start_search)
+        self.browse_button = QPushButton("...")
+        self.browse_button.clicked.connect(self.browse_folder)
+        folder_layout.addWidget(self.folder_input)
+        folder_layout.addWidget(self.browse_button)
+        form.addRow("Folder:", folder_layout)
+
+        self.include_input = QLineEdit("*.html, *.htm, *.xml")
+        self.include_input.setPlaceholderText("All files")
+        form.addRow("Files:", self.include_input)
+        self.ignore_input = QLineEdit(DEFAULT_IGNORE)
+        form.addRow("Ignore:", self.ignore_input)
+        layout.addLayout(form)
+
+        # Options
+        options_layout = QHBoxLayout()
+        self.case_checkbox = QCheckBox("Case Sensitive")
+        self.whole_checkbox = QCheckBox("Whole Words")
+        self.regex_checkbox = QCheckBox("Regular Expression")
+        for checkbox in (self.case_checkbox, self.whole_checkbox, self.regex_checkbox):
+            options_layout.addWidget(checkbox)
+        options_layout.addStretch()
+        layout.addLayout(options_layout)
+
+        # Buttons
+        buttons_layout = QHBoxLayout()
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.start_search)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_search)
+        self.cancel_button.setEnabled(False)
+        self.status_label = QLabel()
+        buttons_layout.addWidget(self.search_button)
+        buttons_layout.addWidget(self.cancel_button)
+        buttons_layout.addWidget(self.status_label, 1)
+        layout.addLayout(buttons_layout)
+
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setUniformRowHeights(True)
+        self.results.itemActivated.connect(self.open_item)
+        layout.addWidget(self.results)
+
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+    def set_folder(self, folder):
+        if not self.folder_input.text():
+            self.folder_input.setText(folder)
+
+    def browse_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Find in Folder", self.folder_input.text())
+        if folder:
+            self.folder_input.setText(folder)
+
+    def current_query(self):
+        return SearchQuery(self.find_input.text(), regex=self.regex_checkbox.isChecked(),
+                           case_sensitive=self.case_checkbox.isChecked(),
+                           whole_words=self.whole_checkbox.isChecked())
+
+    def start_search(self):
+        self.cancel_search()
+        self.results.clear()
+        query = self.current_query()
+        root = self.folder_input.text()
+        if not query.text:
+            self.status_label.clear()
+            return
+        if not os.path.isdir(root):
+            self.status_label.setText("Folder not found")
+            return
+        try:
+            query.compile()
+        except re.error as e:
+            self.status_label.setText(f"Invalid pattern: {e}")
+            return
+
+        self.root = root
+        self.worker = FindInFilesWorker(root, query, split_patterns(self.include_input.text()),
+                                        split_patterns(self.ignore_input.text()))
+        self.worker.results_found.connect(self.handle_results)
+        self.worker.search_done.connect(self.handle_done)
+        self.worker.start()
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText("Searching...")
+
+    def cancel_search(self):
+        if self.worker is None:
+            return
+        worker = self.worker
+        worker.results_found.disconnect(self.handle_results)
+        worker.search_done.disconnect(self.handle_done)
+        worker.requestInterruption()
+        self.retired.add(worker)
+        worker.finished.connect(lambda: self.retired.discard(worker))
+        self.worker = None
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText("Search cancelled")
+
+    def shutdown(self):
+        self.cancel_search()
+        for worker in list(self.retired):
+            worker.wait()
+
+    def handle_results(self, batch, files):
+        items = []
+        for path, hits in batch:
+            item = QTreeWidgetItem([f"{os.path.relpath(path, self.root)} ({len(hits)})"])
+            item.setData(0, Qt.UserRole, (path, 0, 0))
+            for line, column, preview in hits:
+                child = QTreeWidgetItem(item, [f"{line + 1}: {preview.strip()[:MAX_PREVIEW_CHARS]}"])
+                child.setData(0, Qt.UserRole, (path, line, column))
+            items.append(item)
+        self.results.addTopLevelItems(items)
+        for item in items:
+            item.setExpanded(True)
+        self.status_label.setText(f"Searching... {files} files")
+
+    def handle_done(self, files, hits, truncated):
+        self.worker = None
+        self.cancel_button.setEnabled(False)
+        matched = self.results.topLevelItemCount()
+        text = f"{hits} matches in {matched} of {files} files"
+        if truncated:
+            text += " (stopped at the result limit)"
+        self.status_label.setText(text)
+
+    def open_item(self, item):
+        path, line, column = item.data(0, Qt.UserRole)
+        self.open_requested.emit(path, line, column)
@@ -1,13 +1,23 @@
 from PySide6.QtWidgets import QDialog, QLabel, QLineEdit, QPushButton, QHBoxLayout, QVBoxLayout, QCheckBox
 from PySide6.QtCore import Qt
-from PySide6.QtGui import QTextDocument
+from search_engine import SearchQuery
 
 class FindReplaceDialog(QDialog):
-    def __init__(self, editor, replace=False):
-        super().__init__()
+    # Non-modal: the search runs as the query is typed, every match in view is
+    # highlighted and the editor stays usable while the dialog is open.
+    def __init__(self, editor, replace=False, parent=None):
+        super().__init__(parent)
+        # A closed dialog is not reused; the next one starts afresh
+        self.setAttribute(Qt.WA_DeleteOnClose)
         self.editor = editor
+        self.search = editor.search
         self.replace = replace
         self.init_ui()
+        self.search.results_changed.connect(self.update_status)
+
+        selected = editor.textCursor().selectedText()
+        if selected and '\u2029' not in selected:
+            self.find_input.setText(selected)
 
     def init_ui(self):
         self.setWindowTitle("Find and Replace" if self.replace else "Find")
@@ -16,6 +26,8 @@ class FindReplaceDialog(QDialog):
         # Find
         self.find_label = QLabel("Find:")
         self.find_input = QLineEdit()
+        self.find_input.textChanged.connect(self.update_query)
+        self.find_input.returnPressed.connect(self.find)
         self.layout.addWidget(self.find_label)
         self.layout.addWidget(self.find_input)
 
@@ -29,8 +41,14 @@ class FindReplaceDialog(QDialog):
         # Options
         self.case_checkbox = QCheckBox("Case Sensitive")
         self.whole_checkbox = QCheckBox("Whole Words")
-        self.layout.addWidget(self.case_checkbox)
-        self.layout.addWidget(self.whole_checkbox)
+        self.regex_checkbox = QCheckBox("Regular Expression")
+        for checkbox in (self.case_checkbox, self.whole_checkbox, self.regex_checkbox):
+            checkbox.toggled.connect(self.update_query)
+            self.layout.addWidget(checkbox)
+
+        # Match count, e.g. "3 of 120"
+        self.status_label = QLabel()
+        self.layout.addWidget(self.status_label)
 
         # Buttons
         self.buttons_layout = QHBoxLayout()
@@ -38,6 +56,10 @@ class FindReplaceDialog(QDialog):
         self.find_button.clicked.connect(self.find)
         self.buttons_layout.addWidget(self.find_button)
 
+        self.previous_button = QPushButton("Previous")
+        self.previous_button.clicked.connect(self.find_previous)
+        self.buttons_layout.addWidget(self.previous_button)
+
         if self.replace:
             self.replace_button = QPushButton("Replace")
             self.replace_button.clicked.connect(self.replace_text)
@@ -54,43 +76,36 @@ class FindReplaceDialog(QDialog):
         self.layout.addLayout(self.buttons_layout)
         self.setLayout(self.layout)
 
+    def current_query(self):
+        return SearchQuery(self.find_input.text(), regex=self.regex_checkbox.isChecked(),
+                           case_sensitive=self.case_checkbox.isChecked(),
+                           whole_words=self.whole_checkbox.isChecked())
+
+    def update_query(self):
+        self.search.set_query(self.current_query())
+
+    def update_status(self):
+        self.status_label.setText(self.search.status_text())
+
     def find(self):
-        flags = QTextDocument.FindFlags()
-        if self.case_checkbox.isChecked():
-            flags |= QTextDocument.FindCaseSensitively
-        if self.whole_checkbox.isChecked():
-            flags |= QTextDocument.FindWholeWords
-        text = self.find_input.text()
-        if not self.editor.find(text, flags):
-            # Not found, reset cursor
-            cursor = self.editor.textCursor()
-            cursor.setPosition(0)
-            self.editor.setTextCursor(cursor)
-            if not self.editor.find(text, flags):
-                # Still not found
-                pass
+        self.search.find_next()
+
+    def find_previous(self):
+        self.search.find_next(backward=True)
+
+    def done(self, result):
+        # Reached by Close, Escape and the window's close button alike
+        if self.search is not None:
+            self.search.results_changed.disconnect(self.update_status)
+            self.search.clear()
+            self.search = None
+        super().done(result)
 
     def replace_text(self):
-        cursor = self.editor.textCursor()
-        if cursor.hasSelection():
-            cursor.insertText(self.replace_input.text())
+        self.search.replace_current(self.replace_input.text())
         self.find()
 
     def replace_all(self):
-        text = self.find_input.text()
-        replace_text = self.replace_input.text()
-        flags = QTextDocument.FindFlags()
-        if self.case_checkbox.isChecked():
-            flags |= QTextDocument.FindCaseSensitively
-        if self.whole_checkbox.isChecked():
-            flags |= QTextDocument.FindWholeWords
-
-        cursor = self.editor.textCursor()
-        cursor.beginEditBlock()
-
-        self.editor.moveCursor(cursor.Start)
-        while self.editor.find(text, flags):
-            tc = self.editor.textCursor()
-            tc.insertText(replace_text)
-
-        cursor.endEditBlock()
+        count = self.search.replace_all(self.current_query(), self.replace_input.text())
+        if count is not None:
+            self.status_label.setText(f"Replaced {count} occurrence{'s' if count != 1 else ''}")
@@ -1,68 +1,198 @@
-from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont
-from PySide6.QtCore import Qt
-from pygments import lex
-from pygments.lexers import get_lexer_by_name
-from pygments.token import Token
+from array import array
+from PySide6.QtGui import QSyntaxHighlighter, QTextBlockUserData
+from tokenizer import Tokenizer, StateTable, ROOT_STACK, token_id, utf16_offsets
+from themes import load_theme
+from completion import extract_words
+from tag_index import extract_tags
+from tracing import traced
+
+# Block state of blocks the background pass has not reached yet
+PENDING_STATE = -2
+
+# Result placeholder asking highlightBlock to re-apply the block's cached spans
+REUSE_SPANS = object()
+
+
+class BlockData(QTextBlockUserData):
+    # Token spans of the block as flat (start, length, token id) triples, in
+    # Qt's UTF-16 offsets, so formats can be re-applied without re-lexing.
+    # words are the block's completion words, tags and ends_in its tag events
+    # for TagIndex.
+    def __init__(self, spans, words=(), tags=(), ends_in=None):
+        super().__init__()
+        self.spans = spans
+        self.words = words
+        self.tags = tags
+        self.ends_in = ends_in
+
 
 class Highlighter(QSyntaxHighlighter):
     def __init__(self, parent, language='html', theme='dark'):
         super().__init__(parent)
-        self.lexer = get_lexer_by_name(language)
+        self.tokenizer = Tokenizer(language)
+        self.states = StateTable()
         self.theme = theme
-        self.formatters = self.get_formatters()
-
-    def get_formatters(self):
-        if self.theme == 'dark':
-            return {
-                Token.Keyword: self._format(QColor("#569CD6"), QFont.Bold),          # Blueish
-                Token.Name.Tag: self._format(QColor("#4EC9B0")),                    # Teal
-                Token.Name.Attribute: self._format(QColor("#9CDCFE")),              # Light Blue
-                Token.String: self._format(QColor("#CE9178")),                      # Peach
-                Token.Comment: self._format(QColor("#6A9955"), italic=True),         # Green
-                Token.Operator: self._format(QColor("#D4D4D4")),                    # Light Gray
-                Token.Punctuation: self._format(QColor("#D4D4D4")),                # Light Gray
-                Token.Text: self._format(QColor("#D4D4D4")),                        # Light Gray
-            }
-        elif self.theme == 'light':
-            return {
-                Token.Keyword: self._format(QColor("#0000FF"), QFont.Bold),          # Blue
-                Token.Name.Tag: self._format(QColor("#800000")),                    # Maroon
-                Token.Name.Attribute: self._format(QColor("#FF00FF")),              # Magenta
-                Token.String: self._format(QColor("#008000")),                      # Green
-                Token.Comment: self._format(QColor("#808080"), italic=True),         # Gray
-                Token.Operator: self._format(QColor("#000000")),                    # Black
-                Token.Punctuation: self._format(QColor("#000000")),                # Black
-                Token.Text: self._format(QColor("#000000")),                        # Black
-            }
-        else:
-            # Default to dark theme if unknown
-            return {
-                Token.Keyword: self._format(QColor("#569CD6"), QFont.Bold),
-                Token.Name.Tag: self._format(QColor("#4EC9B0")),
-                Token.Name.Attribute: self._format(QColor("#9CDCFE")),
-                Token.String: self._format(QColor("#CE9178")),
-                Token.Comment: self._format(QColor("#6A9955"), italic=True),
-                Token.Operator: self._format(QColor("#D4D4D4")),
-                Token.Punctuation: self._format(QColor("#D4D4D4")),
-                Token.Text: self._format(QColor("#D4D4D4")),
-            }
-
-    def _format(self, color, font_weight=QFont.Normal, italic=False):
-        fmt = QTextCharFormat()
-        fmt.setForeground(color)
-        fmt.setFontWeight(font_weight)
-        fmt.setFontItalic(italic)
-        return fmt
+        self.formats = load_theme(theme)
+        self.reapplying = False
+
+        # Deferred mode is driven by BackgroundHighlighter for very large
+        # documents: only blocks in sync_range are lexed here, everything else
+        # is filled in from results computed on a worker thread.
+        self.deferred = False
+        self.sync_range = None
+        self.results = {}
+        self.first_pending = None
+        # TokenCache of the document's text when it was loaded, if there is one
+        self.cache = None
+        # CompletionIndex fed with the words of every block highlighted
+        self.completion_index = None
+        # TagIndex told about every block highlighted
+        self.tag_index = None
+        # (first, last) block numbers lexed since take_highlighted(); blocks
+        # further down than an edit are re-lexed when their state changes
+        self.highlighted = None
 
     def set_theme(self, theme):
         self.theme = theme
-        self.formatters = self.get_formatters()
-        self.rehighlight()
+        self.formats = load_theme(theme)
+        if not self.deferred:
+            self.reapply_formats()
+
+    def reapply_formats(self):
+        # Re-colour every block from its cached token spans without lexing
+        self.reapplying = True
+        try:
+            self.rehighlight()
+        finally:
+            self.reapplying = False
 
+    @traced('highlight')
     def highlightBlock(self, text):
-        for token, content in lex(text, self.lexer):
-            fmt = self.formatters.get(token, self.formatters.get(Token.Text, QTextCharFormat()))
-            start = text.find(content)
-            while start != -1:
-                self.setFormat(start, len(content), fmt)
-                start = text.find(content, start + len(content))
+        if self.reapplying or self.results:
+            if self.reapply_cached():
+                return
+        if self.deferred:
+            self.highlight_deferred(text)
+            return
+
+        # Resume from the stack the previous block ended in; if this block now
+        # ends in the same state as before, QSyntaxHighlighter stops here.
+        stack = self.states.stack_for(self.previousBlockState())
+        tokens, end_stack = self.tokenizer.tokenize(text, stack)
+        self.apply_tokens(text, tokens, end_stack)
+
+    def highlight_deferred(self, text):
+        block_number = self.currentBlock().blockNumber()
+        result = self.results.pop(block_number, None)
+        if result is not None and result is not REUSE_SPANS:
+            self.apply_tokens(text, *result)
+            return
+
+        first, last = self.sync_range or (-1, -1)
+        if first <= block_number <= last:
+            stack = self.previous_stack()
+            result = self.cached_result(block_number, text, stack)
+            if result is not None:
+                self.apply_tokens(text, *result)
+                return
+            if stack is None and block_number == first:
+                # Nothing above the viewport has been lexed yet; start from the
+                # root state and let the background pass correct it later.
+                stack = ROOT_STACK
+            if stack is not None:
+                tokens, end_stack = self.tokenizer.tokenize(text, stack)
+                self.apply_tokens(text, tokens, end_stack)
+                return
+
+        if self.first_pending is None or block_number < self.first_pending:
+            self.first_pending = block_number
+        # Keep an already lexed block's state so the change does not cascade
+        # through the rest of the document on the GUI thread.
+        if self.currentBlockState() < 0:
+            self.setCurrentBlockState(PENDING_STATE)
+
+    def cached_result(self, block_number, text, stack):
+        # (tokens, end stack) from the token cache if it holds a line with
+        # this text at this number starting in stack (or in any state if
+        # stack is None), otherwise None
+        cache = self.cache
+        if cache is None or not cache.matches(block_number, text):
+            return None
+        if stack is not None and stack != cache.start_stack(block_number):
+            return None
+        return cache.result(block_number, text)
+
+    def ends_in_tag(self, block):
+        # True if block ends inside a start tag, between its attributes
+        state = block.userState() if block.isValid() else -1
+        return state >= 0 and self.states.stack_for(state)[-1] == 'tag'
+
+    def previous_stack(self):
+        state = self.previousBlockState()
+        if state >= 0:
+            return self.states.stack_for(state)
+        if self.currentBlock().blockNumber() == 0:
+            return ROOT_STACK
+        return None
+
+    def reapply_cached(self):
+        if not self.reapplying:
+            result = self.results.get(self.currentBlock().blockNumber())
+            if result is not REUSE_SPANS:
+                return False
+            self.results.pop(self.currentBlock().blockNumber())
+        data = self.currentBlockUserData()
+        if data is None:
+            return False
+        self.apply_spans(data.spans)
+        # Text is unchanged, so is the state; the cascade stops here
+        self.setCurrentBlockState(self.currentBlockState())
+        return True
+
+    def apply_tokens(self, text, tokens, end_stack):
+        spans = array('I')
+        offsets = utf16_offsets(text)
+        for pos, token, content in tokens:
+            if offsets is None:
+                spans.extend((pos, len(content), token_id(token)))
+            else:
+                start = offsets[pos]
+                spans.extend((start, offsets[pos + len(content)] - start, token_id(token)))
+        self.apply_spans(spans)
+        data = BlockData(spans)
+        number = self.currentBlock().blockNumber()
+        if self.highlighted is None:
+            self.highlighted = (number, number)
+        else:
+            self.highlighted = (min(self.highlighted[0], number), max(self.highlighted[1], number))
+        tag_index = self.tag_index
+        if tag_index is not None:
+            tags, data.ends_in = extract_tags(tokens, self.tokenizer.language == 'html')
+            if offsets is not None:
+                tags = tuple((kind, name, offsets[start], offsets[end], label)
+                             for kind, name, start, end, label in tags)
+            data.tags = tags
+            tag_index.mark_dirty(number)
+        # Set through the block rather than setCurrentBlockUserData(): with
+        # PySide, data set that way and later read back with
+        # QTextBlock.userData() is never freed with its document
+        index = self.completion_index
+        if index is None:
+            self.currentBlock().setUserData(data)
+        else:
+            old = self.currentBlockUserData()
+            data.words = extract_words(tokens)
+            self.currentBlock().setUserData(data)
+            index.replace_block(old, data)
+        self.setCurrentBlockState(self.states.id_for(end_stack))
+
+    def take_highlighted(self):
+        highlighted = self.highlighted
+        self.highlighted = None
+        return highlighted
+
+    def apply_spans(self, spans):
+        format_for_id = self.formats.format_for_id
+        set_format = self.setFormat
+        for i in range(0, len(spans), 3):
+            set_format(spans[i], spans[i + 1], format_for_id(spans[i + 2]))
@@ -0,0 +1,73 @@
+import html
+from pygments.token import STANDARD_TYPES, Token
+from theme_files import DEFAULT_THEME, read_theme, style_for
+from tokenizer import ROOT_STACK, Tokenizer
+
+
+def css_class(ttype):
+    # Pygments' short class name of the nearest token type that has one;
+    # '' for plain text
+    while ttype not in STANDARD_TYPES:
+        ttype = ttype.parent
+    return STANDARD_TYPES[ttype]
+
+
+def css_declarations(spec):
+    declarations = []
+    if 'color' in spec:
+        declarations.append(f"color: {spec['color']}")
+    if 'background' in spec:
+        declarations.append(f"background-color: {spec['background']}")
+    if spec.get('bold'):
+        declarations.append("font-weight: bold")
+    if spec.get('italic'):
+        declarations.append("font-style: italic")
+    if spec.get('underline'):
+        declarations.append("text-decoration: underline")
+    return '; '.join(declarations)
+
+
+def styled_classes(styles):
+    # {class name: CSS declarations} of the token types styled differently
+    # from plain text
+    text = css_declarations(style_for(styles, Token.Text))
+    classes = {}
+    for ttype, name in STANDARD_TYPES.items():
+        declarations = css_declarations(style_for(styles, ttype)) if name else text
+        if declarations != text:
+            classes[name] = declarations
+    return classes
+
+
+def theme_css(styles, background, classes):
+    rules = [f"pre {{ background-color: {background}; {css_declarations(style_for(styles, Token.Text))} }}"]
+    for name in sorted(classes):
+        rules.append(f"pre .{name} {{ {classes[name]} }}")
+    return '\n'.join(rules)
+
+
+def export_html(lines, language='html', theme=DEFAULT_THEME, title=''):
+    # Yields a standalone HTML page showing lines coloured as the editor
+    # colours them with theme, a line at a time, so it can be written as
+    # it is made
+    _, _, styles, background = read_theme(theme)
+    styled = styled_classes(styles)
+    yield ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+           f"<title>{html.escape(title)}</title>\n<style>\n{theme_css(styles, background, styled)}\n</style>\n"
+           "</head>\n<body>\n<pre>")
+    tokenizer = Tokenizer(language)
+    stack = ROOT_STACK
+    # {token type: class name, or None for plain text}
+    classes = {}
+    for number, line in enumerate(lines):
+        tokens, stack = tokenizer.tokenize(line, stack)
+        parts = ['\n'] if number else []
+        for _, ttype, value in tokens:
+            if ttype not in classes:
+                name = css_class(ttype)
+                classes[ttype] = name if name in styled else None
+            name = classes[ttype]
+            value = html.escape(value, quote=False)
+            parts.append(f'<span class="{name}">{value}</span>' if name else value)
+        yield ''.join(parts)
+    yield "</pre>\n</body>\n</html>\n"
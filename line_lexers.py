@@ -0,0 +1,135 @@
+from pygments.lexer import RegexLexer, inherit, bygroups
+from pygments.lexers import get_lexer_by_name
+from pygments.lexers.html import HtmlLexer, XmlLexer
+from pygments.lexers.javascript import JavascriptLexer
+from pygments.lexers.css import CssLexer
+from pygments.token import Text, Comment, Name, Punctuation, String
+
+# Importing pygments.lexer pulls in most of Pygments and its plugin lookup,
+# so this module is only imported once a tokenizer has text to lex.
+
+
+def _embedded(lexer_cls):
+    # Like pygments.lexer.using(), but reuses one sub-lexer instance instead of
+    # constructing a new one for every match.
+    def callback(lexer, match, ctx=None):
+        sub = lexer._sub_lexers.get(lexer_cls)
+        if sub is None:
+            sub = lexer._sub_lexers[lexer_cls] = lexer_cls(**lexer.options)
+        offset = match.start()
+        for pos, ttype, value in sub.get_tokens_unprocessed(match.group()):
+            yield pos + offset, ttype, value
+    return callback
+
+
+class LineHtmlLexer(HtmlLexer):
+    # HtmlLexer matches comments, CDATA and quoted attribute values with single
+    # regexes and pops out of <script>/<style> at each newline, so it cannot be
+    # resumed from the middle of a construct. These states can, which lets the
+    # highlighter lex one block at a time and carry the stack between blocks.
+    name = 'HTML (line)'
+    aliases = []
+    filenames = []
+
+    tokens = {
+        'root': [
+            (r'<!--', Comment.Multiline, 'comment'),
+            (r'<!\[CDATA\[', Comment.Preproc, 'cdata'),
+            inherit,
+        ],
+        'comment': [
+            (r'.*?-->', Comment.Multiline, '#pop'),
+            (r'.+', Comment.Multiline),
+        ],
+        'cdata': [
+            (r'.*?\]\]>', Comment.Preproc, '#pop'),
+            (r'.+', Comment.Preproc),
+        ],
+        'script-content': [
+            (r'(<)(\s*)(/)(\s*)(script)(\s*)(>)',
+             bygroups(Punctuation, Text, Punctuation, Text, Name.Tag, Text, Punctuation), '#pop'),
+            (r'.+?(?=<\s*/\s*script\s*>)', _embedded(JavascriptLexer)),
+            (r'.+', _embedded(JavascriptLexer)),
+        ],
+        'style-content': [
+            (r'(<)(\s*)(/)(\s*)(style)(\s*)(>)',
+             bygroups(Punctuation, Text, Punctuation, Text, Name.Tag, Text, Punctuation), '#pop'),
+            (r'.+?(?=<\s*/\s*style\s*>)', _embedded(CssLexer)),
+            (r'.+', _embedded(CssLexer)),
+        ],
+        'attr': [
+            ('".*?"', String, '#pop'),
+            ("'.*?'", String, '#pop'),
+            ('"[^"]*', String, ('#pop', 'attr-dq')),
+            ("'[^']*", String, ('#pop', 'attr-sq')),
+            (r'[^\s>]+', String, '#pop'),
+        ],
+        'attr-dq': [
+            ('[^"]*"', String, '#pop'),
+            ('[^"]+', String),
+        ],
+        'attr-sq': [
+            ("[^']*'", String, '#pop'),
+            ("[^']+", String),
+        ],
+    }
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._sub_lexers = {}
+
+
+class LineXmlLexer(XmlLexer):
+    name = 'XML (line)'
+    aliases = []
+    filenames = []
+
+    tokens = {
+        'root': [
+            (r'<!--', Comment.Multiline, 'comment'),
+            (r'<!\[CDATA\[', Comment.Preproc, 'cdata'),
+            (r'<\?', Comment.Preproc, 'pi'),
+            inherit,
+        ],
+        'comment': [
+            (r'.*?-->', Comment.Multiline, '#pop'),
+            (r'.+', Comment.Multiline),
+        ],
+        'cdata': [
+            (r'.*?\]\]>', Comment.Preproc, '#pop'),
+            (r'.+', Comment.Preproc),
+        ],
+        'pi': [
+            (r'.*?\?>', Comment.Preproc, '#pop'),
+            (r'.+', Comment.Preproc),
+        ],
+        'attr': [
+            (r'\s+', Text.Whitespace),
+            ('".*?"', String, '#pop'),
+            ("'.*?'", String, '#pop'),
+            ('"[^"]*', String, ('#pop', 'attr-dq')),
+            ("'[^']*", String, ('#pop', 'attr-sq')),
+            (r'[^\s>]+', String, '#pop'),
+        ],
+        'attr-dq': [
+            ('[^"]*"', String, '#pop'),
+            ('[^"]+', String),
+        ],
+        'attr-sq': [
+            ("[^']*'", String, '#pop'),
+            ("[^']+", String),
+        ],
+    }
+
+
+LINE_LEXERS = {
+    'html': LineHtmlLexer,
+    'xml': LineXmlLexer,
+}
+
+
+def create_lexer(language):
+    # Returns the lexer and whether it can be resumed from a saved stack
+    lexer_cls = LINE_LEXERS.get(language)
+    lexer = lexer_cls() if lexer_cls else get_lexer_by_name(language)
+    return lexer, isinstance(lexer, RegexLexer)
@@ -1,13 +1,63 @@
+import math
 from PySide6.QtWidgets import QWidget
 from PySide6.QtCore import Qt, QRect, QSize
+from PySide6.QtGui import QPainter, QPixmap
 
 class LineNumberArea(QWidget):
     def __init__(self, editor):
         super().__init__(editor)
         self.editor = editor
+        # Line numbers are drawn from cached pixmaps of groups of up to three
+        # digits ('7', '42', '042', ...), rendered once per font and screen
+        # scale, rather than laid out as text for every line on every paint
+        self.pixmaps = {}
+        self.pixmaps_key = None
+        self.digit_size = None
 
     def sizeHint(self):
         return QSize(self.editor.line_number_area_width(), 0)
 
+    def digit_metrics(self):
+        # (digit width, line height) of the editor font; a new font or
+        # screen scale drops the cached pixmaps
+        font = self.editor.font()
+        key = (font.key(), self.devicePixelRatioF())
+        if key != self.pixmaps_key:
+            metrics = self.editor.fontMetrics()
+            self.pixmaps = {}
+            self.pixmaps_key = key
+            self.digit_size = (metrics.horizontalAdvance('9'), metrics.height())
+        return self.digit_size
+
+    def digits_pixmap(self, digits):
+        pixmap = self.pixmaps.get(digits)
+        if pixmap is None:
+            width, height = self.digit_size
+            width *= len(digits)
+            ratio = self.pixmaps_key[1]
+            pixmap = QPixmap(math.ceil(width * ratio), math.ceil(height * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+            painter = QPainter(pixmap)
+            painter.setFont(self.editor.font())
+            painter.setPen(Qt.black)
+            painter.drawText(QRect(0, 0, width, height), Qt.AlignRight, digits)
+            painter.end()
+            self.pixmaps[digits] = pixmap
+        return pixmap
+
+    def draw_number(self, painter, number, right, top):
+        # Right-aligns number at right; digit_metrics() must have been called
+        digit_width = self.digit_size[0]
+        while number >= 1000:
+            number, group = divmod(number, 1000)
+            right -= 3 * digit_width
+            painter.drawPixmap(right, top, self.digits_pixmap('%03d' % group))
+        digits = str(number)
+        painter.drawPixmap(right - len(digits) * digit_width, top, self.digits_pixmap(digits))
+
     def paintEvent(self, event):
         self.editor.line_number_paint_event(event)
+
+    def mousePressEvent(self, event):
+        self.editor.line_number_area_clicked(event.position().toPoint())
@@ -1,41 +1,117 @@
+import time
+# Taken before the other imports, for --profile-startup
+STARTED = time.perf_counter()
+import os
 import sys
+if __name__ == "__main__" and sys.argv[1:2] and sys.argv[1] in ('replace', 'highlight-export', 'check'):
+    # Batch commands run without a window; nothing of Qt is imported
+    from cli import main
+    sys.exit(main(sys.argv[1:]))
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QMessageBox,
-    QSplitter, QFontDialog
+    QApplication, QMainWindow, QFileDialog, QMessageBox, QWidget,
+    QSplitter, QFontDialog, QProgressBar, QPushButton, QLabel, QInputDialog
 )
 from PySide6.QtGui import QAction, QIcon
-from PySide6.QtCore import Qt
-from editor import CodeEditor
-from preview import LivePreview
+from PySide6.QtCore import Qt, QCoreApplication, QTimer, Signal
 from find_replace_dialog import FindReplaceDialog 
+from file_loader import HUGE_FILE_THRESHOLD
+from text_files import sniff_encoding, is_ascii_compatible
+from preview_scheduler import PreviewScheduler
+from document_tabs import DocumentTabs
+from startup_profile import StartupProfile
+import tracing
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    first_painted = Signal()
+    preview_created = Signal()
+    # A file could not be opened; emitted before the error is shown
+    open_failed = Signal()
+
+    def __init__(self, paths=()):
         super().__init__()
         self.setWindowTitle("Professional Code Editor")
 
-        self.editor = CodeEditor()
-        self.preview = LivePreview()
-        
-        splitter = QSplitter(Qt.Horizontal)
-        splitter.addWidget(self.editor)
-        splitter.addWidget(self.preview)
-        splitter.setSizes([800, 400])
-
-        self.setCentralWidget(splitter)
+        # One tab per open document; files above HUGE_FILE_THRESHOLD open
+        # read-only in a paged view
+        self.tabs = DocumentTabs()
+        # The web engine behind the preview starts a process of its own; it
+        # is created by create_preview() once the window and the file being
+        # opened are on screen
+        self.preview = None
+        self.preview_scheduler = None
+        self.painted = False
+        # Files named on the command line, opened once the window is painted
+        self.startup_paths = list(paths)
+
+        self.splitter = QSplitter(Qt.Horizontal)
+        self.splitter.addWidget(self.tabs)
+        self.splitter.addWidget(QWidget())
+        self.splitter.setSizes([800, 400])
+
+        self.setCentralWidget(self.splitter)
 
         # Create Menus and Actions
         self.create_actions()
         self.create_menus()
-
-        # Connect Editor's signal to update_preview
-        self.editor.text_changed_for_preview.connect(self.update_preview)
-
-        # Initial preview update
-        self.update_preview()
+        self.create_status_bar()
+        self.find_dialog = None
+        self.find_in_files_panel = None
+        self.outline_panel = None
+        self.trace_overlay = None
+        # Applied to every editor, including those created later
+        self.theme = 'dark'
+        self.editor_font = None
+        self.tabs.journal_writer.failed.connect(
+            lambda message: self.statusBar().showMessage(f"Autosave failed: {message}", 5000))
+
+        self.tabs.page_added.connect(self.setup_page)
+        self.tabs.currentChanged.connect(self.handle_current_changed)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.new_file()
+
+    @property
+    def editor(self):
+        # The current tab's editor; None for a file opened read-only
+        page = self.tabs.currentWidget()
+        return page.editor if page is not None else None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            self.first_painted.emit()
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        paths, self.startup_paths = self.startup_paths, []
+        for index, path in enumerate(paths):
+            self.load_file(path, show=index == len(paths) - 1)
+        self.create_preview()
+
+    def create_preview(self):
+        page = self.tabs.currentWidget()
+        if self.preview is not None or not self.painted or (page is not None and page.loader is not None):
+            return
+        from preview import LivePreview
+        self.preview = LivePreview()
+        self.preview.incremental = self.incremental_preview_action.isChecked()
+        sizes = self.splitter.sizes()
+        self.splitter.replaceWidget(1, self.preview).deleteLater()
+        self.splitter.setSizes(sizes)
+        # The preview shows the current tab
+        self.preview_scheduler = PreviewScheduler(self.preview, self.preview_text, self)
+        self.preview_scheduler.stats_changed.connect(self.update_preview_stats)
+        self.preview_created.emit()
+        if page is not None:
+            self.preview.set_document_path(self.preview_path())
+            self.update_preview()
 
     def create_actions(self):
         # File actions
+        self.new_action = QAction("&New", self)
+        self.new_action.setShortcut("Ctrl+N")
+        self.new_action.triggered.connect(self.new_file)
+
         self.open_action = QAction("&Open", self)
         self.open_action.setShortcut("Ctrl+O")
         self.open_action.triggered.connect(self.open_file)
@@ -47,6 +123,10 @@ class MainWindow(QMainWindow):
         self.save_as_action = QAction("Save &As", self)
         self.save_as_action.triggered.connect(self.save_file_as)
 
+        self.close_tab_action = QAction("&Close", self)
+        self.close_tab_action.setShortcut("Ctrl+W")
+        self.close_tab_action.triggered.connect(lambda: self.close_tab(self.tabs.currentIndex()))
+
         self.exit_action = QAction("E&xit", self)
         self.exit_action.setShortcut("Ctrl+Q")
         self.exit_action.triggered.connect(self.close)
@@ -60,6 +140,10 @@ class MainWindow(QMainWindow):
         self.replace_action.setShortcut("Ctrl+H")
         self.replace_action.triggered.connect(self.replace_text)
 
+        self.find_in_files_action = QAction("Find in F&iles", self)
+        self.find_in_files_action.setShortcut("Ctrl+Shift+F")
+        self.find_in_files_action.triggered.connect(self.find_in_files)
+
         # View actions
         self.light_theme_action = QAction("&Light Theme", self)
         self.light_theme_action.triggered.connect(self.set_light_theme)
@@ -70,14 +154,46 @@ class MainWindow(QMainWindow):
         self.change_font_action = QAction("&Change Font", self)
         self.change_font_action.triggered.connect(self.change_font)
 
+        self.incremental_preview_action = QAction("&Incremental Preview", self)
+        self.incremental_preview_action.setCheckable(True)
+        self.incremental_preview_action.setChecked(True)
+        self.incremental_preview_action.toggled.connect(self.set_incremental_preview)
+
+        self.minimap_action = QAction("&Minimap", self)
+        self.minimap_action.setCheckable(True)
+        self.minimap_action.setChecked(True)
+        self.minimap_action.toggled.connect(self.set_minimap_visible)
+
+        self.outline_action = QAction("&Outline", self)
+        self.outline_action.setShortcut("Ctrl+Shift+O")
+        self.outline_action.triggered.connect(self.show_outline)
+
+        self.memory_budget_action = QAction("Tab &Memory Budget...", self)
+        self.memory_budget_action.triggered.connect(self.change_memory_budget)
+
+        # Tracing of the GUI thread's hot paths; off unless one of these is on
+        self.overlay_action = QAction("Performance &Overlay", self)
+        self.overlay_action.setShortcut("Ctrl+Shift+P")
+        self.overlay_action.setCheckable(True)
+        self.overlay_action.toggled.connect(self.set_overlay_visible)
+
+        self.record_trace_action = QAction("&Record Trace", self)
+        self.record_trace_action.setCheckable(True)
+        self.record_trace_action.toggled.connect(self.set_trace_recording)
+
+        self.export_trace_action = QAction("&Export Trace...", self)
+        self.export_trace_action.triggered.connect(self.export_trace)
+
     def create_menus(self):
         menubar = self.menuBar()
 
         # File menu
         file_menu = menubar.addMenu("&File")
+        file_menu.addAction(self.new_action)
         file_menu.addAction(self.open_action)
         file_menu.addAction(self.save_action)
         file_menu.addAction(self.save_as_action)
+        file_menu.addAction(self.close_tab_action)
         file_menu.addSeparator()
         file_menu.addAction(self.exit_action)
 
@@ -85,61 +201,258 @@ class MainWindow(QMainWindow):
         edit_menu = menubar.addMenu("&Edit")
         edit_menu.addAction(self.find_action)
         edit_menu.addAction(self.replace_action)
+        edit_menu.addAction(self.find_in_files_action)
 
         # View menu
         view_menu = menubar.addMenu("&View")
         view_menu.addAction(self.light_theme_action)
         view_menu.addAction(self.dark_theme_action)
         view_menu.addAction(self.change_font_action)
+        view_menu.addAction(self.incremental_preview_action)
+        view_menu.addAction(self.minimap_action)
+        view_menu.addAction(self.outline_action)
+        view_menu.addAction(self.memory_budget_action)
+        view_menu.addSeparator()
+        view_menu.addAction(self.overlay_action)
+        view_menu.addAction(self.record_trace_action)
+        view_menu.addAction(self.export_trace_action)
+
+    def create_status_bar(self):
+        self.preview_stats = QLabel()
+        self.statusBar().addPermanentWidget(self.preview_stats)
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.setRange(0, 100)
+        self.cancel_load_button = QPushButton("Cancel")
+        self.cancel_load_button.clicked.connect(self.cancel_loading)
+        self.statusBar().addPermanentWidget(self.load_progress)
+        self.statusBar().addPermanentWidget(self.cancel_load_button)
+        self.load_progress.hide()
+        self.cancel_load_button.hide()
+
+    def setup_page(self, page):
+        page.status_message.connect(self.statusBar().showMessage)
+        page.load_progress.connect(self.handle_load_progress)
+        page.loading_changed.connect(self.update_loading_state)
+        page.load_failed.connect(self.handle_load_failed)
+        page.title_changed.connect(self.handle_title_changed)
+        page.editor_created.connect(self.setup_editor)
+
+    def setup_editor(self, editor):
+        if self.theme != editor.current_theme:
+            editor.set_theme(self.theme)
+        if self.editor_font is not None:
+            editor.setFont(self.editor_font)
+        editor.set_minimap_visible(self.minimap_action.isChecked())
+        editor.text_changed_for_preview.connect(self.handle_editor_text_changed)
+
+    def handle_current_changed(self):
+        page = self.tabs.currentWidget()
+        if page is None:
+            return
+        self.update_title()
+        self.update_loading_state()
+        if self.preview is not None:
+            self.preview.set_document_path(self.preview_path())
+            self.update_preview()
+        if self.outline_panel is not None:
+            self.outline_panel.set_editor(self.editor)
+        # The find dialog works on one editor; reopen it on the new one
+        dialog = self.find_dialog
+        if dialog is not None:
+            replace, text = dialog.replace, dialog.find_input.text()
+            dialog.close()
+            if self.editor is not None:
+                self.show_find_dialog(replace)
+                self.find_dialog.find_input.setText(text)
+
+    def handle_title_changed(self):
+        if self.sender() is self.tabs.currentWidget():
+            self.update_title()
+            if self.preview is not None:
+                self.preview.set_document_path(self.preview_path())
+
+    def update_title(self):
+        page = self.tabs.currentWidget()
+        if page.path is None:
+            self.setWindowTitle("Professional Code Editor")
+        elif page.paged_view is not None:
+            self.setWindowTitle(f"Professional Code Editor - {page.path} (read-only)")
+        else:
+            self.setWindowTitle(f"Professional Code Editor - {page.path}")
+
+    def new_file(self):
+        self.tabs.setCurrentWidget(self.tabs.add_page())
 
     def open_file(self):
-        path, _ = QFileDialog.getOpenFileName(
+        paths, _ = QFileDialog.getOpenFileNames(
             self, "Open File", "", "HTML Files (*.html *.htm);;XML Files (*.xml);;All Files (*)"
         )
-        if path:
+        # Only the last one is shown; the others load when their tab is
+        for index, path in enumerate(paths):
+            self.load_file(path, show=index == len(paths) - 1)
+
+    def load_file(self, path, show=True):
+        # Opens path in a new tab, or shows its tab if it is open already
+        page = self.tabs.find_page(path)
+        if page is None:
             try:
-                with open(path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    self.editor.setPlainText(content)
-                    self.current_file = path
-                    self.setWindowTitle(f"Professional Code Editor - {path}")
+                size = os.path.getsize(path)
+                encoding = sniff_encoding(path)
             except Exception as e:
+                self.open_failed.emit()
                 QMessageBox.warning(self, "Error", f"Could not open file: {e}")
+                return None
+
+            page = self.tabs.add_page(path, encoding)
+            if size >= HUGE_FILE_THRESHOLD and is_ascii_compatible(encoding):
+                try:
+                    page.open_paged()
+                except Exception as e:
+                    self.tabs.close_page(page)
+                    self.open_failed.emit()
+                    QMessageBox.warning(self, "Error", f"Could not open file: {e}")
+                    return None
+        if show:
+            # An untitled tab left empty is replaced by the file
+            current = self.tabs.currentWidget()
+            self.tabs.setCurrentWidget(page)
+            if current is not page and current.is_pristine():
+                self.tabs.close_page(current)
+        return page
+
+    def handle_load_progress(self, value):
+        if self.sender() is self.tabs.currentWidget():
+            self.load_progress.setValue(value)
+
+    def update_loading_state(self):
+        page = self.tabs.currentWidget()
+        loading = page is not None and page.loader is not None
+        if loading and not self.load_progress.isVisible():
+            self.load_progress.setValue(0)
+        self.load_progress.setVisible(loading)
+        self.cancel_load_button.setVisible(loading)
+        if not loading and self.preview is None:
+            # Let the loaded text be painted first
+            QTimer.singleShot(0, self.create_preview)
+
+    def handle_load_failed(self, message):
+        self.close_page(self.sender())
+        self.statusBar().clearMessage()
+        self.open_failed.emit()
+        QMessageBox.warning(self, "Error", f"Could not open file: {message}")
+
+    def cancel_loading(self):
+        # A tab whose file did not finish loading is closed
+        page = self.tabs.currentWidget()
+        if page is None or page.loader is None:
+            return
+        page.cancel_loading()
+        self.close_page(page)
+        self.statusBar().showMessage("Loading cancelled", 5000)
+
+    def close_tab(self, index):
+        page = self.tabs.widget(index)
+        if page is None:
+            return
+        if page.is_modified():
+            answer = QMessageBox.question(
+                self, "Close", f"{page.title().rstrip('*')} has unsaved changes. Close it anyway?"
+            )
+            if answer != QMessageBox.Yes:
+                return
+        self.close_page(page)
+
+    def close_page(self, page):
+        self.tabs.close_page(page)
+        if not self.tabs.count():
+            self.new_file()
+
+    def is_read_only_view(self):
+        if self.editor is None:
+            QMessageBox.information(self, "Read-only", "Files opened in read-only mode cannot be saved.")
+            return True
+        return False
+
+    def closeEvent(self, event):
+        self.tabs.shutdown()
+        if self.find_in_files_panel is not None:
+            self.find_in_files_panel.shutdown()
+        super().closeEvent(event)
 
     def save_file(self):
-        if hasattr(self, 'current_file'):
-            try:
-                with open(self.current_file, 'w', encoding='utf-8') as file:
-                    content = self.editor.toPlainText()
-                    file.write(content)
-                    QMessageBox.information(self, "Saved", "File saved successfully.")
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Could not save file: {e}")
+        if self.is_read_only_view():
+            return
+        page = self.tabs.currentWidget()
+        if page.path is not None:
+            page.save(page.path)
         else:
             self.save_file_as()
 
     def save_file_as(self):
+        if self.is_read_only_view():
+            return
         path, _ = QFileDialog.getSaveFileName(
             self, "Save File As", "", "HTML Files (*.html *.htm);;XML Files (*.xml);;All Files (*)"
         )
         if path:
-            try:
-                with open(path, 'w', encoding='utf-8') as file:
-                    content = self.editor.toPlainText()
-                    file.write(content)
-                    self.current_file = path
-                    self.setWindowTitle(f"Professional Code Editor - {path}")
-                    QMessageBox.information(self, "Saved", "File saved successfully.")
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Could not save file: {e}")
+            self.tabs.currentWidget().save(path)
 
     def find_text(self):
-        dialog = FindReplaceDialog(self.editor, replace=False)
-        dialog.exec()
+        self.show_find_dialog(replace=False)
 
     def replace_text(self):
-        dialog = FindReplaceDialog(self.editor, replace=True)
-        dialog.exec()
+        self.show_find_dialog(replace=True)
+
+    def show_find_dialog(self, replace):
+        if self.editor is None:
+            return
+        if self.find_dialog is not None:
+            self.find_dialog.close()
+        self.find_dialog = FindReplaceDialog(self.editor, replace=replace, parent=self)
+        self.find_dialog.finished.connect(self.handle_find_dialog_finished)
+        self.find_dialog.show()
+
+    def handle_find_dialog_finished(self):
+        # The dialog deletes itself once closed
+        if self.sender() is self.find_dialog:
+            self.find_dialog = None
+
+    def find_in_files(self):
+        if self.find_in_files_panel is None:
+            from find_in_files_panel import FindInFilesPanel
+            self.find_in_files_panel = FindInFilesPanel(self)
+            self.find_in_files_panel.open_requested.connect(self.open_location)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.find_in_files_panel)
+        panel = self.find_in_files_panel
+        current_file = self.tabs.currentWidget().path
+        panel.set_folder(os.path.dirname(os.path.abspath(current_file)) if current_file else os.getcwd())
+        selected = self.editor.textCursor().selectedText() if self.editor is not None else ''
+        if selected and '\u2029' not in selected:
+            panel.find_input.setText(selected)
+        panel.show()
+        panel.raise_()
+        panel.find_input.setFocus()
+        panel.find_input.selectAll()
+
+    def show_outline(self):
+        if self.outline_panel is None:
+            from outline_panel import OutlinePanel
+            self.outline_panel = OutlinePanel(self.editor, self)
+            self.addDockWidget(Qt.LeftDockWidgetArea, self.outline_panel)
+        self.outline_panel.show()
+        self.outline_panel.raise_()
+
+    def open_location(self, path, line, column):
+        page = self.load_file(path)
+        if page is None:
+            return
+        if page.paged_view is not None:
+            page.paged_view.scroll_bar.setValue(line)
+        elif page.loader is not None:
+            page.pending_location = (line, column)
+        else:
+            page.editor.go_to(line, column)
 
     def set_light_theme(self):
         light_style = """
@@ -169,7 +482,7 @@ class MainWindow(QMainWindow):
         }
         """
         self.setStyleSheet(light_style)
-        self.editor.set_theme('light')
+        self.set_editor_theme('light')
 
     def set_dark_theme(self):
         dark_style = """
@@ -199,22 +512,117 @@ class MainWindow(QMainWindow):
         }
         """
         self.setStyleSheet(dark_style)
-        self.editor.set_theme('dark')
+        self.set_editor_theme('dark')
+
+    def set_editor_theme(self, theme):
+        self.theme = theme
+        for editor in self.tabs.editors():
+            editor.set_theme(theme)
 
     def change_font(self):
-        font, ok = QFontDialog.getFont(self.editor.font(), self, "Select Font")
+        font, ok = QFontDialog.getFont(self.editor_font or self.tabs.font(), self, "Select Font")
+        if ok:
+            self.editor_font = font
+            for editor in self.tabs.editors():
+                editor.setFont(font)
+
+    def set_minimap_visible(self, visible):
+        for editor in self.tabs.editors():
+            editor.set_minimap_visible(visible)
+
+    def change_memory_budget(self):
+        budget, ok = QInputDialog.getInt(
+            self, "Tab Memory Budget", "Memory for open documents (MB); tabs in the background "
+            "are unloaded beyond it:", self.tabs.memory_budget // (1024 * 1024), 16, 1024 * 1024
+        )
         if ok:
-            self.editor.setFont(font)
+            self.tabs.set_memory_budget(budget * 1024 * 1024)
+
+    def set_overlay_visible(self, visible):
+        if self.trace_overlay is None:
+            from trace_overlay import TraceOverlay
+            self.trace_overlay = TraceOverlay(self)
+        self.update_tracing()
+        self.trace_overlay.setVisible(visible)
+
+    def set_trace_recording(self, enabled):
+        if enabled and tracing.recorder() is not None:
+            # A new recording starts empty
+            tracing.recorder().clear()
+        self.update_tracing()
+
+    def update_tracing(self):
+        if self.overlay_action.isChecked() or self.record_trace_action.isChecked():
+            tracing.start()
+        else:
+            tracing.stop()
+
+    def export_trace(self):
+        recorder = tracing.recorder()
+        if recorder is None or not recorder.spans:
+            QMessageBox.information(self, "Export Trace", "Nothing has been traced yet. "
+                                    "Turn on Record Trace or the Performance Overlay first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Trace", "trace.json", "Chrome Trace (*.json);;All Files (*)"
+        )
+        if not path:
+            return
+        try:
+            recorder.export(path)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Could not export trace: {e}")
+            return
+        self.statusBar().showMessage(f"Trace written to {path}; open it in chrome://tracing or Perfetto", 5000)
+
+    def set_incremental_preview(self, enabled):
+        if self.preview is not None:
+            self.preview.incremental = enabled
+
+    def preview_path(self):
+        path = self.tabs.currentWidget().path
+        return path if path is not None else os.path.join(os.getcwd(), 'untitled.html')
+
+    def preview_text(self):
+        if self.editor is None:
+            return "<html><body><p>No preview for files opened read-only.</p></body></html>"
+        return self.editor.toPlainText()
+
+    def handle_editor_text_changed(self):
+        if self.sender() is self.editor:
+            self.update_preview()
 
     def update_preview(self):
-        html_content = self.editor.toPlainText()
-        self.preview.update_preview(html_content)
+        if self.preview_scheduler is not None:
+            self.preview_scheduler.schedule()
+
+    def update_preview_stats(self):
+        self.preview_stats.setText(self.preview_scheduler.stats_text())
 
 if __name__ == "__main__":
+    # main.py [--profile-startup] [file ...]
+    profile = StartupProfile(STARTED) if '--profile-startup' in sys.argv else None
+    if profile:
+        profile.mark("imports")
+    # The scheme must be registered before the QApplication exists; the
+    # rest of the web engine is loaded with the preview
+    from preview_scheme import register_preview_scheme
+    register_preview_scheme()
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    if profile:
+        profile.mark("preview scheme")
     app = QApplication(sys.argv)
+    # Autosave journals are kept under the per-application data directory
+    app.setApplicationName("Professional Code Editor")
     # Set initial theme to dark
     app.setStyleSheet(open("resources/styles.qss").read())
-    window = MainWindow()
+    if profile:
+        profile.mark("application")
+    paths = [arg for arg in app.arguments()[1:] if arg != '--profile-startup']
+    window = MainWindow(paths)
     window.resize(1200, 800)
+    if profile:
+        profile.mark("main window")
+        profile.watch(window, loading=bool(paths))
     window.show()
     sys.exit(app.exec())
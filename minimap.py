@@ -0,0 +1,250 @@
+import re
+from collections import OrderedDict
+from PySide6.QtWidgets import QWidget
+from PySide6.QtCore import Qt, QCoreApplication, QThread, Signal
+from PySide6.QtGui import QColor, QImage, QPainter, QPalette
+
+MINIMAP_WIDTH = 100
+# Pixel rows per line; each character is one pixel wide
+LINE_HEIGHT = 2
+# Blocks per cached thumbnail
+TILE_BLOCKS = 256
+# Thumbnails kept; the least recently drawn are dropped beyond this
+MAX_TILES = 64
+VISIBLE_REGION_COLOR = QColor(128, 128, 128, 60)
+
+_WORD = re.compile(r'\S+')
+
+
+def paint_tile(lines, colors, default_color, width):
+    # Thumbnail of [(text, spans), ...]: every run of non-blank characters
+    # is a bar in its token's colour. spans are the highlighter's (start,
+    # length, token id) triples, or None for text not highlighted yet.
+    image = QImage(width, max(1, len(lines)) * LINE_HEIGHT, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    painter = QPainter(image)
+    height = LINE_HEIGHT - 1 if LINE_HEIGHT > 1 else 1
+    for row, (text, spans) in enumerate(lines):
+        y = row * LINE_HEIGHT
+        if not spans:
+            for m in _WORD.finditer(text, 0, width):
+                painter.fillRect(m.start(), y, m.end() - m.start(), height, default_color)
+            continue
+        for i in range(0, len(spans), 3):
+            start = spans[i]
+            if start >= width:
+                break
+            color = colors.get(spans[i + 2], default_color)
+            for m in _WORD.finditer(text, start, min(start + spans[i + 1], width)):
+                painter.fillRect(m.start(), y, m.end() - m.start(), height, color)
+    painter.end()
+    return image
+
+
+class MinimapWorker(QThread):
+    # generation, tile, tile version, QImage
+    tile_ready = Signal(int, int, int, object)
+
+    def __init__(self, jobs, colors, default_color, width, generation):
+        super().__init__()
+        self.jobs = jobs
+        self.colors = colors
+        self.default_color = default_color
+        self.width = width
+        self.generation = generation
+
+    def run(self):
+        for tile, version, lines in self.jobs:
+            if self.isInterruptionRequested():
+                return
+            self.tile_ready.emit(self.generation, tile, version,
+                                 paint_tile(lines, self.colors, self.default_color, self.width))
+
+
+class Minimap(QWidget):
+    # Scaled-down view of the document beside the editor. The document is
+    # drawn in thumbnails of TILE_BLOCKS blocks, painted on a worker thread
+    # from the highlighter's cached spans. Edits bump the version of the
+    # thumbnails they touch; an outdated thumbnail is still drawn until its
+    # replacement arrives. Clicking or dragging scrolls the editor there.
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        # tile -> (version, QImage), least recently drawn first
+        self.tiles = OrderedDict()
+        self.versions = {}
+        # tile -> version being painted
+        self.requested = {}
+        self.queue = []
+        self.generation = 0
+        self.worker = None
+        self.retired = set()
+        self.formats = None
+        self.colors = {}
+        self.block_count = editor.blockCount()
+        self.setCursor(Qt.PointingHandCursor)
+        editor.document().contentsChange.connect(self.handle_contents_change)
+        editor.verticalScrollBar().valueChanged.connect(self.update)
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def clear(self):
+        self.tiles.clear()
+        self.drop_requests()
+        self.update()
+
+    def drop_requests(self):
+        # Thumbnails being painted show text that is no longer there
+        self.generation += 1
+        self.requested.clear()
+        self.queue = []
+        self.stop()
+
+    def stop(self):
+        if self.worker is not None:
+            worker = self.worker
+            worker.tile_ready.disconnect(self.handle_tile)
+            worker.finished.disconnect(self.start_queued)
+            worker.requestInterruption()
+            self.retired.add(worker)
+            worker.finished.connect(lambda: self.retired.discard(worker))
+            self.worker = None
+
+    def shutdown(self):
+        self.stop()
+        for worker in list(self.retired):
+            worker.wait()
+
+    def handle_contents_change(self, position, removed, added):
+        document = self.editor.document()
+        if not self.isVisible():
+            self.editor.highlighter.take_highlighted()
+            self.block_count = document.blockCount()
+            self.clear()
+            return
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if last < 0:
+            last = document.blockCount() - 1
+        count = document.blockCount()
+        if count != self.block_count:
+            # Every block further down moved
+            self.block_count = count
+            last = max(last, count - 1)
+        highlighted = self.editor.highlighter.take_highlighted()
+        if highlighted is not None:
+            first, last = min(first, highlighted[0]), max(last, highlighted[1])
+        first, last = first // TILE_BLOCKS, last // TILE_BLOCKS
+        for tile in set(self.tiles).union(self.requested):
+            if first <= tile <= last:
+                self.versions[tile] = self.versions.get(tile, 0) + 1
+        self.update()
+
+    def scroll_offset(self):
+        # Pixel row of the document at the top of the minimap. Documents
+        # taller than the minimap scroll with the editor.
+        extra = self.editor.blockCount() * LINE_HEIGHT - self.height()
+        if extra <= 0:
+            return 0
+        scroll_bar = self.editor.verticalScrollBar()
+        return int(extra * scroll_bar.value() / max(1, scroll_bar.maximum()))
+
+    def paintEvent(self, event):
+        if self.editor.highlighter.formats is not self.formats:
+            # Theme changed
+            self.formats = self.editor.highlighter.formats
+            self.colors = {}
+            self.tiles.clear()
+            self.drop_requests()
+        painter = QPainter(self)
+        rect = event.rect()
+        offset = self.scroll_offset()
+        count = self.editor.blockCount()
+        first_tile = (rect.top() + offset) // LINE_HEIGHT // TILE_BLOCKS
+        last_tile = min(count - 1, (rect.bottom() + offset) // LINE_HEIGHT) // TILE_BLOCKS
+        missing = []
+        for tile in range(first_tile, last_tile + 1):
+            version, image = self.tiles.get(tile, (None, None))
+            if version != self.versions.get(tile, 0):
+                missing.append(tile)
+            if image is not None:
+                self.tiles.move_to_end(tile)
+                painter.drawImage(0, tile * TILE_BLOCKS * LINE_HEIGHT - offset, image)
+
+        first, last = self.editor.visible_block_range()
+        painter.fillRect(0, first * LINE_HEIGHT - offset, self.width(),
+                         (last - first + 1) * LINE_HEIGHT, VISIBLE_REGION_COLOR)
+        painter.end()
+        if missing:
+            self.request(missing)
+
+    def request(self, tiles):
+        jobs = []
+        for tile in tiles:
+            version = self.versions.get(tile, 0)
+            if self.requested.get(tile) != version:
+                self.requested[tile] = version
+                jobs.append((tile, version, self.snapshot(tile)))
+        if not jobs:
+            return
+        self.queue.extend(jobs)
+        if self.worker is None:
+            self.start_queued()
+
+    def snapshot(self, tile):
+        # Text and spans of a tile's blocks, taken on the GUI thread
+        format_for_id = self.editor.highlighter.formats.format_for_id
+        colors = self.colors
+        lines = []
+        block = self.editor.document().findBlockByNumber(tile * TILE_BLOCKS)
+        while block.isValid() and len(lines) < TILE_BLOCKS:
+            data = block.userData()
+            spans = data.spans if data is not None else None
+            if spans:
+                for token in spans[2::3]:
+                    if token not in colors:
+                        brush = format_for_id(token).foreground()
+                        colors[token] = brush.color() if brush.style() != Qt.NoBrush else self.default_color()
+            lines.append((block.text(), spans))
+            block = block.next()
+        return lines
+
+    def default_color(self):
+        return self.editor.palette().color(QPalette.Text)
+
+    def start_queued(self):
+        self.worker = None
+        if not self.queue:
+            return
+        jobs, self.queue = self.queue, []
+        self.worker = MinimapWorker(jobs, dict(self.colors), self.default_color(), self.width(), self.generation)
+        self.worker.tile_ready.connect(self.handle_tile)
+        self.worker.finished.connect(self.start_queued)
+        self.worker.start(QThread.LowPriority)
+
+    def handle_tile(self, generation, tile, version, image):
+        if generation != self.generation:
+            return
+        if self.requested.get(tile) == version:
+            del self.requested[tile]
+        if version != self.versions.get(tile, 0):
+            # Changed while being painted; the next paint asks again
+            self.update()
+            return
+        self.tiles[tile] = (version, image)
+        self.tiles.move_to_end(tile)
+        while len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        self.update(0, tile * TILE_BLOCKS * LINE_HEIGHT - self.scroll_offset(), self.width(), image.height())
+
+    def mousePressEvent(self, event):
+        self.scroll_to(event.position().y())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.scroll_to(event.position().y())
+
+    def scroll_to(self, y):
+        # Centres the line under y in the editor
+        block_number = int(y + self.scroll_offset()) // LINE_HEIGHT
+        first, last = self.editor.visible_block_range()
+        self.editor.verticalScrollBar().setValue(block_number - (last - first) // 2)
@@ -0,0 +1,279 @@
+import bisect
+from PySide6.QtCore import QObject, Qt, QTimer
+from PySide6.QtGui import QGuiApplication, QKeySequence, QPainter, QTextCursor
+from PySide6.QtWidgets import QTextEdit
+
+# Carets drawn and selections highlighted at once; only visible ones are
+MAX_VISIBLE_CARETS = 2000
+# Edits at carets further apart than this many blocks are re-highlighted in
+# the background rather than inside the edit
+BACKGROUND_EDIT_BLOCKS = 200
+
+MOVE_KEYS = {
+    Qt.Key_Left: QTextCursor.Left,
+    Qt.Key_Right: QTextCursor.Right,
+    Qt.Key_Up: QTextCursor.Up,
+    Qt.Key_Down: QTextCursor.Down,
+    Qt.Key_Home: QTextCursor.StartOfBlock,
+    Qt.Key_End: QTextCursor.EndOfBlock,
+}
+
+
+def cursor_position(cursor):
+    return cursor.position()
+
+
+def overlaps(cursor, other):
+    return (cursor.position() == other.position()
+            or cursor.selectionStart() < other.selectionEnd() and other.selectionStart() < cursor.selectionEnd())
+
+
+class MultiCursor(QObject):
+    # Extra carets besides the editor's own cursor, which stays the primary
+    # one. Alt+Click adds or removes a caret, Alt+drag selects a column and
+    # Ctrl+Alt+Up/Down adds a caret on the line above or below. While there
+    # are extra carets, typing, deleting, moving, cut, copy and paste act on
+    # all of them. Edits are made inside one edit block, so the document
+    # reports a single change spanning every caret: it is re-laid out,
+    # re-highlighted and indexed once, and one undo reverts it. The editor's
+    # own cursor is set once at the end, so the current line is updated once.
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        # Extra carets, sorted by position
+        self.cursors = []
+        # (block number, column) where an Alt+drag started
+        self.column_anchor = None
+
+        self.highlight_timer = QTimer(self)
+        self.highlight_timer.setSingleShot(True)
+        self.highlight_timer.setInterval(0)
+        self.highlight_timer.timeout.connect(self.update_highlights)
+        editor.verticalScrollBar().valueChanged.connect(self.highlight_timer.start)
+
+    def clear(self):
+        if self.cursors:
+            self.cursors = []
+            self.changed()
+
+    def changed(self):
+        self.update_highlights()
+        self.editor.viewport().update()
+
+    def all_cursors(self):
+        # The primary cursor first, then the extra ones
+        return [self.editor.textCursor()] + self.cursors
+
+    def set_cursors(self, primary, extra):
+        # Sorts the extra carets and drops those that coincide with or
+        # overlap another, the primary one winning
+        cursors = []
+        for cursor in sorted(extra, key=cursor_position):
+            if overlaps(cursor, primary) or cursors and overlaps(cursor, cursors[-1]):
+                continue
+            cursors.append(cursor)
+        self.cursors = cursors
+        self.editor.setTextCursor(primary)
+        self.changed()
+
+    def toggle_cursor_at(self, position):
+        for index, cursor in enumerate(self.cursors):
+            if cursor.position() == position and not cursor.hasSelection():
+                del self.cursors[index]
+                self.changed()
+                return
+        primary = self.editor.textCursor()
+        if primary.position() == position and not primary.hasSelection():
+            # The primary caret moves to the nearest extra one
+            if self.cursors:
+                self.set_cursors(self.cursors[0], self.cursors[1:])
+            return
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(position)
+        self.set_cursors(primary, self.cursors + [cursor])
+
+    def add_vertical(self, direction):
+        # A caret on the line above the topmost caret or below the lowest one
+        cursors = self.all_cursors()
+        edge = min(cursors, key=cursor_position) if direction < 0 else max(cursors, key=cursor_position)
+        block = edge.block().previous() if direction < 0 else edge.block().next()
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        cursor.setPosition(block.position() + min(edge.positionInBlock(), block.length() - 1))
+        self.set_cursors(cursors[0], cursors[1:] + [cursor])
+        self.editor.ensureCursorVisible()
+        if not self.editor.cursorRect(cursor).intersects(self.editor.viewport().rect()):
+            bar = self.editor.verticalScrollBar()
+            bar.setValue(bar.value() + direction)
+
+    def select_column(self, anchor, head):
+        # A caret or selection on every line from anchor to head, both
+        # (block number, column); the primary one is on the head's line
+        document = self.editor.document()
+        (first_line, first_column), (last_line, last_column) = anchor, head
+        step = 1 if last_line >= first_line else -1
+        cursors = []
+        for number in range(first_line, last_line + step, step):
+            block = document.findBlockByNumber(number)
+            if not block.isValid():
+                break
+            end = block.length() - 1
+            cursor = QTextCursor(block)
+            cursor.setPosition(block.position() + min(first_column, end))
+            cursor.setPosition(block.position() + min(last_column, end), QTextCursor.KeepAnchor)
+            cursors.append(cursor)
+        if cursors:
+            self.set_cursors(cursors[-1], cursors[:-1])
+
+    def mouse_press(self, event):
+        # Returns True if the press was taken
+        if event.button() != Qt.LeftButton or not event.modifiers() & Qt.AltModifier:
+            if event.button() == Qt.LeftButton:
+                self.clear()
+            return False
+        cursor = self.editor.cursorForPosition(event.position().toPoint())
+        self.column_anchor = (cursor.blockNumber(), cursor.positionInBlock())
+        self.toggle_cursor_at(cursor.position())
+        return True
+
+    def mouse_move(self, event):
+        if self.column_anchor is None or not event.buttons() & Qt.LeftButton:
+            return False
+        cursor = self.editor.cursorForPosition(event.position().toPoint())
+        head = (cursor.blockNumber(), cursor.positionInBlock())
+        if head != self.column_anchor:
+            self.select_column(self.column_anchor, head)
+        return True
+
+    def mouse_release(self, event):
+        if self.column_anchor is None:
+            return False
+        self.column_anchor = None
+        return True
+
+    def apply(self, edit, cursors=None):
+        # Calls edit(cursor) for every caret as one edit
+        if cursors is None:
+            cursors = self.all_cursors()
+        first = min(cursors, key=cursor_position).blockNumber()
+        last = max(cursors, key=cursor_position).blockNumber()
+        background_highlighter = self.editor.background_highlighter
+        if last - first > BACKGROUND_EDIT_BLOCKS:
+            background_highlighter.defer_from(first)
+        batch = QTextCursor(self.editor.document())
+        batch.beginEditBlock()
+        for cursor in cursors:
+            edit(cursor)
+        batch.endEditBlock()
+        background_highlighter.highlight_viewport()
+        self.set_cursors(cursors[0], cursors[1:])
+
+    def move(self, operation, mode):
+        cursors = self.all_cursors()
+        for cursor in cursors:
+            if mode == QTextCursor.MoveAnchor and cursor.hasSelection() and operation in (QTextCursor.Left, QTextCursor.Right):
+                # Collapses the selection to the side moved to
+                position = cursor.selectionStart() if operation == QTextCursor.Left else cursor.selectionEnd()
+                cursor.setPosition(position)
+            else:
+                cursor.movePosition(operation, mode)
+        self.set_cursors(cursors[0], cursors[1:])
+
+    def selected_texts(self):
+        cursors = sorted(self.all_cursors(), key=cursor_position)
+        return [cursor.selection().toPlainText() for cursor in cursors]
+
+    def copy(self):
+        QGuiApplication.clipboard().setText('\n'.join(self.selected_texts()))
+
+    def paste(self):
+        # One line of the clipboard per caret if the counts match, otherwise
+        # all of it at every caret
+        text = QGuiApplication.clipboard().text()
+        lines = text.split('\n')
+        cursors = self.all_cursors()
+        if len(lines) == len(cursors):
+            ordered = sorted(cursors, key=cursor_position)
+            texts = dict(zip((id(cursor) for cursor in ordered), lines))
+            self.apply(lambda cursor: cursor.insertText(texts[id(cursor)]), cursors)
+        else:
+            self.apply(lambda cursor: cursor.insertText(text), cursors)
+
+    def handle_key(self, event):
+        # Returns True if the key was taken
+        key = event.key()
+        modifiers = event.modifiers()
+        if key in (Qt.Key_Up, Qt.Key_Down) and modifiers & Qt.ControlModifier and modifiers & Qt.AltModifier:
+            self.add_vertical(-1 if key == Qt.Key_Up else 1)
+            return True
+        if not self.cursors:
+            return False
+        if self.editor.isReadOnly():
+            self.clear()
+            return False
+        if key == Qt.Key_Escape:
+            self.clear()
+        elif event.matches(QKeySequence.Copy):
+            self.copy()
+        elif event.matches(QKeySequence.Cut):
+            self.copy()
+            self.apply(QTextCursor.removeSelectedText)
+        elif event.matches(QKeySequence.Paste):
+            self.paste()
+        elif event.matches(QKeySequence.SelectAll):
+            self.clear()
+            return False
+        elif key == Qt.Key_Backspace:
+            self.apply(lambda cursor: cursor.removeSelectedText() if cursor.hasSelection() else cursor.deletePreviousChar())
+        elif key == Qt.Key_Delete:
+            self.apply(lambda cursor: cursor.removeSelectedText() if cursor.hasSelection() else cursor.deleteChar())
+        elif key in (Qt.Key_Return, Qt.Key_Enter):
+            self.apply(lambda cursor: cursor.insertText('\n'))
+        elif key in MOVE_KEYS and not modifiers & (Qt.ControlModifier | Qt.AltModifier):
+            mode = QTextCursor.KeepAnchor if modifiers & Qt.ShiftModifier else QTextCursor.MoveAnchor
+            self.move(MOVE_KEYS[key], mode)
+        elif event.text() and event.text().isprintable() and not modifiers & (Qt.ControlModifier | Qt.AltModifier):
+            text = event.text()
+            self.apply(lambda cursor: cursor.insertText(text))
+        elif key == Qt.Key_Tab and not modifiers:
+            self.apply(lambda cursor: cursor.insertText('\t'))
+        else:
+            return False
+        return True
+
+    def visible_cursors(self):
+        # The extra carets in the viewport
+        if not self.cursors:
+            return []
+        document = self.editor.document()
+        first, last = self.editor.visible_block_range()
+        last_block = document.findBlockByNumber(last)
+        low = bisect.bisect_left(self.cursors, document.findBlockByNumber(first).position(), key=cursor_position)
+        high = bisect.bisect_right(self.cursors, last_block.position() + last_block.length(), key=cursor_position)
+        return self.cursors[low:min(high, low + MAX_VISIBLE_CARETS)]
+
+    def update_highlights(self):
+        selections = []
+        palette = self.editor.palette()
+        for cursor in self.visible_cursors():
+            if cursor.hasSelection():
+                selection = QTextEdit.ExtraSelection()
+                selection.format.setBackground(palette.highlight())
+                selection.format.setForeground(palette.highlightedText())
+                selection.cursor = cursor
+                selections.append(selection)
+        self.editor.set_extra_selections('multi_cursor', selections)
+
+    def paint(self):
+        # Draws the extra carets over the viewport; the editor draws its own
+        cursors = self.visible_cursors()
+        if not cursors:
+            return
+        painter = QPainter(self.editor.viewport())
+        color = self.editor.palette().text().color()
+        width = self.editor.cursorWidth()
+        for cursor in cursors:
+            rect = self.editor.cursorRect(cursor)
+            painter.fillRect(rect.x(), rect.y(), width, rect.height(), color)
@@ -0,0 +1,139 @@
+from PySide6.QtWidgets import QDockWidget, QTreeWidget, QTreeWidgetItem
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QTextCursor
+
+# Idle time after an edit before the outline is rebuilt
+OUTLINE_REFRESH_MS = 500
+# Idle time after a cursor move before the current element is selected
+OUTLINE_FOLLOW_MS = 150
+# Set on items whose children have been listed
+LISTED_ROLE = Qt.UserRole + 1
+
+
+class OutlinePanel(QDockWidget):
+    # The document's elements as a tree, from the editor's TagIndex. Children
+    # are listed when an item is first expanded, so only what is shown is
+    # walked. After edits the tree is rebuilt once typing pauses, with the
+    # same items expanded; the element at the cursor is kept selected.
+    def __init__(self, editor, parent=None):
+        super().__init__("Outline", parent)
+        self.setObjectName("outline")
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemExpanded.connect(self.list_children)
+        self.tree.itemClicked.connect(self.go_to_item)
+        self.tree.itemActivated.connect(self.go_to_item)
+        self.setWidget(self.tree)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(OUTLINE_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.follow_timer = QTimer(self)
+        self.follow_timer.setSingleShot(True)
+        self.follow_timer.setInterval(OUTLINE_FOLLOW_MS)
+        self.follow_timer.timeout.connect(self.select_current)
+        self.editor = None
+        self.set_editor(editor)
+
+    def set_editor(self, editor):
+        # Follows the current tab; None, e.g. for a read-only view, empties it
+        if self.editor is not None:
+            self.editor.textChanged.disconnect(self.schedule_refresh)
+            self.editor.cursorPositionChanged.disconnect(self.schedule_follow)
+        self.editor = editor
+        self.refresh_timer.stop()
+        self.follow_timer.stop()
+        self.tree.clear()
+        if editor is not None:
+            editor.textChanged.connect(self.schedule_refresh)
+            editor.cursorPositionChanged.connect(self.schedule_follow)
+            if self.isVisible():
+                self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def schedule_refresh(self):
+        if self.isVisible():
+            self.refresh_timer.start()
+
+    def schedule_follow(self):
+        if self.isVisible() and not self.refresh_timer.isActive():
+            self.follow_timer.start()
+
+    def refresh(self):
+        self.refresh_timer.stop()
+        if self.editor is None:
+            return
+        expanded = set()
+        self.collect_expanded(self.tree.invisibleRootItem(), (), expanded)
+        self.tree.clear()
+        root = self.tree.invisibleRootItem()
+        self.add_children(root, None)
+        root.setData(0, LISTED_ROLE, True)
+        self.restore_expanded(root, (), expanded)
+        self.select_current()
+
+    def collect_expanded(self, item, path, expanded):
+        for row in range(item.childCount()):
+            child = item.child(row)
+            if child.isExpanded():
+                child_path = path + ((row, child.text(0)),)
+                expanded.add(child_path)
+                self.collect_expanded(child, child_path, expanded)
+
+    def restore_expanded(self, item, path, expanded):
+        for row in range(item.childCount()):
+            child = item.child(row)
+            child_path = path + ((row, child.text(0)),)
+            if child_path in expanded:
+                child.setExpanded(True)
+                self.restore_expanded(child, child_path, expanded)
+
+    def add_children(self, item, parent):
+        for block_number, index, label in self.editor.tag_index.children(parent):
+            child = QTreeWidgetItem(item, [label])
+            child.setData(0, Qt.UserRole, (block_number, index))
+            child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+    def list_children(self, item):
+        if item.data(0, LISTED_ROLE):
+            return
+        item.setData(0, LISTED_ROLE, True)
+        self.add_children(item, item.data(0, Qt.UserRole))
+        if not item.childCount():
+            item.setChildIndicatorPolicy(QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def select_current(self):
+        # Selects the innermost listed element containing the cursor
+        cursor = self.editor.textCursor()
+        path = self.editor.tag_index.ancestors(cursor.blockNumber(), cursor.positionInBlock())
+        item = self.tree.invisibleRootItem()
+        found = None
+        for element in path:
+            self.list_children(item)
+            child = next((item.child(row) for row in range(item.childCount())
+                          if item.child(row).data(0, Qt.UserRole) == element), None)
+            if child is None:
+                break
+            item = found = child
+        if found is None:
+            self.tree.clearSelection()
+            return
+        self.tree.setCurrentItem(found)
+        self.tree.scrollToItem(found)
+
+    def go_to_item(self, item):
+        block_number, index = item.data(0, Qt.UserRole)
+        events = self.editor.tag_index.events(block_number)
+        block = self.editor.document().findBlockByNumber(block_number)
+        if not block.isValid() or index >= len(events):
+            return
+        cursor = QTextCursor(block)
+        cursor.setPosition(block.position() + events[index][2])
+        self.editor.setTextCursor(cursor)
+        self.editor.centerCursor()
+        self.editor.setFocus()
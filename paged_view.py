@@ -0,0 +1,128 @@
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QScrollBar
+from PySide6.QtCore import Qt, QTimer, QEvent
+from editor import CodeEditor
+from file_loader import PagedFile
+
+# Extra lines loaded above and below the visible window
+PAGE_MARGIN_LINES = 50
+INDEX_INTERVAL_MS = 0
+
+
+class PagedFileView(QWidget):
+    # Read-only view of a file too large to load into a QTextDocument. The
+    # editor only ever holds the visible window of lines (plus a margin); the
+    # external scroll bar spans the whole file and pages lines in from a
+    # memory map as it moves.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paged_file = None
+        self.first_line = 0
+
+        self.editor = CodeEditor()
+        self.editor.setReadOnly(True)
+        self.editor.folding = False
+        # Only a window of the file is in the editor
+        self.editor.validation.set_enabled(False)
+        self.editor.set_minimap_visible(False)
+        self.editor.setLineWrapMode(CodeEditor.NoWrap)
+        self.editor.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.editor.installEventFilter(self)
+        self.editor.viewport().installEventFilter(self)
+
+        self.scroll_bar = QScrollBar(Qt.Vertical)
+        self.scroll_bar.valueChanged.connect(self.scroll_to_line)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.editor)
+        layout.addWidget(self.scroll_bar)
+        self.setLayout(layout)
+
+        self.index_timer = QTimer(self)
+        self.index_timer.setInterval(INDEX_INTERVAL_MS)
+        self.index_timer.timeout.connect(self.index_more)
+
+    def open(self, path, encoding):
+        self.close_file()
+        self.paged_file = PagedFile(path, encoding)
+        self.first_line = 0
+        # Index the start synchronously so the first page can be shown at once
+        self.paged_file.index_step(strides=16)
+        self.update_range()
+        self.load_page(0)
+        self.index_timer.start()
+
+    def close_file(self):
+        self.index_timer.stop()
+        if self.paged_file is not None:
+            self.paged_file.close()
+            self.paged_file = None
+
+    @property
+    def path(self):
+        return self.paged_file.path if self.paged_file else None
+
+    def index_more(self):
+        # Builds the line index a few MB at a time while the UI is idle
+        if not self.paged_file.index_step():
+            self.index_timer.stop()
+        self.update_range()
+
+    def visible_lines(self):
+        return max(1, self.editor.viewport().height() // max(1, self.editor.fontMetrics().lineSpacing()))
+
+    def update_range(self):
+        maximum = max(0, self.paged_file.line_count - self.visible_lines())
+        self.scroll_bar.setRange(0, maximum)
+        self.scroll_bar.setPageStep(self.visible_lines())
+
+    def scroll_to_line(self, line):
+        if self.paged_file is None:
+            return
+        first_loaded = self.first_line
+        last_loaded = first_loaded + self.editor.blockCount() - self.visible_lines()
+        if not first_loaded <= line <= last_loaded:
+            self.load_page(max(0, line - PAGE_MARGIN_LINES))
+        self.editor.verticalScrollBar().setValue(line - self.first_line)
+
+    def load_page(self, first_line):
+        count = self.visible_lines() + 2 * PAGE_MARGIN_LINES
+        lines = self.paged_file.read_lines(first_line, count)
+        self.first_line = first_line
+        self.editor.first_line_number = first_line + 1
+        self.editor.setPlainText('\n'.join(lines))
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Wheel:
+            steps = -event.angleDelta().y() // 40
+            self.scroll_bar.setValue(self.scroll_bar.value() + steps)
+            return True
+        if event.type() == QEvent.KeyPress and self.handle_key(event):
+            return True
+        return super().eventFilter(obj, event)
+
+    def handle_key(self, event):
+        moves = {
+            Qt.Key_PageDown: self.scroll_bar.pageStep(),
+            Qt.Key_PageUp: -self.scroll_bar.pageStep(),
+            Qt.Key_Down: 1,
+            Qt.Key_Up: -1,
+        }
+        if event.key() in moves:
+            self.scroll_bar.setValue(self.scroll_bar.value() + moves[event.key()])
+        elif event.key() == Qt.Key_Home and event.modifiers() & Qt.ControlModifier:
+            self.scroll_bar.setValue(0)
+        elif event.key() == Qt.Key_End and event.modifiers() & Qt.ControlModifier:
+            self.scroll_bar.setValue(self.scroll_bar.maximum())
+        else:
+            return False
+        return True
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.paged_file is not None:
+            self.update_range()
+            self.load_page(self.first_line)
+            self.scroll_to_line(self.scroll_bar.value())
@@ -1,10 +1,102 @@
+import json
+import os
 from PySide6.QtWebEngineWidgets import QWebEngineView
-from PySide6.QtCore import QUrl
+from PySide6.QtWebEngineCore import QWebEngineScript
+from PySide6.QtCore import Signal
+from dom_patch import DomPatcher
+from tracing import traced
+from preview_scheme import preview_scheme_handler, document_url
+
+# Replaces the contents of one element in place. The element is looked up
+# by tag name and index, then checked against its ancestors and current text
+# so a page changed by its own scripts is reloaded rather than mis-patched.
+PATCH_SCRIPT = """
+(function (name, nth, chain, html, oldText) {
+    var el = name === 'body' ? document.body : document.getElementsByTagName(name)[nth];
+    if (!el) return false;
+    var node = el;
+    for (var i = chain.length - 1; i >= 0; i--) {
+        node = node.parentElement;
+        if (!node || node.localName.toLowerCase() !== chain[i]) return false;
+    }
+    if (el.textContent.replace(/\\s+/g, '') !== oldText) return false;
+    el.innerHTML = html;
+    return true;
+})(%s, %s, %s, %s, %s)
+"""
+
 
 class LivePreview(QWebEngineView):
+    # Emitted when a full load or an in-place patch has been applied
+    render_finished = Signal()
+
     def __init__(self):
         super().__init__()
-        self.setHtml("<html><body><h1>Live Preview</h1></body></html>")
+        # Apply edits to the loaded page instead of reloading it
+        self.incremental = True
+        self.patcher = DomPatcher()
+        self.loading = False
+        # Pages are served from memory through the preview: scheme, at the
+        # path of the file being edited so relative links resolve
+        self.document_path = os.path.join(os.getcwd(), 'untitled.html')
+        self.load_count = 0
+        self.scheme_handler = preview_scheme_handler()
+        self.scheme_handler.asset_changed.connect(self.handle_asset_changed)
+        self.loadStarted.connect(self.handle_load_started)
+        self.loadFinished.connect(self.handle_load_finished)
+        self.load_html("<html><body><h1>Live Preview</h1></body></html>")
 
+    @traced('preview update')
     def update_preview(self, html_content):
-        self.setHtml(html_content, QUrl("file:///"))
+        # Returns False if there was nothing to render
+        if self.incremental and not self.loading and self.patcher.html is not None:
+            if html_content == self.patcher.html:
+                return False
+            patch = self.patcher.patch_for(html_content)
+            if patch is not None:
+                self.apply_patch(patch)
+                return True
+        self.load_html(html_content)
+        return True
+
+    def set_document_path(self, path):
+        path = os.path.abspath(path)
+        if path == self.document_path:
+            return
+        self.scheme_handler.remove_document(self.document_path)
+        self.document_path = path
+        # The loaded page belongs to the previous document; load in full next time
+        self.patcher.reset(None)
+
+    def load_html(self, html_content):
+        self.patcher.reset(html_content)
+        self.scheme_handler.set_document(self.document_path, html_content)
+        # A new query string per load keeps the engine from reusing the old page
+        self.load_count += 1
+        url = document_url(self.document_path)
+        url.setQuery(f"v={self.load_count}")
+        self.setUrl(url)
+
+    def handle_asset_changed(self, path):
+        # A linked file next to the document changed on disk
+        if path.startswith(os.path.dirname(self.document_path) + os.sep) and self.patcher.html is not None:
+            self.load_html(self.patcher.html)
+
+    def apply_patch(self, patch):
+        script = PATCH_SCRIPT % tuple(json.dumps(value) for value in (
+            patch.name, patch.nth, patch.chain, patch.inner_html, patch.old_text))
+        self.page().runJavaScript(script, QWebEngineScript.ApplicationWorld, self.handle_patch_result)
+
+    def handle_patch_result(self, applied):
+        if applied:
+            self.render_finished.emit()
+        else:
+            # Reload whatever is current; later patches were based on it too
+            self.load_html(self.patcher.html)
+
+    def handle_load_started(self):
+        self.loading = True
+
+    def handle_load_finished(self, ok):
+        self.loading = False
+        self.render_finished.emit()
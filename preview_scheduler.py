@@ -0,0 +1,111 @@
+from PySide6.QtCore import QObject, QTimer, QElapsedTimer, Signal
+from tracing import traced
+
+MIN_DEBOUNCE_MS = 30
+MAX_DEBOUNCE_MS = 1500
+# Debounce and minimum gap between renders, as multiples of the render time
+DEBOUNCE_FACTOR = 1.5
+INTERVAL_FACTOR = 3
+# Longest a run of edits may keep postponing a render, in debounce periods
+MAX_POSTPONE = 4
+# Weight of the newest render time in the running average
+SMOOTHING = 0.3
+# A render not reported finished after this long is given up on
+STALLED_RENDER_MS = 5000
+
+
+class PreviewScheduler(QObject):
+    # Decides when the preview re-renders. The debounce and the minimum gap
+    # between renders follow the measured render time, so cheap pages update
+    # almost at once and heavy ones are not re-rendered faster than they can
+    # be drawn. Requests arriving during a render replace each other; only
+    # the newest is rendered once the current one finishes. Content identical
+    # to the last render is skipped.
+    stats_changed = Signal()
+
+    def __init__(self, preview, get_text, parent=None):
+        super().__init__(parent)
+        self.preview = preview
+        self.get_text = get_text
+        self.last_hash = None
+        self.in_flight = False
+
+        self.average_ms = 0.0
+        self.last_latency_ms = 0
+        self.renders = 0
+        self.skipped = 0
+
+        self.clock = QElapsedTimer()
+        self.clock.start()
+        # Time of the oldest request not yet being rendered, and of the one
+        # the current render is for
+        self.first_request = None
+        self.rendering_request = None
+        self.render_started = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.render)
+
+        preview.render_finished.connect(self.handle_render_finished)
+
+    def debounce_ms(self):
+        return int(min(MAX_DEBOUNCE_MS, max(MIN_DEBOUNCE_MS, self.average_ms * DEBOUNCE_FACTOR)))
+
+    def min_interval_ms(self):
+        return int(min(MAX_DEBOUNCE_MS, self.average_ms * INTERVAL_FACTOR))
+
+    def schedule(self):
+        now = self.clock.elapsed()
+        if self.first_request is None:
+            self.first_request = now
+        if self.in_flight and now - self.render_started > STALLED_RENDER_MS:
+            self.in_flight = False
+        if self.in_flight:
+            return
+        # Keep postponing while the user types, but not indefinitely
+        if self.timer.isActive() and now - self.first_request > self.debounce_ms() * MAX_POSTPONE:
+            return
+        self.timer.start(self.debounce_ms())
+
+    @traced('preview')
+    def render(self):
+        if self.in_flight or self.first_request is None:
+            return
+        if self.render_started is not None:
+            wait = self.render_started + self.min_interval_ms() - self.clock.elapsed()
+            if wait > 0:
+                self.timer.start(wait)
+                return
+
+        text = self.get_text()
+        content_hash = hash(text)
+        if content_hash == self.last_hash:
+            self.skipped += 1
+            self.first_request = None
+            self.stats_changed.emit()
+            return
+        self.last_hash = content_hash
+        self.render_started = self.clock.elapsed()
+        self.rendering_request = self.first_request
+        self.first_request = None
+        self.in_flight = self.preview.update_preview(text)
+
+    def handle_render_finished(self):
+        if not self.in_flight:
+            return
+        self.in_flight = False
+        now = self.clock.elapsed()
+        sample = now - self.render_started
+        self.average_ms = sample if self.renders == 0 else (1 - SMOOTHING) * self.average_ms + SMOOTHING * sample
+        self.renders += 1
+        self.last_latency_ms = now - self.rendering_request
+        self.stats_changed.emit()
+
+        if self.first_request is not None:
+            # Edits arrived during the render; only the newest text is rendered
+            self.timer.start(self.debounce_ms())
+
+    def stats_text(self):
+        return (f"Preview: {self.last_latency_ms} ms latency, {self.average_ms:.0f} ms render, "
+                f"{self.renders} renders, {self.skipped} skipped")
@@ -0,0 +1,122 @@
+import mimetypes
+import os
+from collections import OrderedDict
+from PySide6.QtCore import QBuffer, QFileSystemWatcher, QIODevice, QObject, QUrl, Signal
+from PySide6.QtWebEngineCore import (
+    QWebEngineProfile, QWebEngineUrlRequestJob, QWebEngineUrlScheme, QWebEngineUrlSchemeHandler
+)
+
+SCHEME = b'preview'
+# Linked files kept in memory, least recently used evicted first
+ASSET_CACHE_BYTES = 64 * 1024 * 1024
+# Larger files are read from disk on every request
+MAX_CACHED_ASSET_BYTES = 8 * 1024 * 1024
+
+_handler = None
+
+
+def register_preview_scheme():
+    # Must run before the QApplication is created
+    scheme = QWebEngineUrlScheme(SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalAccessAllowed
+                    | QWebEngineUrlScheme.CorsEnabled)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def preview_scheme_handler():
+    # One handler serves every preview; it is installed on the default profile
+    global _handler
+    if _handler is None:
+        _handler = PreviewSchemeHandler()
+        QWebEngineProfile.defaultProfile().installUrlSchemeHandler(SCHEME, _handler)
+    return _handler
+
+
+def document_url(path):
+    # preview: URL for a document at path; relative links resolve next to it
+    url = QUrl()
+    url.setScheme(SCHEME.decode())
+    url.setPath(QUrl.fromLocalFile(os.path.abspath(path)).path())
+    return url
+
+
+def mime_type(path):
+    mime, _ = mimetypes.guess_type(path)
+    return (mime or 'application/octet-stream').encode()
+
+
+class AssetCache(QObject):
+    # Contents of linked local files, bounded by total size. Cached files are
+    # watched and dropped as soon as they change on disk.
+    changed = Signal(str)
+
+    def __init__(self, max_bytes=ASSET_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.invalidate)
+
+    def read(self, path):
+        data = self.entries.get(path)
+        if data is not None:
+            self.entries.move_to_end(path)
+            return data
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) <= MAX_CACHED_ASSET_BYTES:
+            self.entries[path] = data
+            self.size += len(data)
+            self.watcher.addPath(path)
+            while self.size > self.max_bytes:
+                evicted, evicted_data = self.entries.popitem(last=False)
+                self.size -= len(evicted_data)
+                self.watcher.removePath(evicted)
+        return data
+
+    def invalidate(self, path):
+        data = self.entries.pop(path, None)
+        if data is not None:
+            self.size -= len(data)
+        self.watcher.removePath(path)
+        self.changed.emit(path)
+
+
+class PreviewSchemeHandler(QWebEngineUrlSchemeHandler):
+    # Serves preview documents from memory and the files they link to from
+    # the asset cache. URL paths are local file paths.
+    asset_changed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.documents = {}
+        self.assets = AssetCache(parent=self)
+        self.assets.changed.connect(self.asset_changed)
+
+    def set_document(self, path, html):
+        # The BOM makes the page decode as UTF-8 whatever it declares
+        self.documents[QUrl.fromLocalFile(os.path.abspath(path)).path()] = html.encode('utf-8-sig')
+
+    def remove_document(self, path):
+        self.documents.pop(QUrl.fromLocalFile(os.path.abspath(path)).path(), None)
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        data = self.documents.get(url.path())
+        if data is not None:
+            mime = b'text/html'
+        else:
+            url.setScheme('file')
+            path = url.toLocalFile()
+            try:
+                data = self.assets.read(os.path.normpath(path))
+            except OSError:
+                job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+                return
+            mime = mime_type(path)
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime, buffer)
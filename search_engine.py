@@ -0,0 +1,159 @@
+import bisect
+import re
+from array import array
+from text_utils import common_affixes
+
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+
+class SearchQuery:
+    def __init__(self, text, regex=False, case_sensitive=False, whole_words=False):
+        self.text = text
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self.whole_words = whole_words
+
+    def compile(self):
+        # Raises re.error for an invalid regular expression
+        pattern = self.text if self.regex else re.escape(self.text)
+        if self.whole_words:
+            pattern = r'\b(?:%s)\b' % pattern
+        flags = re.MULTILINE
+        if not self.case_sensitive:
+            flags |= re.IGNORECASE
+        return re.compile(pattern, flags)
+
+    def compile_for(self, text):
+        # Returns the pattern and the text to run it on. Case-insensitive
+        # matching is several times slower than exact matching, so literal
+        # queries search a lower-cased copy when lowering keeps every offset.
+        if not self.regex and not self.case_sensitive:
+            lowered = text.lower()
+            if len(lowered) == len(text):
+                query = SearchQuery(self.text.lower(), case_sensitive=True, whole_words=self.whole_words)
+                return query.compile(), lowered
+        return self.compile(), text
+
+    def extends(self, other):
+        # True if every match of this query starts where a match of other
+        # starts, so other's matches can be filtered instead of searching the
+        # text again
+        if (other is None or other.regex or self.regex or self.whole_words or other.whole_words
+                or other.case_sensitive != self.case_sensitive or not self.text.startswith(other.text)):
+            return False
+        # other's matches are all of its occurrences only if they cannot
+        # overlap, i.e. no proper prefix of other is also a suffix
+        text = other.text if other.case_sensitive else other.text.lower()
+        return not any(text[:k] == text[-k:] for k in range(1, len(text)))
+
+
+class Utf16Mapper:
+    # Converts Python string offsets to Qt (UTF-16) positions. Only differs
+    # from the identity when the text has characters outside the BMP.
+    def __init__(self, text):
+        self.astral = [m.start() for m in _ASTRAL.finditer(text)] if not text.isascii() else []
+
+    def __call__(self, offset):
+        if not self.astral:
+            return offset
+        return offset + bisect.bisect_left(self.astral, offset)
+
+    def to_python(self, position):
+        # Inverse of __call__
+        if not self.astral:
+            return position
+        low, high = 0, len(self.astral)
+        while low < high:
+            mid = (low + high) // 2
+            if self.astral[mid] + mid < position:
+                low = mid + 1
+            else:
+                high = mid
+        return position - low
+
+
+def qt_position(text, offset):
+    # Single conversion; cheaper than building a Utf16Mapper for one offset
+    if text.isascii():
+        return offset
+    return len(text[:offset].encode('utf-16-le')) // 2
+
+
+def find_matches(pattern, text, start=0, candidates=None, limit=None):
+    # Yields (start, end) offsets of non-empty matches. With candidates,
+    # only matches starting at those offsets are considered.
+    if candidates is not None:
+        match = pattern.match
+        end = 0
+        for offset in candidates:
+            if offset < end:
+                continue
+            m = match(text, offset)
+            if m and m.end() > offset:
+                end = m.end()
+                yield offset, end
+        return
+    for m in pattern.finditer(text, start):
+        if m.end() > m.start():
+            yield m.span()
+
+
+def replace_all(pattern, text, replacement, regex=False):
+    # Computes every replacement in one pass. Returns (start, end, new, count):
+    # text[start:end] is the smallest span that changed and new replaces it.
+    # Empty matches are left alone, as find_matches() skips them. Regex
+    # replacements may use \1 and \g<name>; literal ones are inserted as-is.
+    # Raises re.error for a bad group reference.
+    count = 0
+
+    def substitute(m):
+        nonlocal count
+        if m.end() == m.start():
+            return ''
+        count += 1
+        return m.expand(replacement) if regex else replacement
+
+    new_text = pattern.sub(substitute, text)
+    if not count:
+        return 0, 0, '', 0
+    prefix, suffix = common_affixes(text, new_text)
+    return prefix, len(text) - suffix, new_text[prefix:len(new_text) - suffix], count
+
+
+class MatchIndex:
+    # Sorted match offsets, stored as flat integer arrays. Lookups relative
+    # to a position are bisections.
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def extend(self, starts, ends):
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+
+    def span(self, index):
+        return self.starts[index], self.ends[index]
+
+    def next_after(self, position):
+        # Index of the first match starting at or after position, or None
+        index = bisect.bisect_left(self.starts, position)
+        return index if index < len(self.starts) else None
+
+    def previous_before(self, position):
+        # Index of the last match starting before position, or None
+        index = bisect.bisect_left(self.starts, position) - 1
+        return index if index >= 0 else None
+
+    def index_of(self, start, end):
+        index = bisect.bisect_left(self.starts, start)
+        if index < len(self.starts) and self.starts[index] == start and self.ends[index] == end:
+            return index
+        return None
+
+    def range_between(self, first, last):
+        # Indices of matches overlapping [first, last)
+        return bisect.bisect_right(self.ends, first), bisect.bisect_left(self.starts, last)
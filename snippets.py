@@ -0,0 +1,9 @@
+# Text inserted for a trigger word, by typing the word and pressing Tab or
+# from the editor's context menu; the batch replace command can insert them
+# too
+SNIPPETS = {
+    'html': "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n    <meta charset=\"UTF-8\">\n    <meta http-equiv=\"X-UA-Compatible\" content=\"IE=edge\">\n    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">\n    <title>Document</title>\n</head>\n<body>\n    \n</body>\n</html>",
+    'table': "<table>\n    <tr>\n        <th>Header 1</th>\n        <th>Header 2</th>\n    </tr>\n    <tr>\n        <td>Data 1</td>\n        <td>Data 2</td>\n    </tr>\n</table>",
+    'div': "<div>\n    \n</div>",
+    # Add more snippets as needed
+}
@@ -0,0 +1,79 @@
+import sys
+import time
+from PySide6.QtCore import QObject, QTimer
+
+# main.py --profile-startup: how long each phase of starting the editor
+# takes, printed to stderr once the window is painted, the file given on the
+# command line is loaded and the preview has rendered. The phases after the
+# window is shown overlap, so each is reported against the start as well as
+# against the phase before it. If that file fails to open, or the phases are
+# not all reached in time, the ones that were are printed then.
+
+# Time after which the report is printed with whatever has been reached
+REPORT_TIMEOUT_MS = 30000
+
+
+class StartupProfile(QObject):
+    def __init__(self, started, parent=None):
+        super().__init__(parent)
+        self.started = self.last = started
+        self.phases = []
+        # Phases still to be reached before the report is printed
+        self.waiting = set()
+        self.reported = False
+        self.timeout = QTimer(self)
+        self.timeout.setSingleShot(True)
+        self.timeout.setInterval(REPORT_TIMEOUT_MS)
+        self.timeout.timeout.connect(self.report)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, now - self.started))
+        self.last = now
+        if phase in self.waiting:
+            self.waiting.discard(phase)
+            if not self.waiting:
+                self.report()
+
+    def watch(self, window, loading=False):
+        self.waiting.update(("first paint", "preview created", "preview rendered"))
+        window.first_painted.connect(lambda: self.mark("first paint"))
+        window.preview_created.connect(lambda: self.watch_preview(window.preview))
+        if loading:
+            # The first file opened from the command line to finish loading
+            self.waiting.add("file loaded")
+            window.tabs.page_added.connect(self.watch_page)
+            window.open_failed.connect(self.handle_open_failed)
+        self.timeout.start()
+
+    def handle_open_failed(self):
+        if "file loaded" in self.waiting:
+            self.mark("file failed")
+            self.report()
+
+    def watch_preview(self, preview):
+        self.mark("preview created")
+
+        def rendered():
+            preview.render_finished.disconnect(rendered)
+            self.mark("preview rendered")
+        preview.render_finished.connect(rendered)
+
+    def watch_page(self, page):
+        def loaded():
+            if page.loader is None and "file loaded" in self.waiting:
+                self.mark("file loaded")
+        page.loading_changed.connect(loaded)
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        self.timeout.stop()
+        names = [phase for phase, _, _ in self.phases] + list(self.waiting)
+        width = max(len(name) for name in names)
+        print("Startup profile:", file=sys.stderr)
+        for phase, elapsed, total in self.phases:
+            print(f"  {phase:<{width}}  {elapsed * 1000:8.1f} ms  {total * 1000:8.1f} ms", file=sys.stderr)
+        for phase in sorted(self.waiting):
+            print(f"  {phase:<{width}}  not reached", file=sys.stderr)
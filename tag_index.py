@@ -0,0 +1,599 @@
+from pygments.token import Token
+
+# Elements that never have an end tag
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'meta', 'param', 'source', 'track', 'wbr', '!doctype'
+))
+# Blocks per leaf chunk of TagTree; chunks are split at twice this size
+CHUNK_SIZE = 64
+# Edits replacing more blocks than this rebuild the tree instead of splicing
+REBUILD_BLOCKS = CHUNK_SIZE * 16
+# Most children listed for one element of the outline
+MAX_CHILDREN = 5000
+
+INF = float('inf')
+
+
+def extract_tags(tokens, html=True):
+    # Tag events of one block's tokens, before nesting is known:
+    # (kind, name, start, end, label) with kind 'open' for '<name', 'close'
+    # for '</name', 'self_close' for '/>' and 'end' for the '>' ending a
+    # tag. start and end are the character span of the name or marker;
+    # label is the name with the element's id and classes, for the outline.
+    # An 'end' only matters before the block's first tag, where it may end a
+    # start tag left open by the previous block; later ones are left out.
+    # Also returns the name of the start tag the block ends inside, '' if it
+    # ends outside of tags, or None if it has no tag markers at all and so
+    # ends wherever the previous block ended.
+    events = []
+    ends_in = None
+    after_lt = closing = False
+    slash = None
+    opened = None
+    attribute = None
+    for pos, ttype, content in tokens:
+        if html:
+            if ttype is Token.Punctuation:
+                if content == '<':
+                    after_lt, closing = True, False
+                elif content == '/':
+                    if after_lt:
+                        closing = True
+                    else:
+                        slash = pos
+                elif content == '>':
+                    if slash == pos - 1:
+                        events.append(('self_close', None, slash, pos + 1, None))
+                    elif not events:
+                        events.append(('end', None, pos, pos + 1, None))
+                    after_lt = False
+                    slash = opened = None
+                    ends_in = ''
+                continue
+            if ttype is Token.Name.Tag and after_lt:
+                name = content.lower()
+                if closing:
+                    events.append(('close', name, pos, pos + len(content), None))
+                else:
+                    opened = len(events)
+                    events.append(('open', name, pos, pos + len(content), name))
+                    ends_in = name
+                after_lt = False
+                continue
+            if ttype is not Token.Text:
+                after_lt = False
+        elif ttype is Token.Name.Tag:
+            if content.startswith('</'):
+                name = content[2:].rstrip('>').strip()
+                events.append(('close', name, pos + 2, pos + 2 + len(name), None))
+                ends_in = ''
+            elif content.startswith('<'):
+                opened = len(events)
+                events.append(('open', content[1:], pos + 1, pos + len(content), content[1:]))
+                ends_in = content[1:]
+            elif content.strip() == '/>':
+                events.append(('self_close', None, pos, pos + len(content), None))
+                opened = None
+                ends_in = ''
+            elif content.strip() == '>':
+                if not events:
+                    events.append(('end', None, pos, pos + len(content), None))
+                opened = None
+                ends_in = ''
+            continue
+
+        if opened is None:
+            continue
+        if ttype is Token.Name.Attribute:
+            attribute = content.rstrip('=').strip().lower()
+        elif ttype in Token.Literal.String and attribute in ('id', 'class'):
+            value = content.strip('"\'').split()
+            if value:
+                kind, name, start, end, label = events[opened]
+                if attribute == 'id':
+                    label = label.replace(name, f"{name}#{value[0]}", 1)
+                else:
+                    label += ''.join('.' + word for word in value)
+                events[opened] = (kind, name, start, end, label)
+            attribute = None
+    return tuple(events), ends_in
+
+
+def nest_tags(tags, inside, html=True):
+    # Turns a block's tag events into nesting changes, given the name of the
+    # start tag the previous block ended inside: (delta, name, start, end,
+    # label) with delta +1 for an element opening and -1 for one closing. A
+    # self-closing '/>' closes the element its tag opened and has no name.
+    # Returns the leaf summary of the block for TagTree.
+    void = VOID_ELEMENTS if html else ()
+    events = []
+    depth = 0
+    low_before = low_after = INF
+    for event in tags:
+        kind, name = event[0], event[1]
+        if kind == 'open':
+            inside = name
+            if name in void:
+                continue
+            delta = 1
+        elif kind == 'close':
+            inside = ''
+            if name in void:
+                continue
+            delta = -1
+        else:
+            closed = kind == 'self_close' and inside and inside not in void
+            inside = ''
+            if not closed:
+                continue
+            delta = -1
+        if depth < low_before:
+            low_before = depth
+        depth += delta
+        if depth < low_after:
+            low_after = depth
+        events.append((delta, name, event[2], event[3], event[4]))
+    return depth, low_before, low_after, tuple(events), inside
+
+
+EMPTY_LEAF = (0, INF, INF, (), '')
+
+
+def _summarize(leaves):
+    depth = 0
+    low_before = low_after = INF
+    for leaf in leaves:
+        if depth + leaf[1] < low_before:
+            low_before = depth + leaf[1]
+        if depth + leaf[2] < low_after:
+            low_after = depth + leaf[2]
+        depth += leaf[0]
+    return len(leaves), depth, low_before, low_after
+
+
+class TagTree:
+    # One leaf per block: (sum, low_before, low_after, events, inside), where
+    # sum is the block's net change in nesting depth and low_before and
+    # low_after the lowest depth, relative to the block start, before and
+    # after any of its events. Leaves are kept in chunks under a segment tree
+    # of chunk summaries, so the depth at a block and the next or previous
+    # block reaching a given depth are found in O(log n) plus a scan of one
+    # chunk, and an edit only splices the chunks it touches.
+    def __init__(self):
+        self.reset([EMPTY_LEAF])
+
+    def reset(self, leaves):
+        self.chunks = [leaves[i:i + CHUNK_SIZE] for i in range(0, len(leaves), CHUNK_SIZE)] or [[]]
+        self.build()
+
+    def build(self):
+        size = 1
+        while size < len(self.chunks):
+            size *= 2
+        self.size = size
+        self.count = [0] * (2 * size)
+        self.sum = [0] * (2 * size)
+        self.low_before = [INF] * (2 * size)
+        self.low_after = [INF] * (2 * size)
+        for k, chunk in enumerate(self.chunks):
+            self.set_node(size + k, chunk)
+        for node in range(size - 1, 0, -1):
+            self.pull(node)
+
+    def set_node(self, node, chunk):
+        self.count[node], self.sum[node], self.low_before[node], self.low_after[node] = _summarize(chunk)
+
+    def pull(self, node):
+        left, right = 2 * node, 2 * node + 1
+        left_sum = self.sum[left]
+        self.count[node] = self.count[left] + self.count[right]
+        self.sum[node] = left_sum + self.sum[right]
+        self.low_before[node] = min(self.low_before[left], left_sum + self.low_before[right])
+        self.low_after[node] = min(self.low_after[left], left_sum + self.low_after[right])
+
+    def update_chunk(self, k):
+        node = self.size + k
+        self.set_node(node, self.chunks[k])
+        node //= 2
+        while node:
+            self.pull(node)
+            node //= 2
+
+    def __len__(self):
+        return self.count[1]
+
+    def locate(self, index):
+        # (chunk, offset, depth before the leaf)
+        if index >= self.count[1]:
+            return len(self.chunks) - 1, len(self.chunks[-1]), self.sum[1]
+        node = 1
+        depth = 0
+        count = self.count
+        while node < self.size:
+            left = 2 * node
+            if index < count[left]:
+                node = left
+            else:
+                index -= count[left]
+                depth += self.sum[left]
+                node = left + 1
+        chunk = self.chunks[node - self.size]
+        for leaf in chunk[:index]:
+            depth += leaf[0]
+        return node - self.size, index, depth
+
+    def leaf(self, index):
+        k, offset, _ = self.locate(index)
+        return self.chunks[k][offset]
+
+    def depth_before(self, index):
+        return self.locate(index)[2]
+
+    def leaves(self, start=0):
+        k, offset, _ = self.locate(start)
+        yield from self.chunks[k][offset:]
+        for chunk in self.chunks[k + 1:]:
+            yield from chunk
+
+    def set(self, start, leaves):
+        # Overwrites the leaves from start on, summarizing each chunk once
+        k, offset, _ = self.locate(start)
+        i = 0
+        while i < len(leaves):
+            chunk = self.chunks[k]
+            n = min(len(chunk) - offset, len(leaves) - i)
+            chunk[offset:offset + n] = leaves[i:i + n]
+            self.update_chunk(k)
+            i += n
+            k += 1
+            offset = 0
+
+    def replace(self, first, removed, leaves):
+        # Replaces the leaves of blocks [first, first + removed)
+        if removed + len(leaves) > REBUILD_BLOCKS:
+            everything = list(self.leaves())
+            everything[first:first + removed] = leaves
+            self.reset(everything)
+            return
+        k1, offset, _ = self.locate(first)
+        k2, end, _ = self.locate(first + removed)
+        piece = [leaf for chunk in self.chunks[k1:k2 + 1] for leaf in chunk]
+        end += sum(len(chunk) for chunk in self.chunks[k1:k2])
+        piece[offset:end] = leaves
+        if len(piece) <= 2 * CHUNK_SIZE:
+            pieces = [piece] if piece or len(self.chunks) == k2 - k1 + 1 else []
+        else:
+            pieces = [piece[i:i + CHUNK_SIZE] for i in range(0, len(piece), CHUNK_SIZE)]
+        chunk_count = len(self.chunks)
+        self.chunks[k1:k2 + 1] = pieces
+        if len(self.chunks) != chunk_count:
+            self.build()
+        else:
+            for k in range(k1, k1 + len(pieces)):
+                self.update_chunk(k)
+
+    def first_reaching(self, start, target):
+        # First leaf from start on with an event after which the depth is at
+        # most target: (index, depth before the leaf) or None
+        if start >= self.count[1]:
+            return None
+        k, offset, depth = self.locate(start)
+        index = start
+        for leaf in self.chunks[k][offset:]:
+            if depth + leaf[2] <= target:
+                return index, depth
+            depth += leaf[0]
+            index += 1
+        node = self.size + k
+        while node > 1:
+            if node % 2 == 0:
+                sibling = node + 1
+                if depth + self.low_after[sibling] <= target:
+                    node = sibling
+                    while node < self.size:
+                        left = 2 * node
+                        if depth + self.low_after[left] <= target:
+                            node = left
+                        else:
+                            depth += self.sum[left]
+                            index += self.count[left]
+                            node = left + 1
+                    for leaf in self.chunks[node - self.size]:
+                        if depth + leaf[2] <= target:
+                            return index, depth
+                        depth += leaf[0]
+                        index += 1
+                    return None
+                depth += self.sum[sibling]
+                index += self.count[sibling]
+            node //= 2
+        return None
+
+    def last_reaching(self, end, target):
+        # Last leaf before end with an event before which the depth is at
+        # most target: (index, depth before the leaf) or None
+        if end <= 0:
+            return None
+        k, offset, depth = self.locate(end)
+        chunk = self.chunks[k]
+        for leaf in chunk[:offset]:
+            depth -= leaf[0]
+        index = end - offset
+        found = self._last_in_chunk(chunk[:offset], index, depth, target)
+        if found is not None:
+            return found
+        node = self.size + k
+        while node > 1:
+            if node % 2 == 1:
+                sibling = node - 1
+                depth -= self.sum[sibling]
+                index -= self.count[sibling]
+                if depth + self.low_before[sibling] <= target:
+                    node = sibling
+                    while node < self.size:
+                        left, right = 2 * node, 2 * node + 1
+                        if depth + self.sum[left] + self.low_before[right] <= target:
+                            depth += self.sum[left]
+                            index += self.count[left]
+                            node = right
+                        else:
+                            node = left
+                    return self._last_in_chunk(self.chunks[node - self.size], index, depth, target)
+            node //= 2
+        return None
+
+    def _last_in_chunk(self, leaves, index, depth, target):
+        depths = []
+        for leaf in leaves:
+            depths.append(depth)
+            depth += leaf[0]
+        for i in range(len(leaves) - 1, -1, -1):
+            if depths[i] + leaves[i][1] <= target:
+                return index + i, depths[i]
+        return None
+
+
+class TagIndex:
+    # Element structure of a document, from the tag events the highlighter
+    # stores with every block. Highlighted blocks are marked dirty and
+    # re-read on the next query; edits splice the blocks they replace. An
+    # element is referred to by the (block, event) of its open or close tag.
+    def __init__(self, editor):
+        self.editor = editor
+        self.document = editor.document()
+        self.html = True
+        self.tree = TagTree()
+        self.dirty = set()
+        self.changed = False
+        # Connected before the highlighter, so splicing happens before the
+        # changed blocks are re-highlighted and marked dirty
+        self.document.contentsChange.connect(self.handle_contents_change)
+
+    def handle_contents_change(self, position, removed, added):
+        if self.editor.is_refreshing_formats():
+            return
+        document = self.document
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        first, last = first.blockNumber(), last.blockNumber()
+        delta = document.blockCount() - len(self.tree)
+        old_last = last - delta
+        # Dirty blocks were numbered before this edit
+        dirty = set()
+        for number in self.dirty:
+            if number < first:
+                dirty.add(number)
+            elif number > old_last:
+                dirty.add(number + delta)
+        dirty.update(range(first, last + 2))
+        self.dirty = {number for number in dirty if number < document.blockCount()}
+        self.tree.replace(first, old_last - first + 1, [EMPTY_LEAF] * (last - first + 1))
+        self.changed = True
+
+    def mark_dirty(self, block_number):
+        self.dirty.add(block_number)
+        self.changed = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        if len(self.dirty) > len(self.tree) // 8 + CHUNK_SIZE:
+            self.rebuild()
+            return
+        tree = self.tree
+        numbers = sorted(self.dirty)
+        self.dirty = set()
+        i = 0
+        # Runs of consecutive blocks are re-read in one pass
+        while i < len(numbers) and numbers[i] < len(tree):
+            start = numbers[i]
+            block = self.document.findBlockByNumber(start)
+            inside = tree.leaf(start - 1)[4] if start else ''
+            old_leaves = tree.leaves(start)
+            leaves = []
+            while block.isValid():
+                leaf = self.leaf_for(block, inside)
+                old = next(old_leaves)
+                leaves.append(leaf)
+                inside = leaf[4]
+                block = block.next()
+                number = start + len(leaves)
+                while i < len(numbers) and numbers[i] < number:
+                    i += 1
+                # The next block's tags depend on the tag this one ends
+                # inside, so it is re-read if that changed
+                if (i == len(numbers) or numbers[i] != number) and inside == old[4]:
+                    break
+            tree.set(start, leaves)
+
+    def rebuild(self):
+        self.dirty = set()
+        leaves = []
+        inside = ''
+        block = self.document.firstBlock()
+        while block.isValid():
+            leaf = self.leaf_for(block, inside)
+            leaves.append(leaf)
+            inside = leaf[4]
+            block = block.next()
+        self.tree.reset(leaves)
+
+    def leaf_for(self, block, inside):
+        data = block.userData()
+        tags = getattr(data, 'tags', None)
+        if not tags:
+            ends_in = getattr(data, 'ends_in', None)
+            return (0, INF, INF, (), inside if ends_in is None else ends_in)
+        return nest_tags(tags, inside, self.html)
+
+    def events(self, block_number):
+        self.flush()
+        if not 0 <= block_number < len(self.tree):
+            return ()
+        return self.tree.leaf(block_number)[3]
+
+    def event_at(self, block_number, column):
+        # Index of the tag whose name or '/>' spans column, or None
+        for i, event in enumerate(self.events(block_number)):
+            if event[2] <= column <= event[3]:
+                return i
+        return None
+
+    def depth_at(self, block_number, index):
+        # Nesting depth before event index of the block
+        depth = self.tree.depth_before(block_number)
+        for event in self.tree.leaf(block_number)[3][:index]:
+            depth += event[0]
+        return depth
+
+    def match(self, block_number, index):
+        # (block, event) of the tag that closes or opens the same element
+        self.flush()
+        events = self.tree.leaf(block_number)[3]
+        depth = self.depth_at(block_number, index)
+        if events[index][0] > 0:
+            return self.find_forward(block_number, index + 1, depth + 1, depth)
+        return self.find_backward(block_number, index, depth, depth - 1)
+
+    def enclosing(self, block_number, column):
+        # (block, event) of the open tag of the innermost element containing
+        # column, or None at the top level
+        self.flush()
+        if not 0 <= block_number < len(self.tree):
+            return None
+        events = self.tree.leaf(block_number)[3]
+        index = 0
+        while index < len(events) and events[index][2] < column:
+            index += 1
+        depth = self.depth_at(block_number, index)
+        return self.find_backward(block_number, index, depth, depth - 1)
+
+    def find_forward(self, block_number, index, depth, target):
+        # First event from (block, index) on after which depth <= target,
+        # depth being the depth before it
+        for i, event in enumerate(self.tree.leaf(block_number)[3][index:], index):
+            depth += event[0]
+            if depth <= target:
+                return block_number, i
+        found = self.tree.first_reaching(block_number + 1, target)
+        if found is None:
+            return None
+        block_number, depth = found
+        for i, event in enumerate(self.tree.leaf(block_number)[3]):
+            depth += event[0]
+            if depth <= target:
+                return block_number, i
+        return None
+
+    def find_backward(self, block_number, index, depth, target):
+        # Last event before (block, index) before which depth <= target,
+        # depth being the depth before (block, index)
+        events = self.tree.leaf(block_number)[3]
+        for i in range(index - 1, -1, -1):
+            depth -= events[i][0]
+            if depth <= target:
+                return block_number, i
+        found = self.tree.last_reaching(block_number, target)
+        if found is None:
+            return None
+        block_number, depth = found
+        events = self.tree.leaf(block_number)[3]
+        depths = []
+        for event in events:
+            depths.append(depth)
+            depth += event[0]
+        for i in range(len(events) - 1, -1, -1):
+            if depths[i] <= target:
+                return block_number, i
+        return None
+
+    def names_match(self, first, second):
+        name, other = first[1], second[1]
+        return name is None or other is None or name == other
+
+    def fold_end(self, block_number):
+        # Block of the close tag of the first element opening in block_number
+        # and closing at least two blocks further down, or None
+        self.flush()
+        if not 0 <= block_number < len(self.tree):
+            return None
+        # Elements closing on the same line are skipped without a lookup
+        unclosed = []
+        for i, event in enumerate(self.tree.leaf(block_number)[3]):
+            if event[0] > 0:
+                unclosed.append(i)
+            elif unclosed:
+                unclosed.pop()
+        for i in unclosed:
+            partner = self.match(block_number, i)
+            if partner is not None and partner[0] > block_number + 1:
+                return partner[0]
+        return None
+
+    def children(self, parent=None):
+        # Elements directly inside parent, an open tag's (block, event), or
+        # at the top level: [(block, event, label), ...]
+        self.flush()
+        if parent is None:
+            block_number, index, depth = 0, 0, 0
+        else:
+            block_number, index = parent
+            depth = self.depth_at(block_number, index) + 1
+            index += 1
+        children = []
+        while len(children) < MAX_CHILDREN:
+            # The next event: a child's open tag or the parent's close tag
+            found = self.find_forward(block_number, index, depth, depth + 1)
+            if found is None:
+                break
+            block_number, index = found
+            event = self.tree.leaf(block_number)[3][index]
+            if event[0] < 0:
+                if parent is not None:
+                    break
+                # A stray close tag at the top level
+                depth -= 1
+                index += 1
+                continue
+            children.append((block_number, index, event[4] or event[1]))
+            found = self.match(block_number, index)
+            if found is None:
+                break
+            block_number, index = found
+            index += 1
+        return children
+
+    def ancestors(self, block_number, column):
+        # Open tags of the elements containing column, outermost first
+        found = self.enclosing(block_number, column)
+        path = []
+        while found is not None:
+            path.append(found)
+            block_number, index = found
+            depth = self.depth_at(block_number, index)
+            found = self.find_backward(block_number, index, depth, depth - 1)
+        path.reverse()
+        return path
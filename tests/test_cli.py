@@ -0,0 +1,35 @@
+import cli
+
+
+def run(*args):
+    return cli.main([*args, '--jobs', '1'])
+
+
+def test_replace_matches_line_ends_in_crlf_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'page.html'
+    path.write_bytes(b'one\r\ntwo\r\n')
+    assert run('replace', r'(\w+)$', r'<\1>', 'page.html', '--regex') == 0
+    assert path.read_bytes() == b'<one>\r\n<two>\r\n'
+
+
+def test_replace_keeps_crlf_line_breaks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'page.html'
+    # . does not match the line break, as in the editor
+    path.write_bytes(b'a.b\r\nc\r\n')
+    assert run('replace', 'b.', 'Z', 'page.html', '--regex') == 0
+    assert path.read_bytes() == b'a.b\r\nc\r\n'
+    assert run('replace', 'a.', 'Z', 'page.html', '--regex') == 0
+    assert path.read_bytes() == b'Zb\r\nc\r\n'
+    path.write_bytes(b'<!-- x -->\r\n')
+    assert run('replace', '<!-- x -->', 'div', 'page.html', '--snippet') == 0
+    assert path.read_bytes() == b'<div>\r\n    \r\n</div>\r\n'
+
+
+def test_unmatched_pattern_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert run('check', 'nonexist.html') == 1
+    (tmp_path / 'page.html').write_text('<p></p>\n')
+    assert run('check', 'page.html') == 0
+    assert run('check', 'page.html', 'missing/*.html') == 1
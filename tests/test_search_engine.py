@@ -0,0 +1,103 @@
+import os
+import time
+from search_engine import SearchQuery, find_matches, replace_all
+
+TEXT = "xab abc ab cab"
+
+
+def search(query, previous=None):
+    # Like DocumentSearch.set_query: the previous query's matches are only
+    # filtered when the new query extends it
+    candidates = None
+    if previous is not None and query.extends(previous):
+        candidates = [start for start, _ in search(previous)]
+    pattern, haystack = query.compile_for(TEXT)
+    return list(find_matches(pattern, haystack, candidates=candidates))
+
+
+def test_longer_query_extends_shorter_one():
+    assert SearchQuery('abc').extends(SearchQuery('ab'))
+    assert search(SearchQuery('abc'), SearchQuery('ab')) == [(4, 7)]
+
+
+def test_whole_word_query_is_not_extended():
+    whole = SearchQuery('ab', whole_words=True)
+    assert not SearchQuery('ab').extends(whole)
+    assert not SearchQuery('abc').extends(whole)
+
+
+def test_turning_whole_words_off_searches_again():
+    whole = SearchQuery('ab', whole_words=True)
+    assert search(whole) == [(8, 10)]
+    assert len(search(SearchQuery('ab'), whole)) == 4
+    assert search(SearchQuery('abc'), whole) == [(4, 7)]
+
+
+def wait_for_search(app, search):
+    deadline = time.perf_counter() + 5
+    while (not search.complete or search.restart_timer.isActive()) and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_find_after_replace_selects_the_next_match():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    from editor import CodeEditor
+    app = QApplication.instance() or QApplication([])
+    editor = CodeEditor()
+    editor.setPlainText("foo x foo y foo z foo")
+    search = editor.search
+    try:
+        search.set_query(SearchQuery('foo'))
+        wait_for_search(app, search)
+        assert search.find_next()
+        assert search.replace_current('barbaz')
+        # Straight after the edit, before the search has restarted
+        assert search.find_next()
+        wait_for_search(app, search)
+        cursor = editor.textCursor()
+        assert cursor.selectedText() == 'foo'
+        assert (cursor.selectionStart(), cursor.selectionEnd()) == (9, 12)
+        assert search.status_text() == "1 of 3"
+    finally:
+        search.shutdown()
+        editor.background_highlighter.stop()
+
+
+def test_replace_only_replaces_a_selected_match():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtGui import QTextCursor
+    from PySide6.QtWidgets import QApplication
+    from editor import CodeEditor
+    app = QApplication.instance() or QApplication([])
+    editor = CodeEditor()
+    editor.setPlainText("foo x foo y foo z foo")
+    search = editor.search
+    try:
+        search.set_query(SearchQuery('foo'))
+        wait_for_search(app, search)
+        # Replace clicked three times in a row, as FindReplaceDialog does it
+        for _ in range(3):
+            search.replace_current('barbaz')
+            search.find_next()
+        wait_for_search(app, search)
+        assert editor.toPlainText() == "barbaz x foo y foo z foo"
+        # Text the query does not match is left alone
+        cursor = editor.textCursor()
+        cursor.setPosition(6)
+        cursor.setPosition(9, QTextCursor.KeepAnchor)
+        editor.setTextCursor(cursor)
+        assert not search.replace_current('barbaz')
+        assert editor.toPlainText() == "barbaz x foo y foo z foo"
+    finally:
+        search.shutdown()
+        editor.background_highlighter.stop()
+
+
+def test_replace_all_skips_empty_matches():
+    pattern = SearchQuery('^', regex=True).compile()
+    assert list(find_matches(pattern, TEXT)) == []
+    assert replace_all(pattern, TEXT, 'x', regex=True) == (0, 0, '', 0)
+    pattern = SearchQuery('a*', regex=True).compile()
+    assert replace_all(pattern, TEXT, '<\\g<0>>', regex=True)[3] == len(list(find_matches(pattern, TEXT)))
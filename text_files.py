@@ -0,0 +1,106 @@
+import codecs
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+# Reading, encoding detection and safe writing of text files, without Qt, so
+# the batch commands in cli.py can use them too
+
+SNIFF_SIZE = 64 * 1024
+FALLBACK_ENCODING = 'cp1252'
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_XML_DECLARATION = re.compile(rb'^<\?xml[^>]*encoding\s*=\s*["\']([\w.:-]+)["\']')
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def detect_encoding(head):
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    declared = _XML_DECLARATION.search(head) or _META_CHARSET.search(head)
+    if declared:
+        try:
+            return codecs.lookup(declared.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+
+    try:
+        # Not final: the sample may end in the middle of a multi-byte sequence
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+def is_ascii_compatible(encoding):
+    # The paged view finds lines by scanning raw bytes for b'\n'
+    return codecs.lookup(encoding).name not in ('utf-16', 'utf-32', 'utf-16-le', 'utf-16-be',
+                                                'utf-32-le', 'utf-32-be')
+
+
+def sniff_encoding(path):
+    with open(path, 'rb') as file:
+        return detect_encoding(file.read(SNIFF_SIZE))
+
+
+def decode_file(path, encoding=None, errors='strict'):
+    # (text, encoding) of the file at path; the encoding is detected like
+    # the editor does when it is not given. Line breaks are kept as they are.
+    with open(path, 'rb') as file:
+        data = file.read()
+    if encoding is None:
+        encoding = detect_encoding(data[:SNIFF_SIZE])
+    return codecs.decode(data, encoding, errors), encoding
+
+
+def atomic_write(path, text, encoding='utf-8'):
+    # Writes to a temporary file next to the target, fsyncs it and renames it
+    # over the target, so a crash mid-write never leaves a truncated file.
+    # Returns the SHA-1 of the bytes written.
+    return atomic_write_chunks(path, (text,), encoding)
+
+
+def atomic_write_chunks(path, chunks, encoding='utf-8'):
+    # atomic_write() of the text made of chunks, which are encoded and
+    # written as they come, so the whole text is never held at once
+    encoder = codecs.getincrementalencoder(encoding)()
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            for chunk in chunks:
+                data = encoder.encode(chunk)
+                digest.update(data)
+                file.write(data)
+            data = encoder.encode('', final=True)
+            digest.update(data)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    if hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return digest.hexdigest()
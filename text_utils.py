@@ -0,0 +1,34 @@
+# Compared chunks grow up to this size, so the cost stays linear in the
+# length of the common part with few Python-level steps
+MAX_CHUNK = 1 << 20
+
+
+def common_affixes(old, new):
+    # Lengths of the common prefix and suffix. Slices of growing size are
+    # compared at memcmp speed; the first differing chunk is then bisected.
+    limit = min(len(old), len(new))
+    prefix = _common_length(lambda a, b: old[a:b] == new[a:b], limit)
+    len_old, len_new = len(old), len(new)
+    suffix = _common_length(lambda a, b: old[len_old - b:len_old - a] == new[len_new - b:len_new - a],
+                            limit - prefix)
+    return prefix, suffix
+
+
+def _common_length(same, limit):
+    # same(a, b) compares characters a..b counted from the start of the
+    # common part; returns how many of the first limit are equal
+    pos, step = 0, 256
+    while pos < limit:
+        end = min(limit, pos + step)
+        if not same(pos, end):
+            low, high = pos, end - 1
+            while low < high:
+                mid = (low + high + 1) // 2
+                if same(pos, mid):
+                    low = mid
+                else:
+                    high = mid - 1
+            return low
+        pos = end
+        step = min(step * 2, MAX_CHUNK)
+    return limit
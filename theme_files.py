@@ -0,0 +1,33 @@
+import json
+import os
+from pygments.token import Token, string_to_tokentype
+
+THEMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'themes')
+DEFAULT_THEME = 'dark'
+
+
+def available_themes():
+    return sorted(name[:-5] for name in os.listdir(THEMES_DIR) if name.endswith('.json'))
+
+
+def read_theme(name):
+    # (name, version, {token type: style}, background) of the theme file
+    # read, where a style is a dict like {"color": "#569CD6", "bold": true}.
+    # The background is the editor's, which the stylesheets set; exports
+    # use it.
+    path = os.path.join(THEMES_DIR, f"{name}.json")
+    if not os.path.exists(path) and name != DEFAULT_THEME:
+        # Default to dark theme if unknown
+        return read_theme(DEFAULT_THEME)
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    styles = {string_to_tokentype(key): spec for key, spec in data['styles'].items()}
+    return name, data.get('version', 1), styles, data.get('background', '#FFFFFF')
+
+
+def style_for(styles, ttype):
+    # Token types without a style of their own resolve through their parent
+    # chain (Literal.String.Double -> Literal.String)
+    while ttype is not None and ttype not in styles:
+        ttype = ttype.parent
+    return styles[ttype] if ttype is not None else styles.get(Token.Text, {})
@@ -0,0 +1,61 @@
+from PySide6.QtGui import QTextCharFormat, QColor, QFont
+from pygments.token import Token
+from theme_files import read_theme
+from tokenizer import token_type
+
+_tables = {}
+
+
+class ThemeTable:
+    # A theme compiled to QTextCharFormats once. Token types without a style of
+    # their own resolve through their parent chain (Literal.String.Double ->
+    # Literal.String), and the result is memoised per token type and token id.
+
+    def __init__(self, name, version, styles):
+        self.name = name
+        self.version = version
+        self._formats = {}
+        for ttype, spec in styles.items():
+            self._formats[ttype] = self._format(spec)
+        self.default = self._formats.get(Token.Text, QTextCharFormat())
+        self._resolved = {}
+        self._by_id = []
+
+    @staticmethod
+    def _format(spec):
+        fmt = QTextCharFormat()
+        if 'color' in spec:
+            fmt.setForeground(QColor(spec['color']))
+        if 'background' in spec:
+            fmt.setBackground(QColor(spec['background']))
+        fmt.setFontWeight(QFont.Bold if spec.get('bold') else QFont.Normal)
+        fmt.setFontItalic(spec.get('italic', False))
+        fmt.setFontUnderline(spec.get('underline', False))
+        return fmt
+
+    def format_for(self, ttype):
+        fmt = self._resolved.get(ttype)
+        if fmt is None:
+            parent = ttype
+            while parent is not None and parent not in self._formats:
+                parent = parent.parent
+            fmt = self._formats[parent] if parent is not None else self.default
+            self._resolved[ttype] = fmt
+        return fmt
+
+    def format_for_id(self, token_id):
+        by_id = self._by_id
+        while token_id >= len(by_id):
+            by_id.append(self.format_for(token_type(len(by_id))))
+        return by_id[token_id]
+
+
+def load_theme(name):
+    table = _tables.get(name)
+    if table is None:
+        theme_name, version, styles, _ = read_theme(name)
+        if theme_name != name:
+            # Unknown themes share the default one's table
+            return load_theme(theme_name)
+        table = _tables[name] = ThemeTable(name, version, styles)
+    return table
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+import pygments
+from pygments.token import string_to_tokentype
+from PySide6.QtCore import QStandardPaths
+from text_files import atomic_write
+from file_watcher import line_edits
+from tokenizer import ROOT_STACK, TOKENIZER_VERSION
+
+# Cache files are evicted least recently used first beyond this total
+CACHE_LIMIT_MB = 512
+
+MAGIC = b'PCETOK01'
+# Magic, header length; the JSON header follows, then the arrays
+PREAMBLE = struct.Struct('<8sI')
+
+
+def arrays_offset(header_length):
+    # The arrays start at the first multiple of 8 after the header
+    return -(-(PREAMBLE.size + header_length) // 8) * 8
+
+
+def cache_directory():
+    return os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppLocalDataLocation), 'token_cache')
+
+
+def cache_version(language):
+    # Cached tokens are only valid for the same lexer; formats are not
+    # stored, so a theme change does not invalidate them
+    return f'{language}/{TOKENIZER_VERSION}/{pygments.__version__}/{sys.byteorder}'
+
+
+def text_hash(lines):
+    digest = hashlib.sha1()
+    for line in lines:
+        digest.update(line.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def line_crc(line):
+    return zlib.crc32(line.encode('utf-8', 'surrogatepass'))
+
+
+def cache_file(digest):
+    return os.path.join(cache_directory(), digest + '.tokens')
+
+
+def index_file():
+    # {document path: digest of its last cached text}
+    return os.path.join(cache_directory(), 'paths.json')
+
+
+def read_index():
+    try:
+        with open(index_file(), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def open_cache(lines, language, path=None):
+    # Returns (cache, mapping) for the document made of lines: the cache of
+    # exactly this text with mapping None, else the cache of the previous
+    # version of path with mapping giving for every line the cached line
+    # with the same text or -1, else (None, None)
+    digest = text_hash(lines)
+    cache = TokenCache.open(cache_file(digest), language)
+    if cache is not None:
+        return cache, None
+    if path is None:
+        return None, None
+    previous = read_index().get(os.path.abspath(path))
+    cache = TokenCache.open(cache_file(previous), language) if previous else None
+    if cache is None:
+        return None, None
+    mapping = array('i', range(len(lines)))
+    edits = line_edits(cache.line_crcs.tolist(), [line_crc(line) for line in lines])
+    # Lines between the edits are unchanged and shift by the lines the
+    # edits before them added or removed
+    shift = 0
+    position = 0
+    for first, old_count, new_lines in edits:
+        new_first = first + shift
+        for number in range(position, new_first):
+            mapping[number] = number - shift
+        for number in range(new_first, new_first + len(new_lines)):
+            mapping[number] = -1
+        shift += len(new_lines) - old_count
+        position = new_first + len(new_lines)
+    for number in range(position, len(lines)):
+        mapping[number] = number - shift
+    return cache, mapping
+
+
+class TokenCache:
+    # The tokens and end states of every line of one document, read from a
+    # memory-mapped cache file. Per token the file holds its start, length
+    # and type as flat arrays, so a line's tokens are rebuilt from its text
+    # without lexing. The map is closed once the cache is no longer
+    # referenced, by the worker or by the highlighter.
+
+    def __init__(self, file, header, header_length, buffer):
+        self.file = file
+        self.map = buffer
+        self.types = [string_to_tokentype(name) for name in header['types']]
+        self.stacks = [tuple(stack) for stack in header['stacks']]
+        self.line_count = lines = header['lines']
+        tokens = header['tokens']
+        view = memoryview(buffer)
+        offset = arrays_offset(header_length)
+
+        def take(typecode, count):
+            nonlocal offset
+            size = array(typecode).itemsize * count
+            part = view[offset:offset + size].cast(typecode)
+            offset += size
+            return part
+
+        self.line_tokens = take('I', lines + 1)
+        self.line_crcs = take('I', lines)
+        self.end_stacks = take('I', lines)
+        self.starts = take('I', tokens)
+        self.lengths = take('I', tokens)
+        self.token_types = take('H', tokens)
+
+    @classmethod
+    def open(cls, path, language):
+        # None if there is no valid cache at path for language
+        try:
+            file = open(path, 'rb')
+        except OSError:
+            return None
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, length = PREAMBLE.unpack_from(buffer)
+            header = json.loads(bytes(buffer[PREAMBLE.size:PREAMBLE.size + length]))
+            if magic != MAGIC or header.get('version') != cache_version(language):
+                raise ValueError
+            cache = cls(file, header, length, buffer)
+        except (OSError, ValueError, struct.error):
+            file.close()
+            return None
+        # Recently used files are the last to be evicted
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return cache
+
+    def start_stack(self, number):
+        return self.stacks[self.end_stacks[number - 1]] if number else ROOT_STACK
+
+    def matches(self, number, text):
+        return number < self.line_count and self.line_crcs[number] == line_crc(text)
+
+    def result(self, number, text):
+        # (tokens, end stack) of line number, whose text is text
+        starts, lengths, types, token_types = self.starts, self.lengths, self.types, self.token_types
+        tokens = []
+        for index in range(self.line_tokens[number], self.line_tokens[number + 1]):
+            start = starts[index]
+            tokens.append((start, types[token_types[index]], text[start:start + lengths[index]]))
+        return tokens, self.stacks[self.end_stacks[number]]
+
+
+class TokenCacheWriter:
+    # Collects the tokens of a document as it is lexed from the first line
+    # and writes them as a cache file
+
+    def __init__(self, language):
+        self.language = language
+        self.type_ids = {}
+        self.stack_ids = {}
+        self.line_tokens = array('I', [0])
+        self.line_crcs = array('I')
+        self.end_stacks = array('I')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.token_types = array('H')
+
+    def add(self, text, tokens, end_stack):
+        type_ids = self.type_ids
+        starts, lengths, token_types = self.starts, self.lengths, self.token_types
+        for start, ttype, content in tokens:
+            type_id = type_ids.get(ttype)
+            if type_id is None:
+                type_id = type_ids[ttype] = len(type_ids)
+            starts.append(start)
+            lengths.append(len(content))
+            token_types.append(type_id)
+        self.line_tokens.append(len(starts))
+        self.line_crcs.append(line_crc(text))
+        stack_id = self.stack_ids.get(end_stack)
+        if stack_id is None:
+            stack_id = self.stack_ids[end_stack] = len(self.stack_ids)
+        self.end_stacks.append(stack_id)
+
+    def finish(self, lines, path=None):
+        # Writes the cache of the document made of lines, remembered as the
+        # latest one of path, and evicts old caches
+        digest = text_hash(lines)
+        arrays = (self.line_tokens, self.line_crcs, self.end_stacks, self.starts, self.lengths, self.token_types)
+        header = {
+            'version': cache_version(self.language),
+            'lines': len(self.line_crcs),
+            'tokens': len(self.starts),
+            'types': [str(ttype) for ttype in self.type_ids],
+            'stacks': [list(stack) for stack in self.stack_ids],
+        }
+        encoded = json.dumps(header).encode('utf-8')
+        offset = arrays_offset(len(encoded))
+        directory = cache_directory()
+        os.makedirs(directory, exist_ok=True)
+        target = cache_file(digest)
+        temporary = f'{target}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(PREAMBLE.pack(MAGIC, len(encoded)))
+            file.write(encoded)
+            file.write(b'\0' * (offset - PREAMBLE.size - len(encoded)))
+            for part in arrays:
+                part.tofile(file)
+        os.replace(temporary, target)
+        if path is not None:
+            index = read_index()
+            index[os.path.abspath(path)] = digest
+            atomic_write(index_file(), json.dumps(index))
+        evict(directory)
+
+
+def evict(directory, limit=CACHE_LIMIT_MB * 1024 * 1024):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.tokens'):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
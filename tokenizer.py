@@ -0,0 +1,132 @@
+import re
+from pygments.token import Token, _TokenType
+
+ROOT_STACK = ('root',)
+# Changes whenever the tokens produced for the same text change, e.g. with
+# the line lexers; cached tokens of other versions are not used
+TOKENIZER_VERSION = 1
+
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+
+class Tokenizer:
+    # Lexes a document one line at a time. Each call takes the lexer stack the
+    # previous line ended in and returns the stack this line ends in, so callers
+    # can store it per block and resume anywhere.
+
+    def __init__(self, language='html'):
+        self.language = language
+        # Created on the first line with text, so an editor opens without
+        # waiting for Pygments to load
+        self.lexer = None
+        self.resumable = True
+
+    def load_lexer(self):
+        from line_lexers import create_lexer
+        self.lexer, self.resumable = create_lexer(self.language)
+
+    def tokenize(self, text, stack=ROOT_STACK):
+        if not text:
+            return [], stack
+        if self.lexer is None:
+            self.load_lexer()
+        if not self.resumable:
+            return list(self.lexer.get_tokens_unprocessed(text)), ROOT_STACK
+
+        lexer = self.lexer
+        tokendefs = lexer._tokens
+        statestack = list(stack)
+        statetokens = tokendefs[statestack[-1]]
+        tokens = []
+        append = tokens.append
+        pos = 0
+        end = len(text)
+        while pos < end:
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(text, pos)
+                if m:
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            append((pos, action, m.group()))
+                        else:
+                            tokens.extend(action(lexer, m))
+                    if m.end() == pos and new_state is None:
+                        continue
+                    pos = m.end()
+                    if new_state is not None:
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == '#pop':
+                                    if len(statestack) > 1:
+                                        statestack.pop()
+                                elif state == '#push':
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(state)
+                        elif isinstance(new_state, int):
+                            if abs(new_state) >= len(statestack):
+                                del statestack[1:]
+                            else:
+                                del statestack[new_state:]
+                        elif new_state == '#push':
+                            statestack.append(statestack[-1])
+                        statetokens = tokendefs[statestack[-1]]
+                    break
+            else:
+                append((pos, Token.Error, text[pos]))
+                pos += 1
+        return tokens, tuple(statestack)
+
+
+class StateTable:
+    # QTextBlock states are plain ints; this interns lexer stacks so they can be
+    # compared cheaply and QSyntaxHighlighter stops re-highlighting as soon as a
+    # block ends in the same state as before.
+
+    def __init__(self):
+        self._ids = {ROOT_STACK: 0}
+        self._stacks = [ROOT_STACK]
+
+    def id_for(self, stack):
+        state_id = self._ids.get(stack)
+        if state_id is None:
+            state_id = self._ids[stack] = len(self._stacks)
+            self._stacks.append(stack)
+        return state_id
+
+    def stack_for(self, state_id):
+        if 0 <= state_id < len(self._stacks):
+            return self._stacks[state_id]
+        return ROOT_STACK
+
+
+# Token types interned as small ints, so token spans can be stored as flat
+# integer arrays instead of tuples of Python objects.
+_TOKEN_IDS = {Token.Text: 0}
+_TOKEN_TYPES = [Token.Text]
+
+
+def token_id(ttype):
+    tid = _TOKEN_IDS.get(ttype)
+    if tid is None:
+        tid = _TOKEN_IDS[ttype] = len(_TOKEN_TYPES)
+        _TOKEN_TYPES.append(ttype)
+    return tid
+
+
+def token_type(tid):
+    return _TOKEN_TYPES[tid]
+
+
+def utf16_offsets(text):
+    # Qt indexes text in UTF-16 code units, Python in code points. Returns None
+    # when the two agree, otherwise a list mapping code point index -> Qt index.
+    if text.isascii() or not _ASTRAL.search(text):
+        return None
+    offsets = []
+    qt_pos = 0
+    for ch in text:
+        offsets.append(qt_pos)
+        qt_pos += 2 if ord(ch) > 0xFFFF else 1
+    offsets.append(qt_pos)
+    return offsets
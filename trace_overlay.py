@@ -0,0 +1,54 @@
+from PySide6.QtWidgets import QLabel
+from PySide6.QtCore import Qt, QTimer, QEvent
+from PySide6.QtGui import QFontDatabase
+import tracing
+
+REFRESH_MS = 500
+MARGIN = 8
+
+
+class TraceOverlay(QLabel):
+    # Rolling p50/p99 of every traced subsystem, drawn over the top right
+    # corner of the main window's central widget. Clicks go through it.
+    def __init__(self, window):
+        super().__init__(window)
+        self.main_window = window
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: #e0e0e0; padding: 6px;")
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        window.installEventFilter(self)
+        self.hide()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Resize and self.isVisible():
+            self.place()
+        return False
+
+    def refresh(self):
+        recorder = tracing.recorder()
+        stats = recorder.stats() if recorder is not None else {}
+        lines = [f"{'':<18}{'spans':>6}{'p50 ms':>9}{'p99 ms':>9}"]
+        for subsystem, (count, p50, p99) in sorted(stats.items()):
+            lines.append(f"{subsystem:<18}{count:>6}{p50:>9.2f}{p99:>9.2f}")
+        if not stats:
+            lines.append("Nothing traced yet")
+        self.setText('\n'.join(lines))
+        self.place()
+
+    def place(self):
+        self.adjustSize()
+        area = self.main_window.centralWidget().geometry()
+        self.move(area.right() - self.width() - MARGIN, area.top() + MARGIN)
+        self.raise_()
@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from PySide6.QtCore import QObject, QTimer
+
+# Spans kept for export; the oldest are dropped first
+RING_SIZE = 200000
+# Recent spans per subsystem the overlay's percentiles are taken over
+STATS_WINDOW = 500
+# The event loop is checked this often; a check arriving more than
+# STALL_THRESHOLD_MS late is recorded as a stall
+STALL_CHECK_MS = 10
+STALL_THRESHOLD_MS = 50
+
+# Set while recording. A traced function checks nothing else, so with
+# tracing off the cost is one call and one global lookup.
+recording = False
+_recorder = None
+
+
+def traced(subsystem):
+    # Records every call of the decorated function as a span of subsystem
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not recording:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _recorder.add(subsystem, start, time.perf_counter_ns() - start)
+        return wrapper
+    return decorate
+
+
+def recorder():
+    # The current recorder, or the last one after stop(); None if never started
+    return _recorder
+
+
+def start():
+    global recording, _recorder
+    if recording:
+        return
+    if _recorder is None:
+        _recorder = TraceRecorder()
+    _recorder.stall_monitor.start()
+    recording = True
+
+
+def stop():
+    global recording
+    if not recording:
+        return
+    recording = False
+    _recorder.stall_monitor.stop()
+
+
+class TraceRecorder:
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        # (subsystem, start ns, duration ns, thread id)
+        self.spans = deque(maxlen=RING_SIZE)
+        self.recent = {}
+        self.stall_monitor = StallMonitor(self)
+
+    def add(self, subsystem, start, duration):
+        self.spans.append((subsystem, start, duration, threading.get_ident()))
+        recent = self.recent.get(subsystem)
+        if recent is None:
+            recent = self.recent[subsystem] = deque(maxlen=STATS_WINDOW)
+        recent.append(duration)
+
+    def clear(self):
+        self.spans.clear()
+        self.recent.clear()
+
+    def stats(self):
+        # {subsystem: (spans, p50 ms, p99 ms)} over the recent spans
+        stats = {}
+        for subsystem, recent in list(self.recent.items()):
+            durations = sorted(recent)
+            if durations:
+                stats[subsystem] = (len(durations), durations[len(durations) // 2] / 1e6,
+                                    durations[min(len(durations) - 1, len(durations) * 99 // 100)] / 1e6)
+        return stats
+
+    def chrome_trace(self):
+        # Trace Event Format, as read by chrome://tracing and Perfetto
+        pid = os.getpid()
+        main_thread = threading.main_thread().ident
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': main_thread,
+                   'args': {'name': 'GUI thread'}}]
+        for subsystem, start, duration, thread in list(self.spans):
+            events.append({
+                'name': subsystem,
+                'cat': 'stall' if subsystem == 'event loop stall' else 'editor',
+                'ph': 'X',
+                'ts': (start - self.origin) / 1000,
+                'dur': duration / 1000,
+                'pid': pid,
+                'tid': thread,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+
+class StallMonitor(QObject):
+    # A timer that should fire every STALL_CHECK_MS; when it fires late,
+    # whatever ran on the GUI thread in between blocked the event loop
+    def __init__(self, recorder, parent=None):
+        super().__init__(parent)
+        self.recorder = recorder
+        self.timer = QTimer(self)
+        self.timer.setInterval(STALL_CHECK_MS)
+        self.timer.timeout.connect(self.check)
+        self.last = None
+
+    def start(self):
+        self.last = time.perf_counter_ns()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def check(self):
+        now = time.perf_counter_ns()
+        expected = self.last + STALL_CHECK_MS * 1000000
+        if now - expected > STALL_THRESHOLD_MS * 1000000:
+            self.recorder.add('event loop stall', expected, now - expected)
+        self.last = now
@@ -0,0 +1,289 @@
+import itertools
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Signal
+from PySide6.QtGui import QColor, QTextCharFormat, QTextCursor
+from PySide6.QtWidgets import QTextEdit
+from autosave import DirtyRange
+from document_search import document_snapshot
+from search_engine import qt_position
+
+# Idle time after an edit before the document is validated again
+VALIDATE_DELAY_MS = 400
+# Edits touching more lines than this send the whole text instead
+RESET_LINES = 5000
+# Larger documents are not validated
+MAX_VALIDATED_CHARS = 8 * 1024 * 1024
+
+ERROR_COLOR = QColor(230, 40, 40)
+WARNING_COLOR = QColor(230, 150, 0)
+
+VALIDATOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'validator.py')
+
+_service = None
+
+
+def validation_service():
+    # One validator process serves every document; it is started on first use
+    global _service
+    if _service is None:
+        _service = ValidationService()
+    return _service
+
+
+def severity_color(severity):
+    return ERROR_COLOR if severity == 'error' else WARNING_COLOR
+
+
+class ValidationService(QObject):
+    # Runs validator.py in a separate process at low priority, so checking
+    # the document never competes with the GUI thread for the interpreter.
+    # Each document sends its whole text once and then only the lines that
+    # changed; answers are passed back to the DocumentValidation they belong
+    # to. The pipes are written and read on daemon threads, since writing
+    # blocks while the validator is busy and the pipe is full, and reading
+    # blocks until it answers.
+    # document, generation, diagnostics
+    diagnostics_ready = Signal(int, int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.ids = itertools.count(1)
+        self.documents = {}
+        self.stopped = False
+        try:
+            self.process = subprocess.Popen([sys.executable, VALIDATOR_SCRIPT],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError:
+            self.process = None
+            self.stopped = True
+            return
+        self.requests = queue.Queue()
+        self.diagnostics_ready.connect(self.dispatch)
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.writer.start()
+        self.reader.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def register(self, validation):
+        document = next(self.ids)
+        self.documents[document] = validation
+        return document
+
+    def submit(self, request):
+        if not self.stopped:
+            self.requests.put(request)
+
+    def write(self):
+        pipe = self.process.stdin
+        while True:
+            request = self.requests.get()
+            try:
+                pickle.dump(request, pipe)
+                pipe.flush()
+            except (OSError, ValueError):
+                return
+            if request is None:
+                pipe.close()
+                return
+
+    def read(self):
+        while True:
+            try:
+                document, generation, diagnostics = pickle.load(self.process.stdout)
+            except (EOFError, OSError, ValueError, pickle.UnpicklingError):
+                return
+            self.diagnostics_ready.emit(document, generation, diagnostics)
+
+    def close(self, document):
+        if self.documents.pop(document, None) is not None:
+            self.submit(('close', document))
+
+    def dispatch(self, document, generation, diagnostics):
+        validation = self.documents.get(document)
+        if validation is not None:
+            validation.handle_diagnostics(generation, diagnostics)
+
+    def shutdown(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.requests.put(None)
+        self.writer.join()
+        self.reader.join()
+        self.process.wait()
+
+
+class DocumentValidation(QObject):
+    # Keeps the validator's copy of an editor's document up to date and shows
+    # its diagnostics: a wavy underline on the visible lines and a marker in
+    # the gutter. Edits are collected as a range of changed lines and sent
+    # once typing pauses. Diagnostics computed for an older version of the
+    # text are dropped, and the ones on lines an edit touched are cleared at
+    # once.
+    changed = Signal()
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.enabled = True
+        self.document_id = None
+        # Bumped by every edit; an answer is only shown for the current one
+        self.generation = 0
+        # None until the validator has the text, then the lines changed since
+        self.dirty = None
+        # {block number: [(start, end, severity, message)]} in Python offsets
+        self.diagnostics = {}
+        self.block_count = editor.document().blockCount()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(VALIDATE_DELAY_MS)
+        self.timer.timeout.connect(self.flush)
+
+        self.highlight_timer = QTimer(self)
+        self.highlight_timer.setSingleShot(True)
+        self.highlight_timer.setInterval(0)
+        self.highlight_timer.timeout.connect(self.update_highlights)
+
+        editor.verticalScrollBar().valueChanged.connect(self.highlight_timer.start)
+        editor.document().contentsChange.connect(self.handle_contents_change)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.timer.stop()
+            self.forget()
+            self.clear()
+        else:
+            self.timer.start()
+
+    def forget(self):
+        # The validator drops its copy; the next flush sends the whole text
+        if self.document_id is not None:
+            validation_service().close(self.document_id)
+            self.document_id = None
+        self.dirty = None
+
+    def shutdown(self):
+        self.timer.stop()
+        self.forget()
+
+    def clear(self):
+        if self.diagnostics:
+            self.diagnostics = {}
+            self.changed.emit()
+        self.update_highlights()
+
+    def handle_contents_change(self, position, removed, added):
+        if self.editor.is_refreshing_formats():
+            return
+        self.generation += 1
+        document = self.editor.document()
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if last < 0:
+            last = document.blockCount() - 1
+        delta = document.blockCount() - self.block_count
+        self.block_count = document.blockCount()
+        if self.dirty is not None:
+            self.dirty.mark(first, self.block_count - 1 - last)
+        if self.diagnostics:
+            self.shift_diagnostics(first, last - delta, delta)
+        if self.enabled:
+            self.timer.start()
+
+    def shift_diagnostics(self, first, old_last, delta):
+        # Diagnostics of the edited blocks are stale; those below move with
+        # the lines they are on
+        shifted = {}
+        for number, diagnostics in self.diagnostics.items():
+            if number < first:
+                shifted[number] = diagnostics
+            elif number > old_last:
+                shifted[number + delta] = diagnostics
+        self.diagnostics = shifted
+        self.changed.emit()
+        self.highlight_timer.start()
+
+    def flush(self):
+        if not self.enabled:
+            return
+        document = self.editor.document()
+        if document.characterCount() > MAX_VALIDATED_CHARS:
+            self.forget()
+            self.clear()
+            return
+        service = validation_service()
+        if self.document_id is None:
+            self.document_id = service.register(self)
+        block_count = document.blockCount()
+        dirty = self.dirty
+        if dirty is None or dirty.first is not None and block_count - dirty.tail - dirty.first > RESET_LINES:
+            service.submit(('reset', self.document_id, self.generation, document_snapshot(document)))
+        elif dirty.first is not None:
+            end = block_count - dirty.tail
+            lines = []
+            block = document.findBlockByNumber(dirty.first)
+            while block.isValid() and block.blockNumber() < end:
+                lines.append(block.text())
+                block = block.next()
+            old_count = dirty.base_count - dirty.first - dirty.tail
+            service.submit(('edit', self.document_id, self.generation, dirty.first, old_count, lines))
+        self.dirty = DirtyRange(block_count)
+
+    def handle_diagnostics(self, generation, diagnostics):
+        if generation != self.generation or not self.enabled:
+            return
+        self.diagnostics = {}
+        for line, start, end, severity, message in diagnostics:
+            self.diagnostics.setdefault(line, []).append((start, end, severity, message))
+        self.changed.emit()
+        self.update_highlights()
+
+    def severity(self, block_number):
+        # 'error', 'warning' or None for the gutter marker
+        diagnostics = self.diagnostics.get(block_number)
+        if not diagnostics:
+            return None
+        return 'error' if any(d[2] == 'error' for d in diagnostics) else 'warning'
+
+    def message_at(self, block, position):
+        # Messages of the diagnostics covering the Qt position in block
+        text = block.text()
+        messages = []
+        for start, end, severity, message in self.diagnostics.get(block.blockNumber(), ()):
+            if qt_position(text, start) <= position <= qt_position(text, max(end, start + 1)):
+                messages.append(message)
+        return '\n'.join(messages)
+
+    def update_highlights(self):
+        selections = []
+        if self.diagnostics:
+            document = self.editor.document()
+            first, last = self.editor.visible_block_range()
+            for number in range(first, last + 1):
+                diagnostics = self.diagnostics.get(number)
+                if not diagnostics:
+                    continue
+                block = document.findBlockByNumber(number)
+                text = block.text()
+                for start, end, severity, message in diagnostics:
+                    start = qt_position(text, min(start, len(text)))
+                    end = qt_position(text, min(end, len(text)))
+                    if end <= start:
+                        # At the end of the line; mark the last character
+                        start, end = max(start - 1, 0), max(start, 1)
+                    selection = QTextEdit.ExtraSelection()
+                    selection.format.setUnderlineStyle(QTextCharFormat.WaveUnderline)
+                    selection.format.setUnderlineColor(severity_color(severity))
+                    selection.cursor = QTextCursor(document)
+                    selection.cursor.setPosition(block.position() + start)
+                    selection.cursor.setPosition(block.position() + end, QTextCursor.KeepAnchor)
+                    selections.append(selection)
+        self.editor.set_extra_selections('diagnostics', selections)
@@ -0,0 +1,454 @@
+import os
+import pickle
+import queue
+import re
+import sys
+import threading
+
+# Diagnostics reported for one document at most
+MAX_DIAGNOSTICS = 5000
+
+# HTML elements that never have content or a closing tag
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr',
+}
+# HTML elements whose content is not markup
+RAW_TEXT_ELEMENTS = {'script', 'style'}
+# HTML elements whose closing tag may be left out
+OPTIONAL_END_ELEMENTS = {
+    'p', 'li', 'dt', 'dd', 'tr', 'td', 'th', 'option', 'optgroup', 'thead', 'tbody',
+    'tfoot', 'colgroup', 'caption', 'rb', 'rt', 'rtc', 'rp', 'head', 'body', 'html',
+}
+_P_CLOSERS = {
+    'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hgroup', 'hr', 'main', 'menu', 'nav', 'ol', 'p', 'pre', 'section',
+    'table', 'ul',
+}
+# Opening one of these tags ends an open element whose closing tag is optional
+IMPLIED_END = {
+    'p': _P_CLOSERS,
+    'li': {'li'},
+    'dt': {'dt', 'dd'},
+    'dd': {'dt', 'dd'},
+    'option': {'option', 'optgroup'},
+    'optgroup': {'optgroup'},
+    'tr': {'tr', 'tbody', 'tfoot', 'thead'},
+    'td': {'td', 'th', 'tr', 'tbody', 'tfoot'},
+    'th': {'td', 'th', 'tr', 'tbody', 'tfoot'},
+    'thead': {'tbody', 'tfoot'},
+    'tbody': {'tbody', 'tfoot'},
+    'colgroup': {'colgroup', 'thead', 'tbody', 'tfoot', 'tr'},
+    'caption': {'colgroup', 'thead', 'tbody', 'tfoot', 'tr'},
+    'rb': {'rb', 'rt', 'rtc', 'rp'},
+    'rt': {'rb', 'rt', 'rtc', 'rp'},
+    'rtc': {'rb', 'rtc', 'rp'},
+    'rp': {'rb', 'rt', 'rtc', 'rp'},
+    'head': {'body'},
+}
+
+TAG_NAME = re.compile(r'[A-Za-z_:][-\w.:]*')
+ATTRIBUTE_NAME = re.compile(r'[^\s"\'<>/=]+')
+UNQUOTED_VALUE = re.compile(r'[^\s>]+')
+SPACE = re.compile(r'\s*')
+ENTITY = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z_:][-\w.:]*);')
+HTML_MARKUP = re.compile(r'<')
+XML_MARKUP = re.compile(r'[<&]')
+# What ends each construct that can span lines
+TERMINATORS = {'comment': '-->', 'cdata': ']]>', 'pi': '?>', 'decl': '>'}
+UNTERMINATED = {
+    'comment': "Comment is not closed with -->",
+    'cdata': "CDATA section is not closed with ]]>",
+    'pi': "Processing instruction is not closed with ?>",
+    'decl': "Declaration is not closed with >",
+}
+_raw_text_ends = {}
+
+
+def raw_text_end(name):
+    pattern = _raw_text_ends.get(name)
+    if pattern is None:
+        pattern = _raw_text_ends[name] = re.compile('</' + re.escape(name) + r'(?![-\w.:])', re.IGNORECASE)
+    return pattern
+
+
+def is_xml(first_line):
+    return first_line.lstrip('\ufeff').startswith('<?xml')
+
+
+def scan_line(text, state, xml):
+    # Checks one line, starting inside whatever construct the previous line
+    # ended in (state). Returns the line's diagnostics as (start, end,
+    # severity, message), its tag events as (kind, name, start, end), the ids
+    # it defines as (id, start, end), and the state it ends in. States are
+    # plain tuples and strings so a changed line can be rescanned until a
+    # following line starts in the state it started in before.
+    diagnostics = []
+    events = []
+    ids = []
+    markup = XML_MARKUP if xml else HTML_MARKUP
+    length = len(text)
+    position = 0
+    # Whether the next attribute is separated from what came before
+    spaced = True
+
+    while position < length:
+        if state == 'text':
+            match = markup.search(text, position)
+            if match is None:
+                break
+            position = match.start()
+            if text[position] == '&':
+                entity = ENTITY.match(text, position)
+                if entity is None:
+                    diagnostics.append((position, position + 1, 'error', "Unescaped '&'; write &amp;"))
+                    position += 1
+                else:
+                    position = entity.end()
+            elif text.startswith('<!--', position):
+                state = 'comment'
+                position += 4
+            elif text.startswith('<![CDATA[', position):
+                state = 'cdata'
+                position += 9
+            elif text.startswith('<!', position):
+                state = 'decl'
+                position += 2
+            elif text.startswith('<?', position):
+                state = 'pi'
+                position += 2
+            elif text.startswith('</', position):
+                name = TAG_NAME.match(text, position + 2)
+                if name is None:
+                    diagnostics.append((position, position + 2, 'error', "Closing tag has no name"))
+                    position += 2
+                else:
+                    events.append(('close', name.group(), name.start(), name.end()))
+                    state = ('close', name.group())
+                    position = name.end()
+            else:
+                name = TAG_NAME.match(text, position + 1)
+                if name is None:
+                    if xml:
+                        diagnostics.append((position, position + 1, 'error', "Unescaped '<'; write &lt;"))
+                    else:
+                        diagnostics.append((position, position + 1, 'warning', "Unescaped '<'; write &lt;"))
+                    position += 1
+                else:
+                    events.append(('open', name.group(), name.start(), name.end()))
+                    state = ('tag', name.group(), frozenset(), None)
+                    position = name.end()
+                    spaced = False
+
+        elif state in TERMINATORS:
+            end = text.find(TERMINATORS[state], position)
+            if end < 0:
+                break
+            position = end + len(TERMINATORS[state])
+            state = 'text'
+
+        elif state[0] == 'raw':
+            match = raw_text_end(state[1]).search(text, position)
+            if match is None:
+                break
+            # The closing tag itself is read as text
+            position = match.start()
+            state = 'text'
+
+        elif state[0] == 'close':
+            position = SPACE.match(text, position).end()
+            if position == length:
+                break
+            end = text.find('>', position)
+            if end != position:
+                stop = length if end < 0 else end
+                diagnostics.append((position, stop, 'error', f"Unexpected text in closing tag </{state[1]}>"))
+                if end < 0:
+                    break
+            position = end + 1
+            state = 'text'
+
+        elif state[0] == 'value':
+            _, quote, name, attributes, attribute = state
+            end = text.find(quote, position)
+            if end < 0:
+                break
+            position = end + 1
+            state = ('tag', name, attributes, None)
+            spaced = False
+
+        else:
+            _, name, attributes, attribute = state
+            space = SPACE.match(text, position).end()
+            if space > position:
+                spaced = True
+                position = space
+                continue
+            char = text[position]
+            if attribute is not None:
+                # The value of attribute, after its '='
+                if char in '"\'':
+                    end = text.find(char, position + 1)
+                    if end < 0:
+                        state = ('value', char, name, attributes, attribute)
+                        break
+                    if attribute == 'id' or xml and attribute == 'xml:id':
+                        ids.append((text[position + 1:end], position + 1, end))
+                    position = end + 1
+                    spaced = False
+                    state = ('tag', name, attributes, None)
+                    continue
+                if char == '>' or text.startswith('/>', position):
+                    diagnostics.append((position - 1, position, 'error', f"Attribute '{attribute}' has no value after '='"))
+                    state = ('tag', name, attributes, None)
+                    continue
+                value = UNQUOTED_VALUE.match(text, position)
+                end = value.end()
+                if xml:
+                    diagnostics.append((position, end, 'error', "Attribute values must be quoted in XML"))
+                elif any(c in value.group() for c in '"\'<=`'):
+                    diagnostics.append((position, end, 'error', "Unquoted attribute value contains \" ' < = or `"))
+                elif attribute == 'id':
+                    ids.append((value.group(), position, end))
+                position = end
+                spaced = False
+                state = ('tag', name, attributes, None)
+            elif char == '>':
+                position += 1
+                if not xml and name.lower() in RAW_TEXT_ELEMENTS:
+                    state = ('raw', name.lower())
+                else:
+                    state = 'text'
+            elif text.startswith('/>', position):
+                events.append(('self_close', name, position, position + 2))
+                position += 2
+                state = 'text'
+            elif char == '<':
+                # Most likely a tag still being typed; the '<' starts the next one
+                diagnostics.append((position, position + 1, 'error', f"Tag <{name}> is not closed before '<'"))
+                state = 'text'
+            elif char in '"\'':
+                end = text.find(char, position + 1)
+                stop = length if end < 0 else end + 1
+                diagnostics.append((position, stop, 'error', "Quoted text is not an attribute value"))
+                position = stop
+            elif char in '/=':
+                diagnostics.append((position, position + 1, 'error', f"Unexpected '{char}' in tag"))
+                position += 1
+            else:
+                match = ATTRIBUTE_NAME.match(text, position)
+                attribute = match.group() if xml else match.group().lower()
+                if not spaced:
+                    diagnostics.append((position, match.end(), 'error', f"Missing space before attribute '{match.group()}'"))
+                if attribute in attributes:
+                    diagnostics.append((position, match.end(), 'error', f"Duplicate attribute '{match.group()}'"))
+                attributes = attributes | {attribute}
+                position = SPACE.match(text, match.end()).end()
+                if text.startswith('=', position):
+                    position += 1
+                    state = ('tag', name, attributes, attribute)
+                else:
+                    if xml and position < length:
+                        diagnostics.append((match.start(), match.end(), 'error', f"Attribute '{match.group()}' has no value"))
+                    state = ('tag', name, attributes, None)
+                    spaced = position > match.end()
+    return diagnostics, events, ids, state
+
+
+class DocumentModel:
+    # The lines of one document with what scan_line() found in each. An edit
+    # rescans the changed lines and then only as many following lines as
+    # start in a different state than before, so typing inside one tag
+    # rescans one line. The structure checks run over the kept events.
+
+    def __init__(self):
+        self.lines = ['']
+        # Per line: (start state, diagnostics, events, ids, end state)
+        self.infos = [None]
+        self.xml = False
+        self.scan(0)
+
+    def reset(self, text):
+        self.lines = text.split('\n')
+        self.infos = [None] * len(self.lines)
+        self.xml = is_xml(self.lines[0])
+        self.scan(0)
+
+    def edit(self, first, old_count, lines):
+        # Replaces old_count lines from first
+        self.lines[first:first + old_count] = lines
+        self.infos[first:first + old_count] = [None] * len(lines)
+        if not self.lines:
+            self.lines, self.infos = [''], [None]
+        if is_xml(self.lines[0]) != self.xml:
+            self.xml = not self.xml
+            self.infos = [None] * len(self.lines)
+            first = 0
+        self.scan(min(first, len(self.lines) - 1))
+
+    def scan(self, number):
+        state = self.infos[number - 1][4] if number else 'text'
+        lines, infos, xml = self.lines, self.infos, self.xml
+        while number < len(lines):
+            info = infos[number]
+            if info is not None and info[0] == state:
+                break
+            diagnostics, events, ids, end = scan_line(lines[number], state, xml)
+            infos[number] = (state, diagnostics, events, ids, end)
+            state = end
+            number += 1
+
+    def diagnostics(self):
+        # [(line, start, end, severity, message)], sorted
+        diagnostics = []
+        for number, info in enumerate(self.infos):
+            for start, end, severity, message in info[1]:
+                diagnostics.append((number, start, end, severity, message))
+                if len(diagnostics) >= MAX_DIAGNOSTICS:
+                    return diagnostics
+        self.check_end(diagnostics)
+        self.check_structure(diagnostics)
+        self.check_ids(diagnostics)
+        diagnostics.sort()
+        return diagnostics[:MAX_DIAGNOSTICS]
+
+    def check_end(self, diagnostics):
+        # A construct still open at the end is reported where it started
+        state = self.infos[-1][4]
+        # An unclosed raw text element is found by check_structure()
+        if state == 'text' or state[0] == 'raw':
+            return
+        number = len(self.infos) - 1
+        while number > 0 and self.infos[number][0] != 'text':
+            number -= 1
+        kind = state if isinstance(state, str) else state[0]
+        if kind in UNTERMINATED:
+            message = UNTERMINATED[kind]
+        elif kind == 'close':
+            message = f"Closing tag </{state[1]}> is not closed with >"
+        else:
+            message = f"Tag <{state[1]}> is not closed with >"
+        diagnostics.append((number, 0, len(self.lines[number]), 'error', message))
+
+    def check_structure(self, diagnostics):
+        xml = self.xml
+        # Open elements: (key, name, line, start, end)
+        stack = []
+        roots = 0
+        for number, info in enumerate(self.infos):
+            for kind, name, start, end in info[2]:
+                key = name if xml else name.lower()
+                if kind == 'open':
+                    if not xml:
+                        while stack and key in IMPLIED_END.get(stack[-1][0], ()):
+                            stack.pop()
+                        if key in VOID_ELEMENTS:
+                            continue
+                    elif not stack:
+                        roots += 1
+                        if roots == 2:
+                            diagnostics.append((number, start, end, 'error', "XML documents must have a single root element"))
+                    stack.append((key, name, number, start, end))
+                elif kind == 'self_close':
+                    if not stack or stack[-1][0] != key:
+                        # A void element
+                        continue
+                    if not xml:
+                        diagnostics.append((number, start, end, 'warning',
+                                            f"<{name}/> is not self-closing in HTML; add </{name}>"))
+                    stack.pop()
+                else:
+                    if not xml and key in VOID_ELEMENTS:
+                        diagnostics.append((number, start, end, 'warning', f"<{name}> has no closing tag"))
+                        continue
+                    index = len(stack) - 1
+                    while index >= 0 and stack[index][0] != key:
+                        index -= 1
+                    if index < 0:
+                        diagnostics.append((number, start, end, 'error', f"Closing tag </{name}> has no opening tag"))
+                        continue
+                    unclosed = [element for element in stack[index + 1:]
+                                if xml or element[0] not in OPTIONAL_END_ELEMENTS]
+                    if unclosed:
+                        innermost = unclosed[-1]
+                        diagnostics.append((number, start, end, 'error',
+                                            f"Expected </{innermost[1]}> (opened on line {innermost[2] + 1}) before </{name}>"))
+                        for element in unclosed:
+                            diagnostics.append((element[2], element[3], element[4], 'error', f"<{element[1]}> is not closed"))
+                    del stack[index:]
+        for element in stack:
+            if xml or element[0] not in OPTIONAL_END_ELEMENTS:
+                diagnostics.append((element[2], element[3], element[4], 'error', f"<{element[1]}> is not closed"))
+
+    def check_ids(self, diagnostics):
+        seen = {}
+        for number, info in enumerate(self.infos):
+            for value, start, end in info[3]:
+                if not value:
+                    diagnostics.append((number, start - 1, end + 1, 'warning', "Empty id"))
+                elif value in seen:
+                    diagnostics.append((number, start, end, 'error',
+                                        f"Duplicate id '{value}'; also on line {seen[value] + 1}"))
+                else:
+                    seen[value] = number
+
+
+def serve(input, output):
+    # Reads pickled requests from input until None or end of file:
+    #   ('reset', document, generation, text)
+    #   ('edit', document, generation, first, old_count, lines)
+    #   ('close', document)
+    # and writes (document, generation, diagnostics) for each document once
+    # no further requests are waiting, so edits that arrive in a burst are
+    # validated once and superseded requests are never answered.
+    requests = queue.Queue()
+
+    def read():
+        while True:
+            try:
+                request = pickle.load(input)
+            except (EOFError, OSError, pickle.UnpicklingError):
+                request = None
+            requests.put(request)
+            if request is None:
+                return
+
+    threading.Thread(target=read, daemon=True).start()
+    documents = {}
+    generations = {}
+    stale = set()
+    while True:
+        request = requests.get()
+        while True:
+            if request is None:
+                return
+            kind, document = request[0], request[1]
+            if kind == 'close':
+                documents.pop(document, None)
+                stale.discard(document)
+            else:
+                model = documents.get(document)
+                if model is None:
+                    model = documents[document] = DocumentModel()
+                if kind == 'reset':
+                    model.reset(request[3])
+                else:
+                    model.edit(*request[3:])
+                generations[document] = request[2]
+                stale.add(document)
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+        while stale and requests.empty():
+            document = stale.pop()
+            pickle.dump((document, generations[document], documents[document].diagnostics()), output)
+            output.flush()
+
+
+if __name__ == '__main__':
+    # Validation yields to the editor's own process
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    serve(sys.stdin.buffer, sys.stdout.buffer)